@@ -0,0 +1,19 @@
+import glob
+import json
+
+import odor_tracking_sim.analytics as analytics
+
+# Aggregate trap statistics over all result files of an ensemble run (see
+# run_ensemble.py). Files are processed in a process pool and merged as they
+# arrive so memory stays bounded however many runs there are.
+
+result_files = glob.iglob('ensemble_queue/results/*.npz')
+
+trajectory_analytics = analytics.TrajectoryAnalytics()
+trajectory_analytics.process(result_files)
+
+print('files: {0}'.format(trajectory_analytics.num_files))
+for group, summary in sorted(trajectory_analytics.summary().items()):
+    print(group)
+    print(json.dumps(summary, indent=2, sort_keys=True))
+
@@ -0,0 +1,81 @@
+import scipy
+
+import odor_tracking_sim.wind_models as wind_models
+import odor_tracking_sim.odor_models as odor_models
+import odor_tracking_sim.validation as validation
+import odor_tracking_sim.utility as utility
+
+# Compares trap statistics of float32 simulations (swarm, odor and wind models)
+# against the float64 reference using the statistical equivalence harness.
+
+number_sources = 6
+radius_sources = 1000.0
+strength_sources = 10.0
+location_list, strength_list = utility.create_circle_of_sources(
+        number_sources,
+        radius_sources,
+        strength_sources
+        )
+
+def create_fields(dtype):
+    wind_param = {
+            'speed': 0.5,
+            'angle': 25.0*scipy.pi/180.0,
+            'dtype': dtype,
+            }
+    wind_field = wind_models.ConstantWindField(param=wind_param)
+    odor_param = {
+            'wind_field'       : wind_field,
+            'diffusion_coeff'  :  0.25,
+            'source_locations' : location_list,
+            'source_strengths' : strength_list,
+            'epsilon'          : 0.01,
+            'trap_radius'      : 50.0,
+            'dtype'            : dtype,
+            }
+    odor_field = odor_models.FakeDiffusionOdorField(odor_param)
+    return wind_field, odor_field
+
+swarm_size = 2000
+
+def create_swarm_param():
+    swarm_param = {
+            'initial_heading'     : scipy.radians(scipy.random.uniform(0.0,360.0,(swarm_size,))),
+            'x_start_position'    : scipy.zeros((swarm_size,)),
+            'y_start_position'    : scipy.zeros((swarm_size,)),
+            'heading_error_std'   : scipy.radians(10.0),
+            'flight_speed'        : scipy.full((swarm_size,), 0.7),
+            'release_time'        : scipy.random.exponential(300,(swarm_size,)),
+            'cast_interval'       : [60.0, 1000.0],
+            'wind_slippage'       : 0.0,
+            'odor_thresholds'     : {
+                'lower': 0.002,
+                'upper': 0.004
+                },
+            'odor_probabilities'  : {
+                'lower': 0.9,    # detection probability/sec of exposure
+                'upper': 0.002,  # detection probability/sec of exposure
+                }
+            }
+    return swarm_param
+
+t_stop = 5000.0
+dt = 0.25
+
+wind_field_64, odor_field_64 = create_fields(scipy.float64)
+wind_field_32, odor_field_32 = create_fields(scipy.float32)
+
+reference = validation.SwarmBackend(create_swarm_param, wind_field_64, odor_field_64, t_stop, dt)
+candidate = validation.SwarmBackend(
+        create_swarm_param,
+        wind_field_32,
+        odor_field_32,
+        t_stop,
+        dt,
+        param={'dtype': scipy.float32}
+        )
+
+test = validation.EquivalenceTest(reference, candidate, {'seeds': range(20), 'num_traps': number_sources})
+test.run()
+print(test.report())
+
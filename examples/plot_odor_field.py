@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 import odor_tracking_sim.wind_models as wind_models
 import odor_tracking_sim.odor_models as odor_models
 import odor_tracking_sim.utility as utility
+import odor_tracking_sim.raster as raster
 
 
 # Source location and strength
@@ -34,6 +35,9 @@ odor_param = {
         }
 odor_field = odor_models.FakeDiffusionOdorField(odor_param)
 
+# Tiled raster - tiles are cached so replotting or zooming reuses them
+odor_raster = raster.TiledOdorRaster(odor_field)
+
 scale = 2.0
 plot_size= scale*radius_sources
 plot_param = { 
@@ -43,6 +47,18 @@ plot_param = {
         'ynum' : 500,
         'cmap' : 'binary',
         #'threshold': 0.001,
+        'raster': odor_raster,
         }
 odor_field.plot(plot_param=plot_param)
+
+# Zoom in on the neighborhood of the first trap
+x_trap, y_trap = location_list[0]
+zoom_size = 2.0*odor_param['trap_radius']
+zoom_param = dict(plot_param)
+zoom_param.update({
+        'xlim' : (x_trap - zoom_size, x_trap + zoom_size),
+        'ylim' : (y_trap - zoom_size, y_trap + zoom_size),
+        'fignums' : (3,4),
+        })
+odor_field.plot(plot_param=zoom_param)
 plt.show()
@@ -0,0 +1,30 @@
+import scipy
+
+import odor_tracking_sim.ensemble as ensemble
+
+# Queue a small wind speed sweep and run it with local worker processes. Workers
+# on other nodes which share the queue directory can join in with
+#
+#   python -m odor_tracking_sim.ensemble <queue_directory> --workers 8
+#
+queue_directory = 'ensemble_queue'
+num_workers = 4
+seed_list = range(10)
+
+spec_list = []
+for wind_speed in (0.25, 0.5, 1.0):
+    spec = {
+            'wind'  : {'speed': wind_speed, 'angle': scipy.radians(25.0)},
+            'swarm' : {'size': 5000},
+            'group' : 'wind_speed_{0}'.format(wind_speed),
+            }
+    spec_list.append(spec)
+
+queue = ensemble.TaskQueue(queue_directory)
+queue.add_tasks(spec_list, seed_list)
+ensemble.run_local_workers(queue_directory, num_workers)
+
+print(queue.counts())
+for task in queue.tasks(ensemble.TaskQueue.Status_Failed):
+    print('task {0} failed: {1}'.format(task['id'], task['error']))
+
@@ -7,9 +7,27 @@ import odor_tracking_sim.wind_models as wind_models
 import odor_tracking_sim.odor_models as odor_models
 import odor_tracking_sim.swarm_models as swarm_models
 import odor_tracking_sim.utility as utility
+import odor_tracking_sim.viewer as viewer
+import odor_tracking_sim.parallel as parallel
+import odor_tracking_sim.metrics as metrics
 
 output_file = 'swarm_data.pkl'
 
+# Live display: 'viewer' renders in a separate process and never blocks the
+# simulation, 'inline' updates the plot from the main loop.
+live_display = 'viewer'
+
+# Number of worker processes used to evaluate the odor and wind fields, 0 to
+# evaluate them in the main process.
+num_field_workers = 0
+
+# Progress and performance metrics, written every 10s (wall clock) as JSON lines
+metrics_param = {
+        'interval' : 10.0,
+        'format'   : 'jsonl',
+        'filename' : 'metrics.jsonl',
+        }
+
 # Create field, constant velocity, etc. 
 wind_param = {
         'speed': 0.5,
@@ -70,6 +88,20 @@ swarm_param = {
         } 
 swarm = swarm_models.BasicSwarmOfFlies(param=swarm_param)
 
+# Fields used to update the swarm
+if num_field_workers > 0:
+    evaluator = parallel.SharedFieldEvaluator(
+            swarm, 
+            wind_field, 
+            odor_field, 
+            param={'num_workers': num_field_workers}
+            )
+    update_wind_field = evaluator.wind_field
+    update_odor_field = evaluator.odor_field
+else:
+    update_wind_field = wind_field
+    update_odor_field = odor_field
+
 # Setup live plot
 fignum = 1
 plot_scale = 2.0
@@ -83,18 +115,30 @@ plot_param = {
         'fignums' : (1,2),
         #'threshold': 0.001,
         }
-odor_field.plot(plot_param=plot_param)
-#plt.show()
 
-plt.ion()
-fig = plt.figure(fignum)
-ax = plt.subplot(111)
-
-plt.figure(fignum)
-fly_dots, = plt.plot(swarm.x_position, swarm.y_position,'.r')
-
-fig.canvas.flush_events()
-plt.pause(0.0001)
+if live_display == 'viewer':
+    viewer_param = {
+            'xlim'             : plot_param['xlim'],
+            'ylim'             : plot_param['ylim'],
+            'dt_publish'       : 10.0,
+            'source_locations' : location_list,
+            'trap_radius'      : odor_param['trap_radius'],
+            }
+    live_viewer = viewer.LiveViewer(param=viewer_param)
+    live_viewer.start()
+else:
+    odor_field.plot(plot_param=plot_param)
+    #plt.show()
+
+    plt.ion()
+    fig = plt.figure(fignum)
+    ax = plt.subplot(111)
+
+    plt.figure(fignum)
+    fly_dots, = plt.plot(swarm.x_position, swarm.y_position,'.r')
+
+    fig.canvas.flush_events()
+    plt.pause(0.0001)
 
 # Experiment mail loop
 # ------------------------------------------------------------------------------------
@@ -107,14 +151,20 @@ t_plot_last = 0.0
 
 #raw_input('begin?')
 
+recorder = metrics.MetricsRecorder(param=metrics_param)
+recorder.attach(swarm)
+
 while t<t_stop:
 
-    print('t: {0:1.2f}'.format(t))
-    swarm.update(t,dt,wind_field,odor_field)
+    swarm.update(t,dt,update_wind_field,update_odor_field)
     t+= dt
+    recorder.update(t,swarm)
 
     # Update live display
-    if t_plot_last + dt_plot < t:
+    if live_display == 'viewer':
+        live_viewer.publish(t,swarm)
+
+    elif t_plot_last + dt_plot < t:
 
         plt.figure(fignum)
         fly_dots.set_xdata([swarm.x_position])
@@ -140,6 +190,13 @@ while t<t_stop:
 
         #time.sleep(0.05)
 
+if live_display == 'viewer':
+    live_viewer.stop()
+if num_field_workers > 0:
+    evaluator.close()
+sample = recorder.finish(t,swarm)
+recorder.close()
+print('t: {0:1.2f}, trapped: {1}/{2}'.format(t, sample['num_trapped'], swarm.size))
 
 # Write swarm to file
 with open(output_file, 'w') as f:
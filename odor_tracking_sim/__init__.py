@@ -2,6 +2,19 @@ import odor_models
 import wind_models
 import swarm_models
 import fly_models
+import viewer
+import raster
+import validation
+import scenario
+import ensemble
+import sensor_models
+import domain_models
+import release_models
+import event_log
+import parallel
+import metrics
+import service
+import analytics
 
 __version__ = '0.0.0'
 VERSION = __version__
@@ -0,0 +1,312 @@
+from __future__ import print_function
+import math
+import multiprocessing
+import scipy
+
+from .scenario import load_result
+
+
+class QuantileSketch(object):
+    """
+
+    Mergeable quantile sketch with relative accuracy (log spaced buckets, as in
+    DDSketch). Quantiles are returned with relative error <= relative_accuracy
+    and memory depends only on the range of the values, not on their number.
+    Values <= min_value are counted in a separate zero bucket.
+
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1.0e-3):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1.0 + relative_accuracy)/(1.0 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.offset = 0
+        self.counts = scipy.zeros((0,), dtype=int)
+        self.zero_count = 0
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.zero_count
+
+    def add(self, values):
+        values = scipy.asarray(values, dtype=float)
+        mask_zero = values <= self.min_value
+        self.zero_count += int(mask_zero.sum())
+        values = values[~mask_zero]
+        if values.shape[0] == 0:
+            return
+        index = scipy.ceil(scipy.log(values)/self.log_gamma).astype(int)
+        self.add_counts(index.min(), scipy.bincount(index - index.min()))
+
+    def add_counts(self, offset, counts):
+        if self.counts.shape[0] == 0:
+            self.offset = offset
+            self.counts = counts.copy()
+            return
+        lo = min(self.offset, offset)
+        hi = max(self.offset + self.counts.shape[0], offset + counts.shape[0])
+        merged = scipy.zeros((hi - lo,), dtype=int)
+        merged[self.offset - lo:self.offset - lo + self.counts.shape[0]] += self.counts
+        merged[offset - lo:offset - lo + counts.shape[0]] += counts
+        self.offset = lo
+        self.counts = merged
+
+    def merge(self, other):
+        self.zero_count += other.zero_count
+        if other.counts.shape[0] > 0:
+            self.add_counts(other.offset, other.counts)
+
+    def quantile(self, q):
+        """
+        Returns estimate of the q-th quantile (0 <= q <= 1), or nan if empty.
+        """
+        count = self.count
+        if count == 0:
+            return scipy.nan
+        rank = q*(count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        cumsum = scipy.cumsum(self.counts) + self.zero_count
+        i = int(scipy.searchsorted(cumsum, rank, side='right'))
+        i = min(i, self.counts.shape[0] - 1)
+        return 2.0*self.gamma**(i + self.offset)/(self.gamma + 1.0)
+
+
+class GrowingHistogram(object):
+    """
+    Mergeable histogram with fixed bin width starting at 0 which grows as needed.
+    """
+
+    def __init__(self, bin_width):
+        self.bin_width = bin_width
+        self.counts = scipy.zeros((0,), dtype=int)
+
+    def add(self, values):
+        values = scipy.asarray(values, dtype=float)
+        if values.shape[0] == 0:
+            return
+        index = scipy.floor(scipy.clip(values, 0.0, None)/self.bin_width).astype(int)
+        self.add_counts(scipy.bincount(index))
+
+    def add_counts(self, counts):
+        if counts.shape[0] > self.counts.shape[0]:
+            counts = counts.copy()
+            counts[:self.counts.shape[0]] += self.counts
+            self.counts = counts
+        else:
+            self.counts[:counts.shape[0]] += counts
+
+    def merge(self, other):
+        self.add_counts(other.counts)
+
+    @property
+    def bin_edges(self):
+        return self.bin_width*scipy.arange(self.counts.shape[0] + 1)
+
+
+class GroupAggregate(object):
+    """
+
+    Mergeable aggregate statistics for a group of runs.
+
+     * number of runs, flies and released flies
+     * trap counts and arrival time histograms and quantile sketches per trap
+     * time in plume and flight time totals and a histogram of per-fly
+       residence-in-plume fractions (if runs recorded time_in_plume, see
+       sensor_models.OdorSensor)
+
+    """
+
+    DefaultParam = {
+            'time_bin_width'     : 10.0,
+            'relative_accuracy'  : 0.01,
+            'fraction_bins'      : 20,
+            }
+
+    def __init__(self, num_traps, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.num_traps = num_traps
+        self.num_runs = 0
+        self.num_flies = 0
+        self.num_released = 0
+        self.trap_counts = scipy.zeros((num_traps,), dtype=int)
+        self.arrival_hist = [GrowingHistogram(self.param['time_bin_width']) for i in range(num_traps)]
+        self.arrival_sketch = [QuantileSketch(self.param['relative_accuracy']) for i in range(num_traps)]
+        self.time_in_plume = 0.0
+        self.flight_time = 0.0
+        self.plume_fraction_counts = scipy.zeros((self.param['fraction_bins'],), dtype=int)
+
+    def add_result(self, result):
+        """
+        Add result dictionary of a single run (see scenario.get_result).
+        """
+        trap_num = result['trap_num']
+        t_in_trap = result['t_in_trap']
+        release_time = result['release_time']
+        t_stop = result['t_stop']
+        mask_released = release_time < t_stop
+
+        self.num_runs += 1
+        self.num_flies += trap_num.shape[0]
+        self.num_released += int(mask_released.sum())
+        mask_trapped = trap_num >= 0
+        self.trap_counts += scipy.bincount(trap_num[mask_trapped], minlength=self.num_traps)[:self.num_traps]
+        for num in range(self.num_traps):
+            t_arrival = t_in_trap[trap_num == num]
+            self.arrival_hist[num].add(t_arrival)
+            self.arrival_sketch[num].add(t_arrival)
+
+        if 'time_in_plume' in result:
+            flight_time = scipy.minimum(t_in_trap, t_stop) - release_time
+            flight_time = flight_time[mask_released]
+            time_in_plume = result['time_in_plume'][mask_released]
+            self.time_in_plume += float(time_in_plume.sum())
+            self.flight_time += float(flight_time.sum())
+            mask_flown = flight_time > 0
+            fraction = time_in_plume[mask_flown]/flight_time[mask_flown]
+            counts, edges = scipy.histogram(fraction, bins=self.param['fraction_bins'], range=(0.0, 1.0))
+            self.plume_fraction_counts += counts
+
+    def merge(self, other):
+        self.num_runs += other.num_runs
+        self.num_flies += other.num_flies
+        self.num_released += other.num_released
+        self.trap_counts += other.trap_counts
+        for num in range(self.num_traps):
+            self.arrival_hist[num].merge(other.arrival_hist[num])
+            self.arrival_sketch[num].merge(other.arrival_sketch[num])
+        self.time_in_plume += other.time_in_plume
+        self.flight_time += other.flight_time
+        self.plume_fraction_counts += other.plume_fraction_counts
+
+    @property
+    def num_trapped(self):
+        return int(self.trap_counts.sum())
+
+    def capture_rate(self):
+        """
+        Fraction of released flies which were trapped.
+        """
+        if self.num_released == 0:
+            return scipy.nan
+        return float(self.num_trapped)/self.num_released
+
+    def trap_fractions(self):
+        """
+        Fraction of trapped flies in each trap (frac_list in run_simulation.py).
+        """
+        if self.num_trapped == 0:
+            return scipy.zeros((self.num_traps,))
+        return self.trap_counts/float(self.num_trapped)
+
+    def time_to_trap(self, trap_num=None):
+        """
+        Returns time bin edges and cumulative fraction of released flies
+        trapped by each time (in trap_num or any trap).
+        """
+        if trap_num is None:
+            hist = GrowingHistogram(self.param['time_bin_width'])
+            for item in self.arrival_hist:
+                hist.merge(item)
+        else:
+            hist = self.arrival_hist[trap_num]
+        cumulative = scipy.cumsum(hist.counts)/float(max(self.num_released, 1))
+        return hist.bin_edges[1:], cumulative
+
+    def arrival_quantiles(self, q_list=(0.1, 0.5, 0.9)):
+        """
+        Returns array (num_traps x len(q_list)) of arrival time quantiles.
+        """
+        return scipy.array([[sketch.quantile(q) for q in q_list] for sketch in self.arrival_sketch])
+
+    def plume_fraction(self):
+        """
+        Fraction of total flight time spent in the plume.
+        """
+        if self.flight_time == 0:
+            return scipy.nan
+        return self.time_in_plume/self.flight_time
+
+    def summary(self):
+        return {
+                'num_runs'       : self.num_runs,
+                'num_flies'      : self.num_flies,
+                'num_released'   : self.num_released,
+                'trap_counts'    : [int(x) for x in self.trap_counts],
+                'trap_fractions' : [float(x) for x in self.trap_fractions()],
+                'capture_rate'   : self.capture_rate(),
+                'arrival_median' : [float(x) for x in self.arrival_quantiles((0.5,))[:,0]],
+                'plume_fraction' : self.plume_fraction(),
+                }
+
+
+class TrajectoryAnalytics(object):
+    """
+
+    Streaming analytics over many result files (see scenario.save_result).
+
+    Files are reduced to GroupAggregates in a process pool, one file at a time
+    per worker, and merged into per-group aggregates as they arrive. Runs are
+    grouped by the 'group' entry of their scenario spec. Memory depends on the
+    number of groups, not on the number of files.
+
+    """
+
+    DefaultParam = {
+            'num_processes' : None,
+            'chunksize'     : 4,
+            'aggregate'     : GroupAggregate.DefaultParam,
+            }
+
+    def __init__(self, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.groups = {}
+        self.num_files = 0
+
+    def add(self, group_aggregates):
+        for group, aggregate in group_aggregates.items():
+            if group in self.groups:
+                self.groups[group].merge(aggregate)
+            else:
+                self.groups[group] = aggregate
+
+    def process(self, filename_list):
+        """
+        Aggregate result files, filename_list can be any iterable.
+        """
+        args_iter = ((filename, self.param['aggregate']) for filename in filename_list)
+        num_processes = self.param['num_processes']
+        if num_processes == 1:
+            for args in args_iter:
+                self.add(aggregate_file(args))
+                self.num_files += 1
+            return
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            for group_aggregates in pool.imap_unordered(aggregate_file, args_iter, self.param['chunksize']):
+                self.add(group_aggregates)
+                self.num_files += 1
+        finally:
+            pool.close()
+            pool.join()
+
+    def summary(self):
+        return dict((group, aggregate.summary()) for group, aggregate in self.groups.items())
+
+
+def aggregate_file(args):
+    """
+    Reduce result file to a dictionary {group: GroupAggregate}.
+    """
+    filename, param = args
+    result = load_result(filename)
+    group = result['spec'].get('group')
+    if group is None:
+        group = 'default'
+    aggregate = GroupAggregate(result['source_locations'].shape[0], param)
+    aggregate.add_result(result)
+    return {group: aggregate}
+
@@ -0,0 +1,151 @@
+from __future__ import print_function
+import scipy
+
+
+class PolygonRaster(object):
+    """
+
+    Rasterized occupancy grid for fast vectorized point-in-polygon queries on
+    the union of a list of polygons.
+
+    Each grid cell is classified once as outside, inside or mixed (crossed by a
+    polygon edge). A query is then a single grid lookup per point, only points
+    falling in mixed cells get an exact (ray casting) test.
+
+    """
+
+    Cell_Outside = 0
+    Cell_Inside = 1
+    Cell_Mixed = 2
+
+    def __init__(self, polygon_list, cell_size):
+        self.polygon_list = [scipy.array(polygon, dtype=float) for polygon in polygon_list]
+        self.cell_size = float(cell_size)
+        vertices = scipy.concatenate(self.polygon_list)
+        self.x_min = vertices[:,0].min() - self.cell_size
+        self.y_min = vertices[:,1].min() - self.cell_size
+        self.nx = int(scipy.ceil((vertices[:,0].max() + self.cell_size - self.x_min)/self.cell_size)) + 1
+        self.ny = int(scipy.ceil((vertices[:,1].max() + self.cell_size - self.y_min)/self.cell_size)) + 1
+
+        # Classify cells by their centers
+        x_centers = self.x_min + self.cell_size*(scipy.arange(self.nx) + 0.5)
+        y_centers = self.y_min + self.cell_size*(scipy.arange(self.ny) + 0.5)
+        x_mesh, y_mesh = scipy.meshgrid(x_centers, y_centers, indexing='ij')
+        inside = self.contains_exact(x_mesh.ravel(), y_mesh.ravel()).reshape(x_mesh.shape)
+        self.grid = scipy.where(inside, self.Cell_Inside, self.Cell_Outside).astype(scipy.int8)
+
+        # Mark cells (and their neighbors) crossed by edges as mixed
+        mixed = scipy.zeros(self.grid.shape, dtype=bool)
+        for polygon in self.polygon_list:
+            p0 = polygon
+            p1 = scipy.roll(polygon, -1, axis=0)
+            for (x0, y0), (x1, y1) in zip(p0, p1):
+                length = scipy.hypot(x1 - x0, y1 - y0)
+                num = int(scipy.ceil(2.0*length/self.cell_size)) + 1
+                s = scipy.linspace(0.0, 1.0, num)
+                ix, iy = self.cell_index(x0 + s*(x1 - x0), y0 + s*(y1 - y0))
+                mixed[ix, iy] = True
+        mixed[1:,:] |= mixed[:-1,:].copy()
+        mixed[:-1,:] |= mixed[1:,:].copy()
+        mixed[:,1:] |= mixed[:,:-1].copy()
+        mixed[:,:-1] |= mixed[:,1:].copy()
+        self.grid[mixed] = self.Cell_Mixed
+
+    def cell_index(self, x, y):
+        ix = scipy.floor((x - self.x_min)/self.cell_size).astype(int)
+        iy = scipy.floor((y - self.y_min)/self.cell_size).astype(int)
+        return ix, iy
+
+    def contains_exact(self, x, y):
+        """
+        Exact test (even-odd ray casting) of which points lie in any of the polygons.
+        """
+        inside = scipy.zeros(x.shape, dtype=bool)
+        for polygon in self.polygon_list:
+            in_polygon = scipy.zeros(x.shape, dtype=bool)
+            p0 = polygon
+            p1 = scipy.roll(polygon, -1, axis=0)
+            for (x0, y0), (x1, y1) in zip(p0, p1):
+                if y0 == y1:
+                    continue
+                crosses = (y0 > y) != (y1 > y)
+                x_cross = x0 + (y - y0)*(x1 - x0)/(y1 - y0)
+                in_polygon ^= crosses & (x < x_cross)
+            inside |= in_polygon
+        return inside
+
+    def contains(self, x, y):
+        """
+        Returns boolean array of which points x, y lie in any of the polygons.
+        """
+        ix, iy = self.cell_index(x, y)
+        mask_grid = (ix >= 0) & (ix < self.nx) & (iy >= 0) & (iy < self.ny)
+        cell = scipy.full(x.shape, self.Cell_Outside, dtype=scipy.int8)
+        cell[mask_grid] = self.grid[ix[mask_grid], iy[mask_grid]]
+        inside = cell == self.Cell_Inside
+        mask_mixed = cell == self.Cell_Mixed
+        if mask_mixed.any():
+            inside[mask_mixed] = self.contains_exact(x[mask_mixed], y[mask_mixed])
+        return inside
+
+
+class PolygonDomain(object):
+    """
+
+    Spatial domain given by a polygonal boundary and polygonal obstacles
+    (vegetation, no-fly areas). Flies which leave the boundary are retired from
+    the simulation and flies can't enter obstacles. Both are rasterized with
+    grid cells of size cell_size for O(1) per-fly queries.
+
+    A boundary of None gives an unbounded domain.
+
+    """
+
+    DefaultParam = {
+            'boundary'  : None,
+            'obstacles' : [],
+            'cell_size' : 10.0,
+            }
+
+    def __init__(self,param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        if self.param['boundary'] is not None:
+            self.boundary_raster = PolygonRaster([self.param['boundary']], self.param['cell_size'])
+        else:
+            self.boundary_raster = None
+        if self.param['obstacles']:
+            self.obstacle_raster = PolygonRaster(self.param['obstacles'], self.param['cell_size'])
+        else:
+            self.obstacle_raster = None
+
+    @property
+    def has_obstacles(self):
+        return self.obstacle_raster is not None
+
+    def in_domain(self, x, y):
+        """
+        Returns boolean array of which points are inside the domain boundary.
+        """
+        if self.boundary_raster is None:
+            return scipy.ones(x.shape, dtype=bool)
+        return self.boundary_raster.contains(x, y)
+
+    def in_obstacle(self, x, y):
+        """
+        Returns boolean array of which points are inside an obstacle.
+        """
+        if self.obstacle_raster is None:
+            return scipy.zeros(x.shape, dtype=bool)
+        return self.obstacle_raster.contains(x, y)
+
+    def plot(self, style='k'):
+        import matplotlib.pyplot as plt
+        polygon_list = list(self.param['obstacles'])
+        if self.param['boundary'] is not None:
+            polygon_list.append(self.param['boundary'])
+        for polygon in polygon_list:
+            polygon = scipy.array(polygon)
+            polygon = scipy.vstack((polygon, polygon[:1]))
+            plt.plot(polygon[:,0], polygon[:,1], style)
+
@@ -0,0 +1,331 @@
+from __future__ import print_function
+import os
+import sys
+import time
+import json
+import socket
+import sqlite3
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+from .scenario import run_scenario
+from .scenario import get_result
+from .scenario import save_result
+
+
+class TaskQueue(object):
+    """
+
+    SQLite backed queue of scenario runs kept in a (shared) directory.
+
+    Each task is a scenario spec and seed. Any number of worker processes, on
+    any node which can see the directory, claim tasks, run them and write their
+    results to the results sub-directory. Running tasks are kept alive by
+    heartbeats - a task whose heartbeat is older than heartbeat_timeout is
+    assumed to belong to a dead or stalled worker and is put back in the queue.
+    Failed tasks are retried until they have been attempted max_attempts times.
+
+    """
+
+    DefaultParam = {
+            'max_attempts'      : 3,
+            'heartbeat_timeout' : 60.0,
+            'db_timeout'        : 60.0,
+            }
+
+    Status_Pending = 'pending'
+    Status_Running = 'running'
+    Status_Done = 'done'
+    Status_Failed = 'failed'
+
+    def __init__(self, directory, param={}):
+        self.directory = os.path.abspath(directory)
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.db_filename = os.path.join(self.directory, 'queue.sqlite')
+        self.results_directory = os.path.join(self.directory, 'results')
+        for path in (self.directory, self.results_directory):
+            if not os.path.isdir(path):
+                try:
+                    os.makedirs(path)
+                except OSError:
+                    if not os.path.isdir(path):
+                        raise
+        with self.transaction() as db:
+            db.execute("""
+                create table if not exists tasks (
+                    id integer primary key autoincrement,
+                    spec text not null,
+                    seed integer not null,
+                    status text not null,
+                    attempts integer not null default 0,
+                    worker text,
+                    heartbeat real,
+                    result text,
+                    error text
+                )""")
+
+    def connect(self):
+        db = sqlite3.connect(self.db_filename, timeout=self.param['db_timeout'], isolation_level=None)
+        return db
+
+    def transaction(self):
+        return Transaction(self.connect())
+
+    def add_task(self, spec, seed):
+        """
+        Add scenario run to the queue. Returns the task id.
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                    'insert into tasks (spec, seed, status) values (?, ?, ?)',
+                    (json.dumps(spec, sort_keys=True), seed, self.Status_Pending)
+                    )
+            return cursor.lastrowid
+
+    def add_tasks(self, spec_list, seed_list):
+        """
+        Add a task for every combination of spec and seed. Returns list of task ids.
+        """
+        return [self.add_task(spec, seed) for spec in spec_list for seed in seed_list]
+
+    def claim(self, worker):
+        """
+        Claim the next pending task for worker. Returns (task_id, spec, seed) or
+        None if no task is pending.
+        """
+        self.requeue_stalled()
+        with self.transaction() as db:
+            row = db.execute(
+                    'select id, spec, seed from tasks where status = ? order by id limit 1',
+                    (self.Status_Pending,)
+                    ).fetchone()
+            if row is None:
+                return None
+            task_id, spec, seed = row
+            db.execute(
+                    'update tasks set status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1 where id = ?',
+                    (self.Status_Running, worker, time.time(), task_id)
+                    )
+        return task_id, json.loads(spec), seed
+
+    def heartbeat(self, task_id, worker):
+        """
+        Update heartbeat of running task. Returns False if the task is no
+        longer owned by the worker.
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                    'update tasks set heartbeat = ? where id = ? and worker = ? and status = ?',
+                    (time.time(), task_id, worker, self.Status_Running)
+                    )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker, result):
+        """
+        Mark task as done with result filename. Returns False if the task is no
+        longer owned by the worker (e.g. it was requeued as stalled).
+        """
+        with self.transaction() as db:
+            cursor = db.execute(
+                    'update tasks set status = ?, result = ?, error = null where id = ? and worker = ? and status = ?',
+                    (self.Status_Done, result, task_id, worker, self.Status_Running)
+                    )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id, worker, error):
+        """
+        Record failure of task. The task is requeued unless it has used up its attempts.
+        """
+        with self.transaction() as db:
+            db.execute(
+                    """update tasks set error = ?, worker = null,
+                    status = case when attempts < ? then ? else ? end
+                    where id = ? and worker = ? and status = ?""",
+                    (error, self.param['max_attempts'], self.Status_Pending, self.Status_Failed,
+                        task_id, worker, self.Status_Running)
+                    )
+
+    def requeue_stalled(self):
+        """
+        Requeue (or fail) running tasks whose heartbeat has timed out.
+        """
+        t_stalled = time.time() - self.param['heartbeat_timeout']
+        with self.transaction() as db:
+            db.execute(
+                    """update tasks set error = ?, worker = null,
+                    status = case when attempts < ? then ? else ? end
+                    where status = ? and heartbeat < ?""",
+                    ('heartbeat timeout', self.param['max_attempts'], self.Status_Pending,
+                        self.Status_Failed, self.Status_Running, t_stalled)
+                    )
+
+    def counts(self):
+        """
+        Returns dictionary of number of tasks by status.
+        """
+        db = self.connect()
+        try:
+            rows = db.execute('select status, count(*) from tasks group by status').fetchall()
+        finally:
+            db.close()
+        counts = dict((status, 0) for status in
+                (self.Status_Pending, self.Status_Running, self.Status_Done, self.Status_Failed))
+        counts.update(dict(rows))
+        return counts
+
+    def is_finished(self):
+        counts = self.counts()
+        return counts[self.Status_Pending] == 0 and counts[self.Status_Running] == 0
+
+    def tasks(self, status=None):
+        """
+        Returns list of task dictionaries, optionally only those with the given status.
+        """
+        query = 'select id, spec, seed, status, attempts, worker, result, error from tasks'
+        args = ()
+        if status is not None:
+            query += ' where status = ?'
+            args = (status,)
+        db = self.connect()
+        try:
+            rows = db.execute(query + ' order by id', args).fetchall()
+        finally:
+            db.close()
+        keys = ('id', 'spec', 'seed', 'status', 'attempts', 'worker', 'result', 'error')
+        task_list = [dict(zip(keys, row)) for row in rows]
+        for task in task_list:
+            task['spec'] = json.loads(task['spec'])
+        return task_list
+
+    def result_files(self):
+        """
+        Returns list of result files of completed tasks.
+        """
+        return [os.path.join(self.results_directory, task['result']) for task in self.tasks(self.Status_Done)]
+
+
+class Transaction(object):
+    """
+    Context manager for an immediate (write locked) sqlite transaction.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('begin immediate')
+        return self.db
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        try:
+            if exc_type is None:
+                self.db.execute('commit')
+            else:
+                self.db.execute('rollback')
+        finally:
+            self.db.close()
+        return False
+
+
+class EnsembleWorker(object):
+    """
+    Worker which claims tasks from a TaskQueue, runs them and writes their results.
+    """
+
+    DefaultParam = {
+            'heartbeat_interval' : 10.0,
+            'poll_interval'      : 1.0,
+            'exit_when_empty'    : True,
+            'max_tasks'          : None,
+            }
+
+    def __init__(self, directory, worker=None, param={}, queue_param={}):
+        self.queue = TaskQueue(directory, queue_param)
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        if worker is None:
+            worker = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+        self.worker = worker
+        self.num_done = 0
+
+    def run(self):
+        """
+        Run tasks until the queue is finished (or max_tasks have been run).
+        """
+        max_tasks = self.param['max_tasks']
+        while max_tasks is None or self.num_done < max_tasks:
+            task = self.queue.claim(self.worker)
+            if task is None:
+                if self.param['exit_when_empty'] and self.queue.is_finished():
+                    break
+                time.sleep(self.param['poll_interval'])
+                continue
+            self.run_task(*task)
+
+    def run_task(self, task_id, spec, seed):
+        stop_event = threading.Event()
+        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, args=(task_id, stop_event))
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+        try:
+            swarm, odor_field = run_scenario(spec, seed)
+            result = get_result(swarm, odor_field, spec, seed)
+            result_name = 'task_{0:08d}.npz'.format(task_id)
+            result_filename = os.path.join(self.queue.results_directory, result_name)
+            tmp_filename = '{0}.{1}.{2}.tmp'.format(result_filename, self.worker, os.getpid())
+            save_result(tmp_filename, result)
+            os.rename(tmp_filename, result_filename)
+        except Exception:
+            stop_event.set()
+            heartbeat_thread.join()
+            self.queue.fail(task_id, self.worker, traceback.format_exc())
+        else:
+            stop_event.set()
+            heartbeat_thread.join()
+            self.queue.complete(task_id, self.worker, result_name)
+            self.num_done += 1
+
+    def heartbeat_loop(self, task_id, stop_event):
+        while not stop_event.wait(self.param['heartbeat_interval']):
+            if not self.queue.heartbeat(task_id, self.worker):
+                break
+
+
+def run_worker(directory, worker=None, param={}, queue_param={}):
+    EnsembleWorker(directory, worker, param, queue_param).run()
+
+
+def run_local_workers(directory, num_workers, param={}, queue_param={}):
+    """
+    Run num_workers worker processes on this machine until the queue is finished.
+    Worker names include the pid of this process so that several runs on the
+    same machine don't share names.
+    """
+    process_list = []
+    for i in range(num_workers):
+        worker = '{0}-{1}-local-{2}'.format(socket.gethostname(), os.getpid(), i)
+        process = multiprocessing.Process(target=run_worker, args=(directory, worker, param, queue_param))
+        process.start()
+        process_list.append(process)
+    for process in process_list:
+        process.join()
+    return [process.exitcode for process in process_list]
+
+
+# Run workers on a node, e.g. python -m odor_tracking_sim.ensemble /shared/queue --workers 8
+# -------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='run ensemble workers on task queue')
+    parser.add_argument('directory', help='task queue directory')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--wait', action='store_true', help='keep waiting for new tasks')
+    args = parser.parse_args()
+
+    worker_param = {'exit_when_empty': not args.wait}
+    exitcodes = run_local_workers(args.directory, args.workers, worker_param)
+    sys.exit(max(exitcodes))
+
@@ -0,0 +1,197 @@
+from __future__ import print_function
+import os
+import json
+import struct
+import scipy
+
+from utility import unit_vector
+from utility import rotate_vecs
+from utility import take
+from swarm_models import BasicSwarmOfFlies
+
+
+# Fixed size (18 byte) binary event record. mode is the fly's mode after the
+# event, sign the cast direction for flies starting a new cast (0 otherwise)
+# and heading_error the fly's new heading error - which is all that is needed
+# to replay the fly's velocity changes without the random number generator.
+EventDtype = scipy.dtype([
+    ('step',          '<u4'),
+    ('fly_id',        '<u4'),
+    ('mode',          'u1'),
+    ('sign',          'i1'),
+    ('heading_error', '<f8'),
+    ])
+
+Magic = b'OTSEVT01'
+
+
+class EventLog(object):
+    """
+
+    Append-only binary log of the mode changes of the flies in a swarm, i.e.
+    switches to FlyUpWind (odor detection), CastForOdor (odor loss and new
+    casts), Trapped and OutOfDomain. Each event is a fixed size record
+    (EventDtype) of the step number, fly id, new mode, cast sign and heading
+    error, written after a header holding the json metadata, e.g. the scenario
+    spec and seed (see scenario.run_scenario and scenario.replay_fly).
+
+    Events are buffered and written buffer_size events at a time. Use
+    read_event_log to read a log and replay_fly to replay a single fly's
+    trajectory from it.
+
+    """
+
+    DefaultParam = {
+            'buffer_size' : 65536,
+            }
+
+    def __init__(self, filename, metadata={}, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.filename = filename
+        self.metadata = dict(metadata)
+        self.buffer = []
+        self.num_buffered = 0
+        self.num_events = 0
+        header = json.dumps(self.metadata, sort_keys=True).encode('utf-8')
+        self.fileobj = open(filename, 'wb')
+        self.fileobj.write(Magic)
+        self.fileobj.write(struct.pack('<I', len(header)))
+        self.fileobj.write(header)
+
+    def attach(self, swarm):
+        swarm.event_log = self
+
+    def record(self, step, fly_id, mode, sign, heading_error):
+        """
+        Append events for flies fly_id changing to mode at step.
+        """
+        events = scipy.empty((scipy.shape(fly_id)[0],), dtype=EventDtype)
+        events['step'] = step
+        events['fly_id'] = fly_id
+        events['mode'] = mode
+        events['sign'] = sign
+        events['heading_error'] = heading_error
+        self.buffer.append(events)
+        self.num_buffered += events.shape[0]
+        self.num_events += events.shape[0]
+        if self.num_buffered >= self.param['buffer_size']:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.fileobj.write(scipy.concatenate(self.buffer).tobytes())
+            self.buffer = []
+            self.num_buffered = 0
+        self.fileobj.flush()
+
+    def close(self):
+        if not self.fileobj.closed:
+            self.flush()
+            self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def read_event_log(filename):
+    """
+    Returns metadata and (memory mapped) array of events of event log file.
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(Magic)) != Magic:
+            raise ValueError('{0} is not an event log'.format(filename))
+        header_size, = struct.unpack('<I', f.read(4))
+        metadata = json.loads(f.read(header_size).decode('utf-8'))
+    offset = len(Magic) + 4 + header_size
+    num_events = (os.path.getsize(filename) - offset)//EventDtype.itemsize
+    if num_events == 0:
+        return metadata, scipy.zeros((0,), dtype=EventDtype)
+    events = scipy.memmap(filename, dtype=EventDtype, mode='r', offset=offset, shape=(num_events,))
+    return metadata, events
+
+
+def get_fly_events(events, fly_id):
+    """
+    Returns events of fly fly_id (in step order).
+    """
+    return scipy.array(events[events['fly_id'] == fly_id])
+
+
+def replay_fly(events, fly_id, swarm_param, wind_field, odor_field, t_stop, dt, t_start=0.0):
+    """
+
+    Replay the trajectory of fly fly_id of a swarm run with run_swarm (from
+    t_start to t_stop with time step dt) from the swarm's event log.
+
+    swarm_param are the params the swarm was created with. The fly is simulated
+    on its own as a swarm of one, with its mode and velocity changes taken from
+    the logged events instead of random numbers. Traps, obstacles and the domain
+    boundary are deterministic and are applied by the fly's swarm as usual.
+
+    Returns dictionary of arrays of the time, position and mode after each step.
+
+    """
+    fly_param = dict(swarm_param)
+    for item in BasicSwarmOfFlies.PerFlyParam:
+        fly_param[item] = scipy.asarray(swarm_param[item])[fly_id:fly_id+1]
+    fly_param['odor_sensor'] = None
+    fly_param['odor_skip'] = False
+    fly = BasicSwarmOfFlies(fly_param)
+    fly_events = get_fly_events(events, fly_id)
+    mask = scipy.full((1,), True, dtype=bool)
+
+    t_list = []
+    x_list = []
+    y_list = []
+    mode_list = []
+    step = 0
+    event_num = 0
+    t = t_start
+    while t < t_stop:
+        mask_release = t > fly.param['release_time']
+        if getattr(wind_field, 'is_uniform', False):
+            x_wind, y_wind = wind_field.uniform_value(t)
+            x_wind_unit, y_wind_unit = wind_field.uniform_unit_vector(t)
+        else:
+            x_wind, y_wind = wind_field.value(t,fly.x_position, fly.y_position)
+            x_wind_unit, y_wind_unit = unit_vector(x_wind, y_wind)
+
+        # Apply logged mode changes (as in update_for_odor_detection and update_for_odor_loss)
+        while event_num < fly_events.shape[0] and fly_events['step'][event_num] == step:
+            event = fly_events[event_num]
+            event_num += 1
+            if event['mode'] in (fly.Mode_Trapped, fly.Mode_OutOfDomain):
+                continue
+            fly.mode[0] = event['mode']
+            fly.heading_error[0] = event['heading_error']
+            speed = fly.param['flight_speed'][mask]
+            if event['sign'] == 0:
+                x_unit, y_unit = rotate_vecs(take(x_wind_unit, mask), take(y_wind_unit, mask), fly.heading_error[mask])
+                fly.x_velocity[mask] = -speed*x_unit
+                fly.y_velocity[mask] = -speed*y_unit
+            else:
+                fly.cast_sign[0] = event['sign']
+                x_unit, y_unit = rotate_vecs(take(x_wind_unit, mask), -take(y_wind_unit, mask), fly.heading_error[mask])
+                fly.x_velocity[mask] = fly.cast_sign[mask]*speed*x_unit
+                fly.y_velocity[mask] = fly.cast_sign[mask]*speed*y_unit
+
+        fly.update_for_in_trap(t, odor_field, mask_release)
+        fly.update_position(t, dt, mask_release, (x_wind, y_wind))
+        t += dt
+        step += 1
+        t_list.append(t)
+        x_list.append(fly.x_position[0])
+        y_list.append(fly.y_position[0])
+        mode_list.append(fly.mode[0])
+
+    return {
+            't'          : scipy.array(t_list),
+            'x_position' : scipy.array(x_list, dtype=fly.dtype),
+            'y_position' : scipy.array(y_list, dtype=fly.dtype),
+            'mode'       : scipy.array(mode_list, dtype=int),
+            }
+
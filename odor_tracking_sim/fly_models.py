@@ -3,6 +3,8 @@ import scipy
 
 from utility import unit_vector
 from utility import shift_and_rotate
+from utility import rotate_vecs
+from utility import take
 
 
 class VerySimpleFly(object):
@@ -149,6 +151,174 @@ class VerySimpleFly(object):
                 self.heading_error = self.param['heading_error_std']*scipy.randn(1)[0]
 
 
+class VerySimpleFlyBatch(object):
+    """
+
+    Batch adapter for stepping a list of VerySimpleFly objects together.
+
+    The state and parameters of the flies are gathered into arrays and each
+    update steps all flies at once using the vectorized wind field, odor field
+    and trap paths. The behavior of each fly is the same as VerySimpleFly.update
+    however random numbers are drawn in a different order.  State is only
+    written back to the fly objects by write_state, e.g. once at the end of a
+    run (or after each update with write_back=True, which is slow for many
+    flies).
+
+    """
+
+    def __init__(self, fly_list):
+        self.fly_list = list(fly_list)
+        self.trap_locations = [fly.trap_loc for fly in self.fly_list]
+        self.read_state()
+
+    @property
+    def size(self):
+        return len(self.fly_list)
+
+    def get_param_array(self, name, dtype=float):
+        return scipy.array([fly.param[name] for fly in self.fly_list], dtype=dtype)
+
+    def get_attr_array(self, name, none_value=scipy.nan, dtype=float):
+        values = [getattr(fly,name) for fly in self.fly_list]
+        return scipy.array([none_value if v is None else v for v in values], dtype=dtype)
+
+    def read_state(self):
+        """
+        Gather parameters and state of flies into arrays.
+        """
+        self.initial_heading = self.get_param_array('initial_heading')
+        self.heading_error_std = self.get_param_array('heading_error_std')
+        self.flight_speed = self.get_param_array('flight_speed')
+        self.release_time = self.get_param_array('release_time')
+        self.cast_interval = self.get_param_array('cast_interval')
+        self.wind_slippage = self.get_param_array('wind_slippage')
+        self.odor_thresholds = {}
+        self.odor_probabilities = {}
+        for key in ('lower', 'upper'):
+            self.odor_thresholds[key] = scipy.array(
+                    [fly.param['odor_thresholds'][key] for fly in self.fly_list])
+            self.odor_probabilities[key] = scipy.array(
+                    [fly.param['odor_probabilities'][key] for fly in self.fly_list])
+
+        self.x_position = scipy.array([fly.x for fly in self.fly_list], dtype=float)
+        self.y_position = scipy.array([fly.y for fly in self.fly_list], dtype=float)
+        self.mode = self.get_attr_array('mode', dtype=int)
+        self.heading_error = self.get_attr_array('heading_error')
+        self.t_last_cast = self.get_attr_array('t_last_cast')
+        self.dt_next_cast = self.get_attr_array('dt_next_cast')
+        self.cast_sign = self.get_attr_array('cast_sign', none_value=0, dtype=int)
+        self.trap_num = self.get_attr_array('trap_num', none_value=-1, dtype=int)
+
+    def write_state(self):
+        """
+        Write array state back to fly objects.
+        """
+        def to_value(v):
+            return None if scipy.isnan(v) else float(v)
+
+        for i, fly in enumerate(self.fly_list):
+            fly.position = float(self.x_position[i]), float(self.y_position[i])
+            fly.mode = int(self.mode[i])
+            fly.heading_error = to_value(self.heading_error[i])
+            fly.t_last_cast = to_value(self.t_last_cast[i])
+            fly.dt_next_cast = to_value(self.dt_next_cast[i])
+            fly.cast_sign = None if self.cast_sign[i] == 0 else int(self.cast_sign[i])
+            fly.trap_num = None if self.trap_num[i] == -1 else int(self.trap_num[i])
+            fly.trap_loc = self.trap_locations[i]
+
+    def update(self, t, dt, wind_field, odor_field, write_back=False):
+        """
+        Update all flies one time step.
+        """
+        mask_active = (t >= self.release_time) & (self.mode != VerySimpleFly.Mode_Trapped)
+        x = self.x_position
+        y = self.y_position
+        speed = self.flight_speed
+        if getattr(wind_field, 'is_uniform', False):
+            x_wind, y_wind = wind_field.uniform_value(t)
+            x_wind_unit, y_wind_unit = wind_field.uniform_unit_vector(t)
+        else:
+            x_wind, y_wind = wind_field.value(t,x,y)
+            x_wind_unit, y_wind_unit = unit_vector(x_wind,y_wind)
+
+        # Update position based on mode
+        x_step = scipy.zeros((self.size,))
+        y_step = scipy.zeros((self.size,))
+
+        mask = mask_active & (self.mode == VerySimpleFly.Mode_FixHeading)
+        angle = self.initial_heading[mask]
+        x_step[mask] = dt*speed[mask]*scipy.cos(angle)
+        y_step[mask] = dt*speed[mask]*scipy.sin(angle)
+
+        mask = mask_active & (self.mode == VerySimpleFly.Mode_FlyUpWind)
+        x_head_unit, y_head_unit = rotate_vecs(take(x_wind_unit, mask), take(y_wind_unit, mask), self.heading_error[mask])
+        x_step[mask] = -dt*speed[mask]*x_head_unit
+        y_step[mask] = -dt*speed[mask]*y_head_unit
+
+        mask = mask_active & (self.mode == VerySimpleFly.Mode_CastForOdor)
+        mask_first = mask & scipy.isnan(self.t_last_cast)
+        self.t_last_cast[mask_first] = t
+        self.dt_next_cast[mask_first] = 0.0
+        self.cast_sign[mask_first] = scipy.random.choice([-1,1],(mask_first.sum(),))
+        mask_flip = mask.copy()
+        mask_flip[mask] = self.t_last_cast[mask] + self.dt_next_cast[mask] < t
+        self.cast_sign[mask_flip] *= -1
+        self.t_last_cast[mask_flip] = t
+        self.dt_next_cast[mask_flip] = scipy.random.uniform(
+                self.cast_interval[mask_flip,0],
+                self.cast_interval[mask_flip,1]
+                )
+        x_head_unit, y_head_unit = rotate_vecs(take(x_wind_unit, mask), take(y_wind_unit, mask), self.heading_error[mask])
+        x_step[mask] =  self.cast_sign[mask]*dt*speed[mask]*x_head_unit
+        y_step[mask] = -self.cast_sign[mask]*dt*speed[mask]*y_head_unit
+
+        x_step[mask_active] += dt*self.wind_slippage[mask_active]*take(x_wind, mask_active)
+        y_step[mask_active] += dt*self.wind_slippage[mask_active]*take(y_wind, mask_active)
+        x_new = scipy.where(mask_active, x + x_step, x)
+        y_new = scipy.where(mask_active, y + y_step, y)
+
+        # Check if in trap
+        trap_num = odor_field.trap_index(x_new, y_new)
+        mask_trapped = mask_active & (trap_num != -1)
+        self.mode[mask_trapped] = VerySimpleFly.Mode_Trapped
+        self.trap_num[mask_trapped] = trap_num[mask_trapped]
+        source_locations = odor_field.param['source_locations']
+        for i in scipy.flatnonzero(mask_trapped):
+            self.trap_locations[i] = source_locations[trap_num[i]]
+
+        # Check odor (at position prior to step) for mode change
+        mask_odor = mask_active & (~mask_trapped)
+        odor_value = odor_field.value(t,x[mask_odor],y[mask_odor])
+        mode = self.mode[mask_odor]
+        mask_upwind = mode == VerySimpleFly.Mode_FlyUpWind
+        odor_threshold = scipy.where(
+                mask_upwind,
+                self.odor_thresholds['lower'][mask_odor],
+                self.odor_thresholds['upper'][mask_odor]
+                )
+        odor_probability = scipy.where(
+                mask_upwind,
+                self.odor_probabilities['lower'][mask_odor],
+                self.odor_probabilities['upper'][mask_odor]
+                )
+        mask_above = odor_value > odor_threshold
+        mask_dice = scipy.rand(mode.shape[0]) < odor_probability
+        mask_to_upwind = mask_above & (~mask_upwind) & mask_dice
+        mask_to_cast = (~mask_above) & mask_upwind & mask_dice
+        mode[mask_to_upwind] = VerySimpleFly.Mode_FlyUpWind
+        mode[mask_to_cast] = VerySimpleFly.Mode_CastForOdor
+        self.mode[mask_odor] = mode
+
+        mask_change = scipy.zeros((self.size,), dtype=bool)
+        mask_change[mask_odor] = mask_to_upwind | mask_to_cast
+        self.heading_error[mask_change] = self.heading_error_std[mask_change]*scipy.randn(mask_change.sum())
+
+        self.x_position = x_new
+        self.y_position = y_new
+        if write_back:
+            self.write_state()
+
+
 
 # Below here just for Testing/development
 # -------------------------------------------------------------------------------------------------
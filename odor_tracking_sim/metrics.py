@@ -0,0 +1,205 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import logging
+import logging.handlers
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class PhaseTimer(object):
+    """
+    Accumulates wall clock time spent in the phases of a swarm update. Set as
+    swarm.phase_timer - update calls start and then lap(name) at the end of
+    each phase.
+    """
+
+    def __init__(self):
+        self.totals = OrderedDict()
+        self.t_last = None
+
+    def start(self):
+        self.t_last = time.time()
+
+    def lap(self, name):
+        t_now = time.time()
+        self.totals[name] = self.totals.get(name, 0.0) + t_now - self.t_last
+        self.t_last = t_now
+
+    def reset(self):
+        totals = self.totals
+        self.totals = OrderedDict()
+        return totals
+
+
+class MetricsRecorder(object):
+    """
+
+    Records metrics of a running simulation every interval seconds (wall
+    clock) and writes them either to a size rotated JSON lines file (format
+    'jsonl') or to a Prometheus text format file which is replaced atomically
+    (format 'prometheus'), e.g. for the node exporter's textfile collector.
+
+    Each sample has the simulation time, number of steps, steps/s and
+    fly-steps/s since the last sample, counts of released, active, trapped and
+    out of domain flies, time spent in each phase of the swarm update since
+    the last sample and the peak resident set size of the process.
+
+    Between samples update only counts steps and checks the clock.
+
+    """
+
+    DefaultParam = {
+            'interval'     : 10.0,
+            'format'       : 'jsonl',
+            'filename'     : 'metrics.jsonl',
+            'max_bytes'    : 10*1024*1024,
+            'backup_count' : 5,
+            'labels'       : {},
+            }
+
+    Formats = ('jsonl', 'prometheus')
+
+    def __init__(self, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        if self.param['format'] not in self.Formats:
+            raise ValueError('format must be one of {0}'.format(self.Formats))
+        self.timer = PhaseTimer()
+        self.num_steps = 0
+        self.num_steps_last = 0
+        self.t_wall_last = time.time()
+        self.phase_totals = OrderedDict()
+        self.last_sample = None
+        self.logger = None
+        if self.param['format'] == 'jsonl':
+            self.logger = logging.getLogger('{0}.{1}'.format(__name__, id(self)))
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            handler = logging.handlers.RotatingFileHandler(
+                    self.param['filename'],
+                    maxBytes=self.param['max_bytes'],
+                    backupCount=self.param['backup_count']
+                    )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def attach(self, swarm):
+        swarm.phase_timer = self.timer
+        self.t_wall_last = time.time()
+
+    def update(self, t, swarm):
+        """
+        Count step and record a sample if interval has elapsed.
+        """
+        self.num_steps += 1
+        if time.time() - self.t_wall_last >= self.param['interval']:
+            self.record(t, swarm)
+
+    def record(self, t, swarm):
+        """
+        Record sample now.
+        """
+        sample = self.get_sample(t, swarm)
+        if self.param['format'] == 'jsonl':
+            self.logger.info(json.dumps(sample))
+        else:
+            self.write_prometheus(sample)
+        self.last_sample = sample
+        return sample
+
+    def finish(self, t, swarm):
+        """
+        Record final sample at the end of a run, unless no steps were taken
+        since the last sample (which would report zero throughput). Returns the
+        final sample.
+        """
+        if self.last_sample is None or self.num_steps > self.num_steps_last:
+            return self.record(t, swarm)
+        return self.last_sample
+
+    def get_sample(self, t, swarm):
+        t_wall = time.time()
+        elapsed = max(t_wall - self.t_wall_last, 1.0e-9)
+        num_steps = self.num_steps - self.num_steps_last
+        self.t_wall_last = t_wall
+        self.num_steps_last = self.num_steps
+
+        phase_seconds = self.timer.reset()
+        for name, value in phase_seconds.items():
+            self.phase_totals[name] = self.phase_totals.get(name, 0.0) + value
+
+        # Includes flies compacted out of a staged swarm
+        mode_count = swarm.get_mode_count(t)
+        num_trapped = int(mode_count[swarm.Mode_Trapped])
+        num_out = int(mode_count[swarm.Mode_OutOfDomain])
+        num_released = int(mode_count.sum())
+
+        sample = OrderedDict()
+        sample['time'] = t_wall
+        sample['t'] = float(t)
+        sample['steps'] = self.num_steps
+        sample['steps_per_sec'] = num_steps/elapsed
+        sample['fly_steps_per_sec'] = num_steps*swarm.size/elapsed
+        sample['num_flies'] = swarm.num_flies
+        sample['num_released'] = num_released
+        sample['num_active'] = num_released - num_trapped - num_out
+        sample['num_trapped'] = num_trapped
+        sample['num_out_of_domain'] = num_out
+        sample['phase_seconds'] = phase_seconds
+        sample['max_rss_bytes'] = get_max_rss()
+        if self.param['labels']:
+            sample['labels'] = self.param['labels']
+        return sample
+
+    def write_prometheus(self, sample):
+        labels = ','.join('{0}="{1}"'.format(k, v) for k, v in sorted(self.param['labels'].items()))
+        def metric(name, value, extra_labels=''):
+            all_labels = ','.join(x for x in (labels, extra_labels) if x)
+            if all_labels:
+                name = '{0}{{{1}}}'.format(name, all_labels)
+            return 'odor_tracking_sim_{0} {1!r}\n'.format(name, float(value))
+
+        lines = []
+        lines.append(metric('sim_time_seconds', sample['t']))
+        lines.append(metric('steps_total', sample['steps']))
+        lines.append(metric('steps_per_second', sample['steps_per_sec']))
+        lines.append(metric('fly_steps_per_second', sample['fly_steps_per_sec']))
+        for name in ('num_flies', 'num_released', 'num_active', 'num_trapped', 'num_out_of_domain'):
+            lines.append(metric(name[4:], sample[name]))
+        for name, value in self.phase_totals.items():
+            lines.append(metric('phase_seconds_total', value, 'phase="{0}"'.format(name)))
+        if sample['max_rss_bytes'] is not None:
+            lines.append(metric('max_rss_bytes', sample['max_rss_bytes']))
+        lines.append(metric('last_sample_timestamp_seconds', sample['time']))
+
+        filename = self.param['filename']
+        tmp_filename = '{0}.{1}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            f.write(''.join(lines))
+        os.rename(tmp_filename, filename)
+
+    def close(self):
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
+
+
+def get_max_rss():
+    """
+    Returns peak resident set size of the process in bytes, or None if unavailable.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss*1024
+
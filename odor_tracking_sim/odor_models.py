@@ -2,18 +2,22 @@ from __future__ import print_function
 
 import scipy
 import scipy.special
+import numpy
 import matplotlib.pyplot as plt
 import wind_models
 
 from .utility import shift_and_rotate
-from .utility import rotation_matrix
 from .utility import distance
+from .utility import rotate_vecs
 
 class FakeDiffusionOdorField(object):
 
     DefaultWindParam = {'angle': 0.0, 'speed': 0.2}
     DefaultWindField = wind_models.ConstantWindField(param =DefaultWindParam)
 
+    # Number of positions per chunk in max_value_bound
+    BoundChunkSize = 4096
+
     DefaultParam = {
             'wind_field'       : DefaultWindField,
             'diffusion_coeff'  : 0.001,
@@ -21,6 +25,14 @@ class FakeDiffusionOdorField(object):
             'source_strengths' : [ 1.0, ],
             'epsilon'          : 0.01,
             'trap_radius'      : 10.0,
+            'dtype'            : scipy.float64,
+            'far_field'        : None,
+            }
+
+    DefaultFarFieldParam = {
+            'opening_ratio' : 0.25,
+            'atol'          : 1.0e-6,
+            'leaf_size'     : 8,
             }
 
     def __init__(self,param={}):
@@ -28,6 +40,31 @@ class FakeDiffusionOdorField(object):
         self.param.update(param)
         if  type(self.param['wind_field']) != wind_models.ConstantWindField:
             raise(ValueError, 'wind_field must of type wind_models.ConstantWindField')
+        self.dtype = scipy.dtype(self.param['dtype'])
+        self.source_tree = None
+        if self.param['far_field'] is not None:
+            far_field_param = dict(self.DefaultFarFieldParam)
+            far_field_param.update(self.param['far_field'])
+            self.param['far_field'] = far_field_param
+
+    def get_source_tree(self):
+        """
+        Returns source tree for far field evaluation, rebuilt if the wind changes.
+        """
+        wind_field = self.param['wind_field']
+        key = (wind_field.angle, wind_field.speed)
+        if self.source_tree is None or self.source_tree.key != key:
+            self.source_tree = SourceTree(
+                    self.param['source_locations'],
+                    self.param['source_strengths'],
+                    wind_field.angle,
+                    wind_field.speed,
+                    self.param['diffusion_coeff'],
+                    self.param['epsilon'],
+                    self.param['far_field']
+                    )
+            self.source_tree.key = key
+        return self.source_tree
 
     def check_if_in_trap(self,pos):
         for trap_num, trap_loc in enumerate(self.param['source_locations']):
@@ -42,10 +79,28 @@ class FakeDiffusionOdorField(object):
         return flag 
 
 
+    def trap_index(self,x,y):
+        """
+        Vectorized version of check_if_in_trap. Returns array of trap numbers
+        for positions x,y, or -1 for positions which are not in a trap. As
+        with check_if_in_trap the first matching trap is returned.
+        """
+        trap_num = scipy.full(x.shape, -1, dtype=int)
+        dtype = scipy.result_type(x, y)
+        dist = scipy.empty(x.shape, dtype=dtype)
+        work = scipy.empty(x.shape, dtype=dtype)
+        for num, trap_loc in reversed(list(enumerate(self.param['source_locations']))):
+            distance((x,y), trap_loc, out=(dist, work))
+            trap_num[dist <= self.param['trap_radius']] = num
+        return trap_num
+
+
     def value(self,t,x,y):
         """
         Returns odor concentration as a function of time and position.
         Note: in this implementation time is current ignored.
+
+        With the far_field param array values are approximated (see SourceTree).
         """
         # Extract parameters
         wind_angle = self.param['wind_field'].angle
@@ -59,14 +114,24 @@ class FakeDiffusionOdorField(object):
         if type(x) == scipy.ndarray:
             if x.shape != y.shape:
                 raise RuntimeError, 'shape of x and y must be the same'
-            odor_value = scipy.zeros(x.shape) 
+            if self.param['far_field'] is not None:
+                return self.get_source_tree().value(x,y).astype(self.dtype)
+            # Keep all array math in self.dtype - constants are cast so that
+            # they don't upcast the arrays.
+            dtype = self.dtype.type
+            x = x.astype(self.dtype, copy=False)
+            y = y.astype(self.dtype, copy=False)
+            odor_value = scipy.zeros(x.shape, dtype=self.dtype) 
+            # Positions in the wind frame (and work arrays) reused for all sources
+            buffers = tuple(scipy.empty(x.shape, dtype=self.dtype) for i in range(4))
             for src_loc, src_val in zip(source_locations,source_strengths):
-                xx, yy = shift_and_rotate((x,y), src_loc, -wind_angle)
-                tt = xx/wind_speed
+                xx, yy = shift_and_rotate((x,y), src_loc, -wind_angle, out=buffers)
+                tt = xx/dtype(wind_speed)
                 mask = tt >= 0
-                term_0 = src_val*scipy.sqrt(4.0*scipy.pi*dcoeff*epsilon)
-                term_1 = 1.0/scipy.sqrt(4.0*dcoeff*scipy.pi*(tt[mask]+epsilon))
-                term_2 = scipy.exp((-yy[mask]**2)/(4.0*dcoeff*(tt[mask]+epsilon)))
+                tt_eps = tt[mask] + dtype(epsilon)
+                term_0 = dtype(src_val*scipy.sqrt(4.0*scipy.pi*dcoeff*epsilon))
+                term_1 = dtype(1.0)/numpy.sqrt(dtype(4.0*dcoeff*scipy.pi)*tt_eps)
+                term_2 = scipy.exp((-yy[mask]**2)/(dtype(4.0*dcoeff)*tt_eps))
                 odor_value[mask] +=  term_0*term_1*term_2
         else:
             odor_value = 0.0
@@ -83,6 +148,56 @@ class FakeDiffusionOdorField(object):
         return odor_value
 
 
+    def max_value_bound(self,x0,y0,x1,y1,margin=0.0):
+        """
+        Returns array of upper bounds on the odor value along the straight
+        line segments from x0,y0 to x1,y1, including positions within margin
+        of the segments. Computed in self.dtype and vectorized over sources.
+
+        Each source's value is bounded over the segment's bounding box in the
+        wind frame: for tau = tt + epsilon in [tau_lo, tau_hi] (from the box's
+        downwind extent) and the box's smallest yy**2 the source's value
+
+          strength*sqrt(epsilon/tau)*exp(-yy**2/(4*D*tau))
+
+        has its maximum over tau at tau = yy**2/(2*D), clipped to [tau_lo, tau_hi].
+        With the far_field param values are approximated and no bound (inf) is given.
+        """
+        x0 = scipy.asarray(x0, dtype=self.dtype)
+        if self.param['far_field'] is not None:
+            return scipy.full(x0.shape, scipy.inf, dtype=self.dtype)
+        dtype = self.dtype.type
+        wind_speed = dtype(self.param['wind_field'].speed)
+        dcoeff = dtype(self.param['diffusion_coeff'])
+        epsilon = dtype(self.param['epsilon'])
+        margin = dtype(margin)
+        angle = -self.param['wind_field'].angle
+
+        # End points and sources in the wind frame 
+        xx0, yy0 = rotate_vecs(x0, scipy.asarray(y0, dtype=self.dtype), angle)
+        xx1, yy1 = rotate_vecs(scipy.asarray(x1, dtype=self.dtype), scipy.asarray(y1, dtype=self.dtype), angle)
+        source_locations = scipy.array(self.param['source_locations'], dtype=self.dtype).reshape(-1,2)
+        source_strengths = scipy.array(self.param['source_strengths'], dtype=self.dtype)
+        xs, ys = rotate_vecs(source_locations[:,0], source_locations[:,1], angle)
+
+        bound = scipy.zeros(x0.shape, dtype=self.dtype)
+        for i in range(0, x0.shape[0], self.BoundChunkSize):
+            chunk = slice(i, i + self.BoundChunkSize)
+            xx_lo = scipy.minimum(xx0[chunk], xx1[chunk])[:,None] - margin - xs
+            xx_hi = scipy.maximum(xx0[chunk], xx1[chunk])[:,None] + margin - xs
+            yy_lo = scipy.minimum(yy0[chunk], yy1[chunk])[:,None] - margin - ys
+            yy_hi = scipy.maximum(yy0[chunk], yy1[chunk])[:,None] + margin - ys
+            tau_lo = scipy.maximum(xx_lo, dtype(0.0))/wind_speed + epsilon
+            tau_hi = scipy.maximum(xx_hi, dtype(0.0))/wind_speed + epsilon
+            yy_sq = scipy.minimum(yy_lo**2, yy_hi**2)
+            yy_sq[(yy_lo <= 0) & (yy_hi >= 0)] = dtype(0.0)
+            tau = scipy.clip(yy_sq/(dtype(2.0)*dcoeff), tau_lo, tau_hi)
+            value = source_strengths*numpy.sqrt(epsilon/tau)*scipy.exp(-yy_sq/(dtype(4.0)*dcoeff*tau))
+            value[xx_hi < 0] = dtype(0.0)
+            bound[chunk] = value.sum(axis=1)
+        return bound
+
+
     def plot(self, plot_param):
         xlim = plot_param['xlim']
         ylim = plot_param['ylim'] 
@@ -101,15 +216,23 @@ class FakeDiffusionOdorField(object):
         except KeyError:
             fignums = (1,2)
 
-        x_values = scipy.linspace(xlim[0], xlim[1], xnum)
-        y_values = scipy.linspace(ylim[0], ylim[1], ynum)
-        x_mesh, y_mesh = scipy.meshgrid(x_values,y_values,indexing='xy')
-        odor_value = self.value(0.0,x_mesh.flatten(), y_mesh.flatten())
-        odor_value = scipy.reshape(odor_value,x_mesh.shape)
-        odor_value = scipy.flipud(odor_value)
+        try:
+            raster = plot_param['raster']
+        except KeyError:
+            raster = None
+
+        if raster is not None:
+            odor_value, extent = raster.render(xlim, ylim, xnum, ynum)
+        else:
+            x_values = scipy.linspace(xlim[0], xlim[1], xnum)
+            y_values = scipy.linspace(ylim[0], ylim[1], ynum)
+            x_mesh, y_mesh = scipy.meshgrid(x_values,y_values,indexing='xy')
+            odor_value = self.value(0.0,x_mesh.ravel(), y_mesh.ravel())
+            odor_value = odor_value.reshape(x_mesh.shape)
+            extent = (xlim[0],xlim[1],ylim[0],ylim[1])
 
         plt.figure(fignums[0])
-        plt.imshow(odor_value, extent=(xlim[0],xlim[1],ylim[0],ylim[1]),cmap=cmap)
+        plt.imshow(odor_value, extent=extent, origin='lower', cmap=cmap)
         for x,y in self.param['source_locations']:
             #plt.plot([x],[y],'ok')
             s = scipy.linspace(0,2.0*scipy.pi,100)
@@ -125,7 +248,7 @@ class FakeDiffusionOdorField(object):
         if threshold is not None:
             plt.figure(fignums[1])
             odor_thresh = odor_value >= threshold 
-            plt.imshow(odor_thresh, extent=(xlim[0],xlim[1],ylim[0],ylim[1]),cmap=cmap)
+            plt.imshow(odor_thresh, extent=extent, origin='lower', cmap=cmap)
             for x,y in self.param['source_locations']:
                 plt.plot([x],[y],'.k')
 
@@ -136,7 +259,140 @@ class FakeDiffusionOdorField(object):
             plt.title('Odor Concentration >= {0}'.format(threshold))
 
 
+class SourceTreeNode(object):
+
+    def __init__(self, index, xs, ys, strengths):
+        self.index = index
+        self.children = []
+        strength = strengths[index]
+        self.strength = strength.sum()
+        self.count = index.shape[0]
+        self.x_min = xs[index].min()
+        self.x_max = xs[index].max()
+        self.y_min = ys[index].min()
+        self.y_max = ys[index].max()
+        self.y_center = (strength*ys[index]).sum()/self.strength
+        self.x_center = (strength*xs[index]).sum()/self.strength
+        self.y_var = (strength*(ys[index] - self.y_center)**2).sum()/self.strength
+        self.y_extent = max(self.y_max - self.y_center, self.y_center - self.y_min)
+
+
+class SourceTree(object):
+    """
+
+    Approximate evaluation of the odor field for many sources (in the spirit
+    of Barnes-Hut).
+
+    Sources are kept in a k-d tree in the wind frame. Far downwind of a
+    cluster of sources the sum of their plumes is approximated by one merged
+    Gaussian plume - same total mass, centered on the strength weighted
+    center of the cluster, with lateral variance 2*D*tau + var_y where var_y
+    is the strength weighted lateral variance of the sources. A cluster is
+    merged for a fly when the fly is downwind of all of its sources and
+
+      cluster lateral extent <= opening_ratio*sqrt(2*D*tau_near)
+      cluster downwind extent <= opening_ratio*(downwind distance to nearest source)
+
+    otherwise its children are visited (sources in leaves are evaluated
+    exactly). Clusters whose contribution is bounded by atol*count/N (N the
+    total number of sources) are skipped, so skipped clusters add at most
+    atol in total.
 
+    opening_ratio is a geometric criterion (as the opening angle of
+    Barnes-Hut) and does not bound the error of merged clusters - smaller
+    ratios give smaller errors at a higher cost. Only atol bounds an error.
 
+    """
 
+    def __init__(self, source_locations, source_strengths, wind_angle, wind_speed, dcoeff, epsilon, param):
+        self.param = param
+        self.wind_speed = wind_speed
+        self.dcoeff = dcoeff
+        self.epsilon = epsilon
+        self.cos_angle = scipy.cos(-wind_angle)
+        self.sin_angle = scipy.sin(-wind_angle)
+        self.key = None
+        locations = scipy.array(source_locations, dtype=float).reshape(-1,2)
+        self.strengths = scipy.array(source_strengths, dtype=float)
+        self.xs, self.ys = self.rotate(locations[:,0], locations[:,1])
+        self.num_sources = self.strengths.shape[0]
+        self.root = self.build(scipy.arange(self.num_sources))
 
+    def rotate(self, x, y):
+        xx = self.cos_angle*x - self.sin_angle*y
+        yy = self.sin_angle*x + self.cos_angle*y
+        return xx, yy
+
+    def build(self, index):
+        node = SourceTreeNode(index, self.xs, self.ys, self.strengths)
+        if index.shape[0] > self.param['leaf_size']:
+            # Split at the median along the direction of largest extent
+            if node.x_max - node.x_min >= node.y_max - node.y_min:
+                values = self.xs[index]
+            else:
+                values = self.ys[index]
+            order = scipy.argsort(values, kind='mergesort')
+            half = index.shape[0]//2
+            node.children = [self.build(index[order[:half]]), self.build(index[order[half:]])]
+        return node
+
+    def value(self, x, y):
+        xx, yy = self.rotate(scipy.asarray(x, dtype=float), scipy.asarray(y, dtype=float))
+        odor_value = scipy.zeros(xx.shape)
+        dcoeff = self.dcoeff
+        epsilon = self.epsilon
+        wind_speed = self.wind_speed
+        opening_ratio = self.param['opening_ratio']
+        atol = self.param['atol']
+        stack = [(self.root, scipy.arange(xx.shape[0]))]
+        while stack:
+            node, index = stack.pop()
+            if index.shape[0] == 0:
+                continue
+            xn = xx[index]
+            yn = yy[index]
+
+            # Flies upwind of all sources get nothing, bound contribution of the rest 
+            dx_near = xn - node.x_max
+            dx_far = xn - node.x_min
+            tau_near = scipy.maximum(dx_near, 0.0)/wind_speed + epsilon
+            tau_far = scipy.maximum(dx_far, 0.0)/wind_speed + epsilon
+            dy = scipy.maximum(scipy.maximum(node.y_min - yn, yn - node.y_max), 0.0)
+            bound = node.strength*scipy.sqrt(epsilon/tau_near)*scipy.exp(-dy**2/(4.0*dcoeff*tau_far))
+            mask = (dx_far >= 0) & (bound > atol*node.count/self.num_sources)
+
+            # Merged Gaussian for clusters far enough downwind
+            mask_far = mask & (dx_near > 0)
+            mask_far &= node.y_extent**2 <= opening_ratio**2*2.0*dcoeff*tau_near
+            mask_far &= node.x_max - node.x_min <= opening_ratio*dx_near
+            if mask_far.any():
+                tau = (xn[mask_far] - node.x_center)/wind_speed + epsilon
+                var = 2.0*dcoeff*tau + node.y_var
+                mass = node.strength*scipy.sqrt(4.0*scipy.pi*dcoeff*epsilon)
+                odor_value[index[mask_far]] += mass/scipy.sqrt(2.0*scipy.pi*var)*scipy.exp(
+                        -(yn[mask_far] - node.y_center)**2/(2.0*var))
+
+            index = index[mask & ~mask_far]
+            if node.children:
+                for child in node.children:
+                    stack.append((child, index))
+            elif index.shape[0] > 0:
+                odor_value[index] += self.exact_value(node.index, xx[index], yy[index])
+        return odor_value
+
+    def exact_value(self, source_index, xx, yy):
+        """
+        Exact odor value of sources source_index at wind frame positions xx, yy.
+        """
+        dcoeff = self.dcoeff
+        epsilon = self.epsilon
+        odor_value = scipy.zeros(xx.shape)
+        for i in source_index:
+            tt = (xx - self.xs[i])/self.wind_speed
+            mask = tt >= 0
+            tt_eps = tt[mask] + epsilon
+            term_0 = self.strengths[i]*scipy.sqrt(4.0*scipy.pi*dcoeff*epsilon)
+            term_1 = 1.0/scipy.sqrt(4.0*dcoeff*scipy.pi*tt_eps)
+            term_2 = scipy.exp(-(yy[mask] - self.ys[i])**2/(4.0*dcoeff*tt_eps))
+            odor_value[mask] += term_0*term_1*term_2
+        return odor_value
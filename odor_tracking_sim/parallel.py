@@ -0,0 +1,188 @@
+from __future__ import print_function
+import traceback
+import multiprocessing
+import scipy
+
+
+class SharedFieldEvaluator(object):
+    """
+
+    Parallel evaluation of the odor and wind fields at the positions of a
+    (large) swarm of flies.
+
+    The swarm's positions and the field values are kept in shared memory
+    (multiprocessing.RawArray) and a set of persistent worker processes each
+    evaluate the fields for their own slice of flies in place. Per step only a
+    tiny message (field name and time) is sent to each worker and an
+    acknowledgement is sent back - no arrays are pickled.
+
+    Use the proxy fields odor_field and wind_field in place of the original
+    fields when updating the swarm, e.g.
+
+        evaluator = SharedFieldEvaluator(swarm, wind_field, odor_field)
+        run_swarm(swarm, evaluator.wind_field, evaluator.odor_field, t_stop, dt)
+        evaluator.close()
+
+    The arrays returned by the proxy fields are the shared output arrays and
+    are only valid until the next evaluation.
+
+    """
+
+    DefaultParam = {
+            'num_workers' : None,
+            }
+
+    TypeCodes = {scipy.dtype(scipy.float64): 'd', scipy.dtype(scipy.float32): 'f'}
+
+    def __init__(self, swarm, wind_field, odor_field, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.wind_field_serial = wind_field
+        self.odor_field_serial = odor_field
+        self.dtype = scipy.dtype(swarm.dtype)
+        if self.dtype not in self.TypeCodes:
+            raise ValueError('dtype must be float64 or float32')
+
+        # Shared positions and outputs
+        self.names = ('x', 'y', 'odor', 'x_wind', 'y_wind')
+        self.raw_arrays = {}
+        for name in self.names:
+            raw = multiprocessing.RawArray(self.TypeCodes[self.dtype], swarm.size)
+            self.raw_arrays[name] = raw
+            setattr(self, name, scipy.frombuffer(raw, dtype=self.dtype))
+        self.attach(swarm)
+
+        num_workers = self.param['num_workers']
+        if num_workers is None:
+            num_workers = multiprocessing.cpu_count()
+        bounds = scipy.linspace(0, swarm.size, num_workers + 1).astype(int)
+        self.connections = []
+        self.workers = []
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                    target=field_worker,
+                    args=(child_conn, self.raw_arrays, self.dtype, start, stop, wind_field, odor_field)
+                    )
+            worker.daemon = True
+            worker.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.workers.append(worker)
+
+        self.odor_field = SharedOdorField(self)
+        self.wind_field = SharedWindField(self)
+
+    def attach(self, swarm):
+        """
+        Copy the swarm's positions into shared memory and rebind the swarm's
+        x_position and y_position to the shared arrays.
+        """
+        self.x[:] = swarm.x_position
+        self.y[:] = swarm.y_position
+        swarm.x_position = self.x
+        swarm.y_position = self.y
+
+    def is_shared(self, x, y):
+        return x is self.x and y is self.y
+
+    def evaluate(self, name, t):
+        """
+        Evaluate field name ('odor' or 'wind') at time t and the shared positions.
+        """
+        for conn in self.connections:
+            conn.send((name, t))
+        error_list = []
+        for conn in self.connections:
+            error = conn.recv()
+            if error is not None:
+                error_list.append(error)
+        if error_list:
+            raise RuntimeError('field worker failed:\n{0}'.format(error_list[0]))
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (IOError, OSError):
+                pass
+        for worker in self.workers:
+            worker.join()
+        self.connections = []
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class SharedOdorField(object):
+    """
+    Odor field proxy evaluating values at the shared positions in parallel.
+    Other positions and attributes are passed through to the original field.
+    """
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+    def __getattr__(self, name):
+        return getattr(self.evaluator.odor_field_serial, name)
+
+    def value(self, t, x, y):
+        if not self.evaluator.is_shared(x, y):
+            return self.evaluator.odor_field_serial.value(t, x, y)
+        self.evaluator.evaluate('odor', t)
+        return self.evaluator.odor
+
+
+class SharedWindField(object):
+    """
+    Wind field proxy evaluating values at the shared positions in parallel.
+    Other positions and attributes are passed through to the original field.
+    """
+
+    def __init__(self, evaluator):
+        self.evaluator = evaluator
+
+    def __getattr__(self, name):
+        return getattr(self.evaluator.wind_field_serial, name)
+
+    def value(self, t, x, y):
+        if not self.evaluator.is_shared(x, y):
+            return self.evaluator.wind_field_serial.value(t, x, y)
+        self.evaluator.evaluate('wind', t)
+        return self.evaluator.x_wind, self.evaluator.y_wind
+
+
+def field_worker(conn, raw_arrays, dtype, start, stop, wind_field, odor_field):
+    """
+    Worker loop - evaluates fields for flies start:stop in place until sent None.
+    """
+    arrays = dict((name, scipy.frombuffer(raw, dtype=dtype)[start:stop]) for name, raw in raw_arrays.items())
+    x = arrays['x']
+    y = arrays['y']
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        if msg is None:
+            break
+        name, t = msg
+        try:
+            if name == 'odor':
+                arrays['odor'][:] = odor_field.value(t, x, y)
+            elif name == 'wind':
+                x_wind, y_wind = wind_field.value(t, x, y)
+                arrays['x_wind'][:] = x_wind
+                arrays['y_wind'][:] = y_wind
+            else:
+                raise ValueError('unknown field {0}'.format(name))
+        except Exception:
+            conn.send(traceback.format_exc())
+        else:
+            conn.send(None)
+    conn.close()
+
@@ -0,0 +1,196 @@
+from __future__ import print_function
+import math
+import threading
+import collections
+import multiprocessing.pool
+import scipy
+
+
+class TiledOdorRaster(object):
+    """
+    Tile based, multi-resolution raster of an odor field.
+
+    The plane is divided into square tiles of tile_size x tile_size pixels. At
+    level 0 a tile covers base_tile_extent meters, and each level halves the
+    tile extent, so tile (level, ix, iy) covers four tiles at level+1.  Tiles
+    are computed on demand in parallel, kept in an LRU cache and reused across
+    zoom levels: a tile whose four children are already cached is obtained by
+    2x2 averaging of the children rather than by evaluating the field.
+
+    Images are returned with rows ordered by increasing y and should be
+    displayed with imshow(..., origin='lower').
+
+    """
+
+    DefaultParam = {
+            'tile_size'        : 256,
+            'base_tile_extent' : 4096.0,
+            'origin'           : (0.0, 0.0),
+            'max_level'        : 12,
+            'cache_size'       : 256,
+            'num_workers'      : 4,
+            'time'             : 0.0,
+            }
+
+    def __init__(self, odor_field, param={}):
+        self.odor_field = odor_field
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.cache = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.num_computed = 0
+        self.num_derived = 0
+
+    def tile_extent(self, level):
+        return self.param['base_tile_extent']/2.0**level
+
+    def pixel_size(self, level):
+        return self.tile_extent(level)/self.param['tile_size']
+
+    def choose_level(self, xlim, ylim, xnum, ynum):
+        """
+        Returns coarsest level whose pixels are no larger than the requested pixels.
+        """
+        pixel = min((xlim[1] - xlim[0])/float(xnum), (ylim[1] - ylim[0])/float(ynum))
+        level = int(math.ceil(math.log(self.pixel_size(0)/pixel, 2.0)))
+        return min(max(level, 0), self.param['max_level'])
+
+    def tile_range(self, lim, level, axis):
+        extent = self.tile_extent(level)
+        origin = self.param['origin'][axis]
+        i0 = int(math.floor((lim[0] - origin)/extent))
+        i1 = int(math.ceil((lim[1] - origin)/extent)) - 1
+        return i0, max(i0, i1)
+
+    def clear_cache(self):
+        with self.lock:
+            self.cache.clear()
+
+    def cached(self, key):
+        with self.lock:
+            return key in self.cache
+
+    def get_cached(self, key):
+        with self.lock:
+            try:
+                tile = self.cache.pop(key)
+            except KeyError:
+                return None
+            self.cache[key] = tile
+            return tile
+
+    def put_cached(self, key, tile):
+        with self.lock:
+            self.cache.pop(key, None)
+            self.cache[key] = tile
+            while len(self.cache) > self.param['cache_size']:
+                self.cache.popitem(last=False)
+
+    def compute_tile(self, key):
+        """
+        Compute tile from its cached children if possible, otherwise by
+        evaluating the odor field at the tile's pixel centers.
+        """
+        level, ix, iy = key
+        if level < self.param['max_level']:
+            children = [self.get_cached((level+1, 2*ix+i, 2*iy+j)) for j in (0,1) for i in (0,1)]
+            if all(child is not None for child in children):
+                return self.derive_from_children(children)
+
+        tile_size = self.param['tile_size']
+        extent = self.tile_extent(level)
+        pixel = extent/tile_size
+        x0 = self.param['origin'][0] + ix*extent
+        y0 = self.param['origin'][1] + iy*extent
+        x_values = x0 + pixel*(scipy.arange(tile_size) + 0.5)
+        y_values = y0 + pixel*(scipy.arange(tile_size) + 0.5)
+        x_mesh, y_mesh = scipy.meshgrid(x_values, y_values, indexing='xy')
+        odor_value = self.odor_field.value(self.param['time'], x_mesh.ravel(), y_mesh.ravel())
+        self.num_computed += 1
+        return odor_value.reshape(x_mesh.shape)
+
+    def derive_from_children(self, children):
+        """
+        Parent tile from 2x2 block average of its children (ordered lower left,
+        lower right, upper left, upper right).
+        """
+        n = self.param['tile_size']
+        mosaic = scipy.empty((2*n, 2*n), dtype=children[0].dtype)
+        mosaic[:n,:n], mosaic[:n,n:], mosaic[n:,:n], mosaic[n:,n:] = children
+        self.num_derived += 1
+        return mosaic.reshape(n, 2, n, 2).mean(axis=(1,3))
+
+    def get_tiles(self, keys):
+        """
+        Returns dictionary of tiles for the given keys, computing missing tiles
+        in parallel.
+        """
+        tiles = {}
+        missing = []
+        for key in keys:
+            tile = self.get_cached(key)
+            if tile is None:
+                missing.append(key)
+            else:
+                tiles[key] = tile
+        if len(missing) > 1 and self.param['num_workers'] > 1:
+            if self.pool is None:
+                self.pool = multiprocessing.pool.ThreadPool(self.param['num_workers'])
+            computed = self.pool.map(self.compute_tile, missing)
+        else:
+            computed = [self.compute_tile(key) for key in missing]
+        for key, tile in zip(missing, computed):
+            self.put_cached(key, tile)
+            tiles[key] = tile
+        return tiles
+
+    def render(self, xlim, ylim, xnum=500, ynum=500, level=None):
+        """
+        Returns odor image covering xlim, ylim at a resolution of at least
+        xnum x ynum pixels and the image extent (xmin, xmax, ymin, ymax).
+        """
+        if level is None:
+            level = self.choose_level(xlim, ylim, xnum, ynum)
+        tile_size = self.param['tile_size']
+        extent = self.tile_extent(level)
+        pixel = extent/tile_size
+        ix0, ix1 = self.tile_range(xlim, level, 0)
+        iy0, iy1 = self.tile_range(ylim, level, 1)
+        keys = [(level, ix, iy) for iy in range(iy0, iy1+1) for ix in range(ix0, ix1+1)]
+        tiles = self.get_tiles(keys)
+
+        mosaic = scipy.empty(((iy1-iy0+1)*tile_size, (ix1-ix0+1)*tile_size))
+        for (_, ix, iy), tile in tiles.items():
+            row = (iy - iy0)*tile_size
+            col = (ix - ix0)*tile_size
+            mosaic[row:row+tile_size, col:col+tile_size] = tile
+
+        # Crop mosaic to requested limits (snapped to pixel edges)
+        x_mosaic = self.param['origin'][0] + ix0*extent
+        y_mosaic = self.param['origin'][1] + iy0*extent
+        col0 = max(int(math.floor((xlim[0] - x_mosaic)/pixel)), 0)
+        col1 = min(int(math.ceil((xlim[1] - x_mosaic)/pixel)), mosaic.shape[1])
+        row0 = max(int(math.floor((ylim[0] - y_mosaic)/pixel)), 0)
+        row1 = min(int(math.ceil((ylim[1] - y_mosaic)/pixel)), mosaic.shape[0])
+        image_extent = (
+                x_mosaic + col0*pixel,
+                x_mosaic + col1*pixel,
+                y_mosaic + row0*pixel,
+                y_mosaic + row1*pixel
+                )
+        return mosaic[row0:row1, col0:col1], image_extent
+
+    def render_threshold(self, threshold, xlim, ylim, xnum=500, ynum=500, level=None):
+        """
+        Returns boolean image of odor >= threshold derived from the cached tiles.
+        """
+        image, image_extent = self.render(xlim, ylim, xnum, ynum, level)
+        return image >= threshold, image_extent
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
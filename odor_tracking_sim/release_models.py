@@ -0,0 +1,153 @@
+from __future__ import print_function
+import os
+import scipy
+
+
+class ArrayFlySource(object):
+    """
+
+    Source of flies for StagedSwarmOfFlies from per-fly arrays, e.g. memory
+    mapped .npy files (see load_fly_source). Arrays are given as a dictionary
+    of per-fly param names (initial_heading, x_start_position, etc.) and must
+    include release_time. Missing per-fly params get the swarm's defaults.
+
+    Flies are taken in release time order and only the taken batch is read
+    into memory. If release_time isn't sorted an index sorted by release time
+    is kept (one integer and one float per fly). Fly ids are the indices into
+    the arrays.
+
+    """
+
+    DefaultParam = {
+            'chunk_size' : 1000000,
+            }
+
+    def __init__(self, arrays, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        if 'release_time' not in arrays:
+            raise ValueError('arrays must include release_time')
+        self.arrays = dict(arrays)
+        self.size = self.arrays['release_time'].shape[0]
+        for name, array in self.arrays.items():
+            if array.shape != (self.size,):
+                raise ValueError('{0}.shape must equal release_time.shape'.format(name))
+        if is_sorted(self.arrays['release_time'], self.param['chunk_size']):
+            self.order = None
+            self.release_time = self.arrays['release_time']
+        else:
+            self.order = scipy.argsort(self.arrays['release_time'], kind='mergesort')
+            self.release_time = scipy.asarray(self.arrays['release_time'])[self.order]
+        self.position = 0
+
+    @property
+    def num_remaining(self):
+        return self.size - self.position
+
+    def take(self, t_until):
+        """
+        Returns dictionary of per-fly arrays (and fly_id) for the next flies
+        with release_time < t_until, or None if there are no such flies.
+        """
+        stop = int(scipy.searchsorted(self.release_time, t_until, side='left'))
+        if stop <= self.position:
+            return None
+        if self.order is None:
+            index = slice(self.position, stop)
+            fly_id = scipy.arange(self.position, stop)
+        else:
+            index = scipy.sort(self.order[self.position:stop])
+            fly_id = index
+        batch = dict((name, scipy.array(array[index])) for name, array in self.arrays.items())
+        batch['fly_id'] = fly_id
+        self.position = stop
+        return batch
+
+
+class GeneratorFlySource(object):
+    """
+
+    Source of flies for StagedSwarmOfFlies from an iterable (e.g. a generator)
+    of batches. Each batch is a dictionary of per-fly arrays which must include
+    release_time, and release times must be non-decreasing over the whole
+    stream. Only the batches needed so far are pulled from the iterable. Fly
+    ids count flies in the order they are generated.
+
+    """
+
+    def __init__(self, batches):
+        self.batches = iter(batches)
+        self.pending = None
+        self.next_fly_id = 0
+        self.last_release_time = -scipy.inf
+        self.exhausted = False
+
+    def next_pending(self):
+        try:
+            batch = dict(next(self.batches))
+        except StopIteration:
+            self.exhausted = True
+            return None
+        if 'release_time' not in batch:
+            raise ValueError('batches must include release_time')
+        release_time = scipy.asarray(batch['release_time'])
+        num = release_time.shape[0]
+        if num > 0:
+            if release_time[0] < self.last_release_time or scipy.any(scipy.diff(release_time) < 0):
+                raise ValueError('release_time must be non-decreasing')
+            self.last_release_time = release_time[-1]
+        batch = dict((name, scipy.asarray(value)) for name, value in batch.items())
+        batch['fly_id'] = scipy.arange(self.next_fly_id, self.next_fly_id + num)
+        self.next_fly_id += num
+        return batch
+
+    def take(self, t_until):
+        """
+        Returns dictionary of per-fly arrays (and fly_id) for the next flies
+        with release_time < t_until, or None if there are no such flies.
+        """
+        pieces = []
+        while not self.exhausted:
+            if self.pending is None:
+                self.pending = self.next_pending()
+                if self.pending is None:
+                    break
+            split = int(scipy.searchsorted(self.pending['release_time'], t_until, side='left'))
+            if split > 0:
+                pieces.append(dict((name, value[:split]) for name, value in self.pending.items()))
+            if split < self.pending['release_time'].shape[0]:
+                self.pending = dict((name, value[split:]) for name, value in self.pending.items())
+                break
+            self.pending = None
+        if not pieces:
+            return None
+        return dict((name, scipy.concatenate([piece[name] for piece in pieces])) for name in pieces[0])
+
+
+def load_fly_source(filenames, param={}):
+    """
+    Returns ArrayFlySource of memory mapped .npy files. filenames is either
+    a dictionary of per-fly param names and filenames or a directory with
+    files named <name>.npy.
+    """
+    if not isinstance(filenames, dict):
+        directory = filenames
+        filenames = {}
+        for item in os.listdir(directory):
+            name, ext = os.path.splitext(item)
+            if ext == '.npy':
+                filenames[name] = os.path.join(directory, item)
+    arrays = dict((name, scipy.load(filename, mmap_mode='r')) for name, filename in filenames.items())
+    return ArrayFlySource(arrays, param)
+
+
+def is_sorted(array, chunk_size):
+    """
+    Checks (in chunks, for memory mapped arrays) if array is non-decreasing.
+    """
+    for start in range(0, array.shape[0], chunk_size):
+        chunk = scipy.asarray(array[start:start + chunk_size + 1])
+        if scipy.any(scipy.diff(chunk) < 0):
+            return False
+    return True
+
@@ -0,0 +1,232 @@
+from __future__ import print_function
+import json
+import hashlib
+import scipy
+
+import wind_models
+import odor_models
+import swarm_models
+import event_log as event_log_models
+import utility
+
+
+# Default scenario spec, see run_simulation.py. Specs are plain (json
+# serializable) dictionaries so they can be queued, sent over sockets and used
+# as cache keys. Each section of a spec is merged on top of the corresponding
+# section of DefaultScenario. Source types:
+#  * circle - number, radius, strength (see utility.create_circle_of_sources)
+#  * grid   - x_num, y_num, x_range, y_range, strength (see utility.create_grid_of_sources)
+#  * list   - locations, strengths
+DefaultScenario = {
+        'wind'    : {
+            'speed' : 0.5,
+            'angle' : scipy.radians(25.0),
+            },
+        'sources' : {
+            'type'     : 'circle',
+            'number'   : 6,
+            'radius'   : 1000.0,
+            'strength' : 10.0,
+            },
+        'odor'    : {
+            'diffusion_coeff' : 0.25,
+            'epsilon'         : 0.01,
+            'trap_radius'     : 50.0,
+            },
+        'swarm'   : {
+            'size'               : 5000,
+            'flight_speed'       : 0.7,
+            'release_time_mean'  : 300.0,
+            'heading_error_std'  : scipy.radians(10.0),
+            'cast_interval'      : [60.0, 1000.0],
+            'wind_slippage'      : 0.0,
+            'odor_thresholds'    : {
+                'lower': 0.002,
+                'upper': 0.004
+                },
+            'odor_probabilities' : {
+                'lower': 0.9,    # detection probability/sec of exposure
+                'upper': 0.002,  # detection probability/sec of exposure
+                },
+            },
+        'dt'      : 0.25,
+        't_stop'  : 20000.0,
+        'group'   : None,
+        }
+
+
+def get_scenario(spec={}):
+    """
+    Returns full scenario spec - spec merged on top of DefaultScenario.
+    """
+    scenario = {}
+    for key, value in DefaultScenario.items():
+        if isinstance(value, dict):
+            scenario[key] = dict(value)
+            scenario[key].update(spec.get(key, {}))
+        else:
+            scenario[key] = spec.get(key, value)
+    return scenario
+
+
+def scenario_key(spec, seed):
+    """
+    Returns hash identifying the scenario spec and seed.
+    """
+    text = json.dumps({'spec': get_scenario(spec), 'seed': seed}, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def create_sources(source_spec):
+    source_type = source_spec['type']
+    if source_type == 'circle':
+        return utility.create_circle_of_sources(
+                source_spec['number'],
+                source_spec['radius'],
+                source_spec['strength']
+                )
+    elif source_type == 'grid':
+        return utility.create_grid_of_sources(
+                source_spec['x_num'],
+                source_spec['y_num'],
+                source_spec['x_range'],
+                source_spec['y_range'],
+                source_spec['strength']
+                )
+    elif source_type == 'list':
+        location_list = [tuple(loc) for loc in source_spec['locations']]
+        return location_list, list(source_spec['strengths'])
+    else:
+        raise ValueError('unknown source type {0}'.format(source_type))
+
+
+def create_scenario(spec, seed):
+    """
+    Create wind field, odor field and swarm for scenario spec. The random
+    number generator is seeded with seed before the swarm is created.
+    """
+    scenario = get_scenario(spec)
+    wind_field = wind_models.ConstantWindField(param=dict(scenario['wind']))
+
+    location_list, strength_list = create_sources(scenario['sources'])
+    odor_param = dict(scenario['odor'])
+    odor_param.update({
+        'wind_field'       : wind_field,
+        'source_locations' : location_list,
+        'source_strengths' : strength_list,
+        })
+    odor_field = odor_models.FakeDiffusionOdorField(odor_param)
+
+    scipy.random.seed(seed)
+    swarm_spec = dict(scenario['swarm'])
+    size = swarm_spec.pop('size')
+    release_time_mean = swarm_spec.pop('release_time_mean')
+    if release_time_mean > 0:
+        release_time = scipy.random.exponential(release_time_mean,(size,))
+    else:
+        release_time = scipy.zeros((size,))
+    swarm_param = {
+            'initial_heading'  : scipy.radians(scipy.random.uniform(0.0,360.0,(size,))),
+            'x_start_position' : scipy.zeros((size,)),
+            'y_start_position' : scipy.zeros((size,)),
+            'flight_speed'     : scipy.full((size,), swarm_spec.pop('flight_speed')),
+            'release_time'     : release_time,
+            }
+    swarm_param.update(swarm_spec)
+    swarm = swarm_models.BasicSwarmOfFlies(param=swarm_param)
+    return wind_field, odor_field, swarm
+
+
+def run_scenario(spec, seed, callback=None, metrics=None, event_log=None):
+    """
+    Run scenario to completion. Returns the swarm and the odor field. If
+    event_log is given the flies' mode changes are logged to file event_log,
+    together with the scenario spec and seed (see replay_fly).
+    """
+    scenario = get_scenario(spec)
+    wind_field, odor_field, swarm = create_scenario(scenario, seed)
+    log = None
+    if event_log is not None:
+        log = event_log_models.EventLog(event_log, {'spec': scenario, 'seed': seed})
+        log.attach(swarm)
+    try:
+        swarm_models.run_swarm(
+                swarm,
+                wind_field,
+                odor_field,
+                scenario['t_stop'],
+                scenario['dt'],
+                callback=callback,
+                metrics=metrics
+                )
+    finally:
+        if log is not None:
+            log.close()
+    return swarm, odor_field
+
+
+def replay_fly(event_log, fly_id):
+    """
+    Replay the trajectory of fly fly_id of a scenario run from its event log
+    file (see run_scenario) - the fields and the swarm's params are recreated
+    from the logged scenario spec and seed, only the one fly is simulated.
+    """
+    metadata, events = event_log_models.read_event_log(event_log)
+    if 'spec' not in metadata or 'seed' not in metadata:
+        raise ValueError('event log has no scenario spec and seed')
+    scenario = get_scenario(metadata['spec'])
+    wind_field, odor_field, swarm = create_scenario(scenario, metadata['seed'])
+    return event_log_models.replay_fly(
+            events,
+            fly_id,
+            swarm.param,
+            wind_field,
+            odor_field,
+            scenario['t_stop'],
+            scenario['dt']
+            )
+
+
+def get_result(swarm, odor_field, spec, seed):
+    """
+    Returns compact dictionary of result arrays for a finished run.
+    """
+    scenario = get_scenario(spec)
+    result = {
+            'trap_num'         : swarm.trap_num,
+            't_in_trap'        : swarm.t_in_trap,
+            'release_time'     : swarm.param['release_time'],
+            'mode'             : swarm.mode.astype(scipy.int8),
+            'x_position'       : swarm.x_position,
+            'y_position'       : swarm.y_position,
+            'source_locations' : scipy.array(odor_field.param['source_locations']),
+            't_stop'           : scenario['t_stop'],
+            'seed'             : seed,
+            'spec'             : json.dumps(scenario, sort_keys=True),
+            }
+    if swarm.odor_sensor is not None:
+        result['time_in_plume'] = swarm.odor_sensor.time_in_plume
+    if swarm.domain is not None:
+        result['t_out_of_domain'] = swarm.t_out_of_domain
+    return result
+
+
+def save_result(filename, result):
+    """
+    Save result dictionary to compressed .npz file.
+    """
+    with open(filename, 'wb') as f:
+        scipy.savez_compressed(f, **result)
+
+
+def load_result(filename):
+    """
+    Load result dictionary saved with save_result. The spec is decoded from json.
+    """
+    with scipy.load(filename) as data:
+        result = dict((key, data[key]) for key in data.files)
+    for key in ('t_stop', 'seed'):
+        result[key] = result[key].item()
+    result['spec'] = json.loads(str(result['spec']))
+    return result
+
@@ -0,0 +1,119 @@
+from __future__ import print_function
+import scipy
+
+
+class OdorSensor(object):
+    """
+
+    Incremental per-fly odor sensor state for a swarm of flies.
+
+    Each step the sensor is updated in place from the odor values already
+    computed by the swarm - no history is kept so memory is O(1) per fly.  The
+    sensor state is
+
+     * ema            - exponential moving average of odor (time constant ema_time_constant)
+     * time_since_hit - time since odor was last >= hit_threshold
+     * whiff_rate     - leaky count of whiffs (odor crossing up through hit_threshold)
+                        per second with time constant whiff_time_constant
+     * time_in_plume  - total time with odor >= hit_threshold
+
+    detection_input and loss_input select the signal ('odor', 'ema' or
+    'whiff_rate') compared against the swarm's upper and lower odor thresholds.
+    Flies can only lose the plume once time_since_hit >= loss_delay.
+
+    """
+
+    DefaultParam = {
+            'ema_time_constant'   : 5.0,
+            'hit_threshold'       : 0.002,
+            'whiff_time_constant' : 30.0,
+            'detection_input'     : 'odor',
+            'loss_input'          : 'odor',
+            'loss_delay'          : 0.0,
+            }
+
+    Inputs = ('odor', 'ema', 'whiff_rate')
+
+    PerFlyState = ['ema', 'time_since_hit', 'whiff_rate', 'time_in_plume', 'is_hit', 'work', 'work_hit', 'work_mask']
+
+    def __init__(self, size, param={}, dtype=scipy.float64):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        for item in ('detection_input', 'loss_input'):
+            if self.param[item] not in self.Inputs:
+                raise ValueError('{0} must be one of {1}'.format(item, self.Inputs))
+        self.dtype = scipy.dtype(dtype)
+        self.ema = scipy.zeros((size,), dtype=self.dtype)
+        self.time_since_hit = scipy.full((size,), scipy.inf, dtype=self.dtype)
+        self.whiff_rate = scipy.zeros((size,), dtype=self.dtype)
+        self.time_in_plume = scipy.zeros((size,), dtype=self.dtype)
+        self.is_hit = scipy.zeros((size,), dtype=bool)
+        self.work = scipy.empty((size,), dtype=self.dtype)
+        self.work_hit = scipy.empty((size,), dtype=bool)
+        self.work_mask = scipy.empty((size,), dtype=bool)
+
+    @property
+    def size(self):
+        return self.ema.shape[0]
+
+    def update(self, dt, odor, mask):
+        """
+        Update sensor state in place for flies selected by mask, e.g. the
+        released flies which aren't trapped.
+        """
+        dtype = self.dtype.type
+        work = self.work
+        hit = self.work_hit
+        whiff = self.work_mask
+
+        # Exponential moving average: ema += alpha*(odor - ema)
+        alpha = dtype(1.0 - scipy.exp(-dt/self.param['ema_time_constant']))
+        scipy.subtract(odor, self.ema, out=work)
+        scipy.multiply(work, alpha, out=work)
+        scipy.add(self.ema, work, out=self.ema, where=mask)
+
+        # Hits and whiffs (rising edges of hits)
+        scipy.greater_equal(odor, self.param['hit_threshold'], out=hit)
+        scipy.logical_and(hit, mask, out=hit)
+        scipy.logical_not(self.is_hit, out=whiff)
+        scipy.logical_and(whiff, hit, out=whiff)
+
+        # Leaky whiff rate: rate = rate*exp(-dt/tau) + whiff/tau
+        whiff_time_constant = self.param['whiff_time_constant']
+        decay = dtype(scipy.exp(-dt/whiff_time_constant))
+        scipy.multiply(self.whiff_rate, decay, out=self.whiff_rate, where=mask)
+        scipy.add(self.whiff_rate, dtype(1.0/whiff_time_constant), out=self.whiff_rate, where=whiff)
+
+        # Time since last hit and total time in plume
+        scipy.add(self.time_since_hit, dtype(dt), out=self.time_since_hit, where=mask)
+        scipy.copyto(self.time_since_hit, dtype(0.0), where=hit)
+        scipy.add(self.time_in_plume, dtype(dt), out=self.time_in_plume, where=hit)
+
+        scipy.copyto(self.is_hit, hit, where=mask)
+
+    def get_signal(self, name, odor):
+        if name == 'odor':
+            return odor
+        else:
+            return getattr(self, name)
+
+    def detection_value(self, odor):
+        """
+        Returns signal used for odor detection (compared with the upper threshold).
+        """
+        return self.get_signal(self.param['detection_input'], odor)
+
+    def loss_value(self, odor):
+        """
+        Returns signal used for odor loss (compared with the lower threshold).
+        """
+        return self.get_signal(self.param['loss_input'], odor)
+
+    def loss_allowed(self):
+        """
+        Returns mask of flies which may lose the plume, or None if there is no loss delay.
+        """
+        if self.param['loss_delay'] <= 0:
+            return None
+        return self.time_since_hit >= self.param['loss_delay']
+
@@ -0,0 +1,478 @@
+from __future__ import print_function
+import os
+import sys
+import json
+import argparse
+import collections
+import threading
+import traceback
+import multiprocessing
+
+try:
+    from BaseHTTPServer import HTTPServer
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    import httplib
+except ImportError:
+    from http.server import HTTPServer
+    from http.server import BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    import http.client as httplib
+
+import scipy
+
+from .scenario import get_scenario
+from .scenario import scenario_key
+from .scenario import create_sources
+from .scenario import run_scenario
+from .scenario import get_result
+from .scenario import save_result
+from .scenario import load_result
+
+
+class SimulationService(object):
+    """
+
+    Local simulation service. Scenario runs (spec + seed, see scenario.py) are
+    submitted over HTTP and run on a bounded process pool.
+
+     * POST /runs              {"spec": {...}, "seed": 0} -> job status
+     * GET  /runs              list of job status
+     * GET  /runs/<id>         job status
+     * GET  /runs/<id>/events  stream of json lines (progress events) which
+                               ends when the job is finished
+     * GET  /runs/<id>/result  result artifact (.npz, see scenario.save_result)
+
+    Job ids are scenario_key(spec, seed) so identical submissions share a job,
+    and results are cached in cache_directory across restarts (unreadable cache
+    files are replaced by a new run). Failed jobs are run again when they are
+    resubmitted. Only the last max_finished_jobs finished jobs are kept, older
+    ones are forgotten (their results stay in the cache). The service only
+    binds to localhost by default.
+
+    """
+
+    DefaultParam = {
+            'host'              : '127.0.0.1',
+            'port'              : 8765,
+            'num_processes'     : 2,
+            'cache_directory'   : 'sim_cache',
+            'progress_interval' : 100.0,
+            'max_finished_jobs' : 1000,
+            }
+
+    def __init__(self, param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        if not os.path.isdir(self.param['cache_directory']):
+            os.makedirs(self.param['cache_directory'])
+        self.jobs = {}
+        self.finished_jobs = collections.deque()
+        self.lock = threading.Lock()
+        self.progress_queue = multiprocessing.Queue()
+        self.pool = multiprocessing.Pool(
+                self.param['num_processes'],
+                initializer=init_worker,
+                initargs=(self.progress_queue,)
+                )
+        self.progress_thread = threading.Thread(target=self.progress_loop)
+        self.progress_thread.daemon = True
+        self.progress_thread.start()
+        self.server = ServiceHTTPServer((self.param['host'], self.param['port']), ServiceRequestHandler)
+        self.server.service = self
+        self.server_thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def result_filename(self, job_id):
+        return os.path.join(self.param['cache_directory'], '{0}.npz'.format(job_id))
+
+    def submit(self, spec, seed):
+        """
+        Submit scenario run. Returns the (possibly already existing) job.
+        """
+        job_id = scenario_key(spec, seed)
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job.status != Job.Status_Failed:
+                return job
+            job = Job(job_id, get_scenario(spec), seed)
+            self.jobs[job_id] = job
+        result_filename = self.result_filename(job_id)
+        summary = None
+        if os.path.exists(result_filename):
+            try:
+                result = load_result(result_filename)
+                trap_num = result['trap_num'][result['trap_num'] >= 0]
+                num_traps = result['source_locations'].shape[0]
+                summary = {
+                    'size'        : result['trap_num'].shape[0],
+                    'trap_counts' : [int(x) for x in scipy.bincount(trap_num, minlength=num_traps)],
+                    'cached'      : True,
+                    }
+            except Exception:
+                # Truncated or corrupt cache file - the run replaces it
+                summary = None
+        if summary is not None:
+            job.finish(summary)
+            self.retire(job)
+        else:
+            self.pool.apply_async(
+                    run_job,
+                    (job_id, job.spec, seed, result_filename, self.param['progress_interval']),
+                    callback=self.on_job_done
+                    )
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def on_job_done(self, outcome):
+        job_id, summary, error = outcome
+        job = self.get_job(job_id)
+        self.retire(job)
+        if error is None:
+            job.finish(summary)
+        else:
+            job.fail(error)
+
+    def retire(self, job):
+        """
+        Add finished job to the finished jobs, forgetting the oldest finished
+        jobs beyond max_finished_jobs.
+        """
+        with self.lock:
+            self.finished_jobs.append(job)
+            while len(self.finished_jobs) > self.param['max_finished_jobs']:
+                old_job = self.finished_jobs.popleft()
+                if self.jobs.get(old_job.id) is old_job:
+                    del self.jobs[old_job.id]
+
+    def progress_loop(self):
+        while True:
+            item = self.progress_queue.get()
+            if item is None:
+                break
+            job_id, event = item
+            job = self.get_job(job_id)
+            if job is not None:
+                job.add_event(event)
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        """
+        Serve requests in a background thread.
+        """
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.pool.terminate()
+        self.pool.join()
+        self.progress_queue.put(None)
+
+
+class Job(object):
+    """
+    Scenario run submitted to the service and its progress events.
+    """
+
+    Status_Running = 'running'
+    Status_Done = 'done'
+    Status_Failed = 'failed'
+
+    def __init__(self, job_id, spec, seed):
+        self.id = job_id
+        self.spec = spec
+        self.seed = seed
+        self.status = self.Status_Running
+        self.summary = None
+        self.error = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status != self.Status_Running
+
+    def add_event(self, event):
+        """
+        Add progress event - ignored once the job is finished.
+        """
+        with self.condition:
+            if self.finished:
+                return
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def finish(self, summary):
+        with self.condition:
+            self.status = self.Status_Done
+            self.summary = summary
+            self.events.append({'event': 'done', 'summary': summary})
+            self.condition.notify_all()
+
+    def fail(self, error):
+        with self.condition:
+            self.status = self.Status_Failed
+            self.error = error
+            self.events.append({'event': 'failed', 'error': error})
+            self.condition.notify_all()
+
+    def iter_events(self, timeout=1.0):
+        """
+        Yields events as they arrive (starting with those already recorded)
+        until the job is finished.
+        """
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.events) and not self.finished:
+                    self.condition.wait(timeout)
+                new_events = self.events[index:]
+                finished = self.finished
+            for event in new_events:
+                yield event
+            index += len(new_events)
+            if finished and index >= len(self.events):
+                break
+
+    def status_dict(self):
+        return {
+                'id'      : self.id,
+                'seed'    : self.seed,
+                'status'  : self.status,
+                'summary' : self.summary,
+                'error'   : self.error,
+                }
+
+
+class ServiceHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, code=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_path_parts(self):
+        return [part for part in self.path.split('?')[0].split('/') if part]
+
+    def do_POST(self):
+        service = self.server.service
+        if self.get_path_parts() != ['runs']:
+            self.send_json({'error': 'not found'}, 404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job = service.submit(request.get('spec', {}), int(request.get('seed', 0)))
+        except Exception as err:
+            self.send_json({'error': str(err)}, 400)
+            return
+        self.send_json(job.status_dict())
+
+    def do_GET(self):
+        service = self.server.service
+        parts = self.get_path_parts()
+        if parts == ['runs']:
+            with service.lock:
+                job_list = list(service.jobs.values())
+            self.send_json([job.status_dict() for job in job_list])
+            return
+        if len(parts) < 2 or parts[0] != 'runs':
+            self.send_json({'error': 'not found'}, 404)
+            return
+        job = service.get_job(parts[1])
+        if job is None:
+            self.send_json({'error': 'unknown job'}, 404)
+        elif len(parts) == 2:
+            self.send_json(job.status_dict())
+        elif parts[2] == 'events':
+            self.send_events(job)
+        elif parts[2] == 'result':
+            self.send_result(job)
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def send_events(self, job):
+        """
+        Stream job events as json lines until the job is finished.
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        for event in job.iter_events():
+            self.wfile.write((json.dumps(event) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def send_result(self, job):
+        if job.status != Job.Status_Done:
+            self.send_json({'error': 'job {0}'.format(job.status)}, 409)
+            return
+        with open(self.server.service.result_filename(job.id), 'rb') as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class SimulationClient(object):
+    """
+    Client for SimulationService.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8765, timeout=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def request(self, method, path, body=None):
+        connection = httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        headers = {}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, path, body, headers)
+        return connection, connection.getresponse()
+
+    def request_json(self, method, path, body=None):
+        connection, response = self.request(method, path, body)
+        try:
+            data = json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError('{0} {1}: {2}'.format(method, path, data.get('error')))
+        return data
+
+    def submit(self, spec, seed):
+        return self.request_json('POST', '/runs', {'spec': spec, 'seed': seed})
+
+    def status(self, job_id):
+        return self.request_json('GET', '/runs/{0}'.format(job_id))
+
+    def events(self, job_id):
+        """
+        Yields progress events for job until it is finished.
+        """
+        connection, response = self.request('GET', '/runs/{0}/events'.format(job_id))
+        # Python 2 HTTPResponse has no readline, read lines from the socket file
+        readline = getattr(response, 'readline', None) or response.fp.readline
+        try:
+            while True:
+                line = readline()
+                if not line:
+                    break
+                yield json.loads(line.decode('utf-8'))
+        finally:
+            connection.close()
+
+    def result(self, job_id, filename):
+        """
+        Download result artifact of finished job to filename.
+        """
+        connection, response = self.request('GET', '/runs/{0}/result'.format(job_id))
+        try:
+            data = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RuntimeError('result {0}: {1}'.format(job_id, data))
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+
+# Pool worker functions
+# -------------------------------------------------------------------------------------------------
+_progress_queue = None
+
+def init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def run_job(job_id, spec, seed, result_filename, progress_interval):
+    """
+    Run scenario in pool worker, posting progress events. Returns (job_id,
+    summary, error).
+    """
+    try:
+        progress = {'t_last': 0.0}
+        num_traps = len(create_sources(spec['sources'])[0])
+
+        def callback(t, swarm):
+            if t < progress['t_last'] + progress_interval:
+                return
+            progress['t_last'] = t
+            _progress_queue.put((job_id, {
+                'event'       : 'progress',
+                't'           : t,
+                'trap_counts' : get_trap_counts(swarm, num_traps),
+                }))
+
+        swarm, odor_field = run_scenario(spec, seed, callback=callback)
+        tmp_filename = '{0}.{1}.tmp'.format(result_filename, os.getpid())
+        save_result(tmp_filename, get_result(swarm, odor_field, spec, seed))
+        os.rename(tmp_filename, result_filename)
+        summary = {
+                'size'        : swarm.size,
+                'trap_counts' : get_trap_counts(swarm, num_traps),
+                'cached'      : False,
+                }
+        return job_id, summary, None
+    except Exception:
+        return job_id, None, traceback.format_exc()
+
+
+def get_trap_counts(swarm, num_traps):
+    trap_num = swarm.trap_num[swarm.trap_num >= 0]
+    return [int(x) for x in scipy.bincount(trap_num, minlength=num_traps)]
+
+
+# Run service, e.g. python -m odor_tracking_sim.service --port 8765 --processes 4
+# -------------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='local simulation service')
+    parser.add_argument('--port', type=int, default=SimulationService.DefaultParam['port'])
+    parser.add_argument('--processes', type=int, default=SimulationService.DefaultParam['num_processes'])
+    parser.add_argument('--cache', default=SimulationService.DefaultParam['cache_directory'])
+    args = parser.parse_args()
+
+    service = SimulationService({
+        'port'            : args.port,
+        'num_processes'   : args.processes,
+        'cache_directory' : args.cache,
+        })
+    print('serving on {0}:{1}'.format(*service.address))
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+    sys.exit(0)
+
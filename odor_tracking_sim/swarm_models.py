@@ -4,6 +4,10 @@ import scipy
 from utility import unit_vector
 from utility import rotate_vecs
 from utility import distance
+from utility import take
+from sensor_models import OdorSensor
+from domain_models import PolygonDomain
+from release_models import ArrayFlySource
 
 class BasicSwarmOfFlies(object):
 
@@ -12,14 +16,16 @@ class BasicSwarmOfFlies(object):
 
     """
 
+    # Per-fly params which are None are created when the swarm is created (see
+    # get_default_per_fly_param) with the size of the given per-fly params or DefaultSize.
     DefaultSize = 500
     DefaultParam = {
-            'initial_heading'     : scipy.radians(scipy.random.uniform(0.0,360.0,(DefaultSize,))),
-            'x_start_position'    : scipy.zeros((DefaultSize,)),
-            'y_start_position'    : scipy.zeros((DefaultSize,)),
+            'initial_heading'     : None,
+            'x_start_position'    : None,
+            'y_start_position'    : None,
             'heading_error_std'   : scipy.radians(10.0),
-            'flight_speed'        : scipy.full((DefaultSize,), 0.7),
-            'release_time'        : scipy.full((DefaultSize,), 0.0),
+            'flight_speed'        : None,
+            'release_time'        : None,
             'cast_interval'       : [60.0, 1000.0],
             'wind_slippage'       : 0.0,
             'odor_thresholds'     : {
@@ -29,18 +35,55 @@ class BasicSwarmOfFlies(object):
             'odor_probabilities'  : {
                 'lower': 0.9,    # detection probability/sec of exposure
                 'upper': 0.002,  # detection probability/sec of exposure
-                } 
+                },
+            'dtype'               : scipy.float64,
+            'position_compensation' : None,
+            'odor_sensor'         : None,
+            'domain'              : None,
+            'odor_skip'           : False,
             } 
 
     Mode_FixHeading = 0
     Mode_FlyUpWind = 1
     Mode_CastForOdor = 2
     Mode_Trapped = 3
-
+    Mode_OutOfDomain = 4
+    NumModes = 5
+
+    # Odor skipping (see get_odor_value): horizons (longest first), relative
+    # tolerance on the upper threshold and distance margin (m) of predictions,
+    # interval between predictions for flies which can't skip, interval between
+    # prediction batches and interval after batches in which no fly could skip.
+    OdorSkipHorizons = (640.0, 160.0, 40.0, 10.0)
+    OdorSkipTolerance = 1.0e-4
+    OdorSkipMargin = 1.0
+    OdorPredictInterval = 10.0
+    OdorPredictBatchInterval = 5.0
+    OdorPredictBackoff = 60.0
+
+    PerFlyParam = ['initial_heading','x_start_position','y_start_position','flight_speed','release_time']
+
+    PerFlyState = [
+            'x_position', 'y_position', 'x_velocity', 'y_velocity', 'x_compensation', 'y_compensation',
+            'mode', 'heading_error', 't_last_cast', 'dt_next_cast', 'cast_sign', 'in_trap', 'trap_num',
+            'x_trap_loc', 'y_trap_loc', 't_in_trap', 't_out_of_domain', 't_odor_skip', 't_odor_predict',
+            ]
 
     def __init__(self,param={}): 
         self.param = dict(self.DefaultParam)
         self.param.update(param)
+
+        # All per-fly floating point arrays are kept in self.dtype
+        self.dtype = scipy.dtype(self.param['dtype'])
+        size = self.DefaultSize
+        for item in self.PerFlyParam:
+            if self.param[item] is not None:
+                size = scipy.shape(self.param[item])[0]
+                break
+        for item in self.PerFlyParam:
+            if self.param[item] is None:
+                self.param[item] = get_default_per_fly_param(item, size)
+            self.param[item] = scipy.asarray(self.param[item], dtype=self.dtype)
         self.check_param()
 
         self.x_position = self.param['x_start_position']
@@ -48,30 +91,72 @@ class BasicSwarmOfFlies(object):
         self.x_velocity = self.param['flight_speed']*scipy.cos(self.param['initial_heading'])
         self.y_velocity = self.param['flight_speed']*scipy.sin(self.param['initial_heading'])
 
+        # Compensated (Kahan) summation of positions, on by default for reduced precision 
+        position_compensation = self.param['position_compensation']
+        if position_compensation is None:
+            position_compensation = self.dtype.itemsize < 8
+        if position_compensation:
+            self.x_compensation = scipy.zeros((self.size,), dtype=self.dtype)
+            self.y_compensation = scipy.zeros((self.size,), dtype=self.dtype)
+        else:
+            self.x_compensation = None
+            self.y_compensation = None
+
         self.mode = scipy.full((self.size,), self.Mode_FixHeading, dtype=int)
-        self.heading_error = scipy.zeros((self.size,)) 
-        self.t_last_cast = scipy.zeros((self.size,)) 
+        self.heading_error = scipy.zeros((self.size,), dtype=self.dtype) 
+        self.t_last_cast = scipy.zeros((self.size,), dtype=self.dtype) 
 
         cast_interval = self.param['cast_interval']
         self.dt_next_cast = scipy.random.uniform(cast_interval[0], cast_interval[0], (self.size,))
+        self.dt_next_cast = self.dt_next_cast.astype(self.dtype)
         self.cast_sign = scipy.random.choice([-1,1],(self.size,))
 
         self.in_trap = scipy.full((self.size,), False, dtype=bool)
         self.trap_num = scipy.full((self.size,),-1, dtype=int)
-        self.x_trap_loc = scipy.zeros((self.size,))
-        self.y_trap_loc = scipy.zeros((self.size,))
-        self.t_in_trap = scipy.full((self.size,),scipy.inf)
+        self.x_trap_loc = scipy.zeros((self.size,), dtype=self.dtype)
+        self.y_trap_loc = scipy.zeros((self.size,), dtype=self.dtype)
+        self.t_in_trap = scipy.full((self.size,),scipy.inf, dtype=self.dtype)
+
+        # Optional per-fly sensor state (see sensor_models.OdorSensor)
+        if self.param['odor_sensor'] is not None:
+            self.odor_sensor = OdorSensor(self.size, self.param['odor_sensor'], self.dtype)
+        else:
+            self.odor_sensor = None
+
+        # Optional domain boundary and obstacles (see domain_models.PolygonDomain)
+        if self.param['domain'] is not None:
+            self.domain = PolygonDomain(self.param['domain'])
+        else:
+            self.domain = None
+        self.t_out_of_domain = scipy.full((self.size,),scipy.inf, dtype=self.dtype)
+
+        # Times until which odor evaluation is skipped and times of the next entry
+        # prediction for flies in FixHeading mode (see get_odor_value). 
+        self.t_odor_skip = scipy.full((self.size,),-scipy.inf, dtype=self.dtype)
+        self.t_odor_predict = scipy.full((self.size,),-scipy.inf, dtype=self.dtype)
+        self.t_odor_predict_batch = -scipy.inf
+
+        # Optional timer for the phases of update (see metrics.PhaseTimer)
+        self.phase_timer = None
+
+        # Optional log of mode changes (see event_log.EventLog), events are
+        # recorded with the number of the step and the fly's id.
+        self.event_log = None
+        self.step_count = 0
+        self.fly_id = scipy.arange(self.size)
 
 
     def check_param(self): 
         """
         Check parameters - mostly just that shape of ndarrays match 
         """
+        if self.param['odor_skip'] and self.param['odor_sensor'] is not None:
+            raise ValueError('odor_skip can not be used with odor_sensor')
+
         if scipy.ndim(self.param['initial_heading'].shape) > 1:
             raise(ValueError, 'initial_heading must have ndim=1')
 
-        equal_shape_list = ['x_start_position','y_start_position','flight_speed','release_time']
-        for item in equal_shape_list:
+        for item in self.PerFlyParam[1:]:
             if self.param[item].shape != self.param['initial_heading'].shape:
                 raise(ValueError, '{0}.shape must equal initial_heading.shape'.format(item))
 
@@ -85,6 +170,9 @@ class BasicSwarmOfFlies(object):
         """
         Update fly swarm one time step. 
         """
+        timer = self.phase_timer
+        if timer is not None:
+            timer.start()
 
         # Get masks for selecting fly based on mode
         mask_release = t > self.param['release_time'] 
@@ -92,32 +180,145 @@ class BasicSwarmOfFlies(object):
         mask_flyupwd = mask_release & (self.mode == self.Mode_FlyUpWind)
         mask_castfor = mask_release & (self.mode == self.Mode_CastForOdor)
 
-        # Get odor value and wind vectors at current position and time
-        odor = odor_field.value(t,self.x_position,self.y_position)
-        x_wind, y_wind = wind_field.value(t,self.x_position, self.y_position)
-        x_wind_unit, y_wind_unit = unit_vector(x_wind, y_wind)
+        # Get wind vectors and odor value at current position and time
+        # (uniform wind fields give scalars which are broadcast)
+        if getattr(wind_field, 'is_uniform', False):
+            x_wind, y_wind = wind_field.uniform_value(t)
+            x_wind_unit, y_wind_unit = wind_field.uniform_unit_vector(t)
+        else:
+            x_wind, y_wind = wind_field.value(t,self.x_position, self.y_position)
+            x_wind_unit, y_wind_unit = unit_vector(x_wind, y_wind)
         wind_uvecs = {'x': x_wind_unit,'y': y_wind_unit} 
+        if self.param['odor_skip']:
+            masks = {'release': mask_release, 'fixhead': mask_fixhead}
+            odor = self.get_odor_value(t, wind_field, odor_field, (x_wind, y_wind), masks)
+        else:
+            odor = odor_field.value(t,self.x_position,self.y_position)
+        if timer is not None:
+            timer.lap('fields')
+
+        # Update sensor state and get sensor signals used for detection and loss
+        if self.odor_sensor is not None:
+            mask_active = mask_release & (self.mode != self.Mode_Trapped)
+            mask_active &= self.mode != self.Mode_OutOfDomain
+            self.odor_sensor.update(dt, odor, mask_active)
+            odor_detect = self.odor_sensor.detection_value(odor)
+            odor_loss = self.odor_sensor.loss_value(odor)
+            mask_loss_allowed = self.odor_sensor.loss_allowed()
+        else:
+            odor_detect = odor
+            odor_loss = odor
+            mask_loss_allowed = None
 
         # Update state for flies detectoring odor plumes
         masks = {'fixhead': mask_fixhead, 'castfor': mask_castfor}
-        self.update_for_odor_detection(dt, odor, wind_uvecs, masks)
+        self.update_for_odor_detection(dt, odor_detect, wind_uvecs, masks)
 
         # Update state for files losing odor plume or already casting.  
-        masks = {'flyupwd': mask_flyupwd, 'castfor': mask_castfor}
-        self.update_for_odor_loss(t, dt, odor, wind_uvecs, masks)
+        masks = {'flyupwd': mask_flyupwd, 'castfor': mask_castfor, 'loss_allowed': mask_loss_allowed}
+        self.update_for_odor_loss(t, dt, odor_loss, wind_uvecs, masks)
+        if timer is not None:
+            timer.lap('modes')
 
         # Udate state for flies in traps
-        self.update_for_in_trap(t, odor_field)
+        self.update_for_in_trap(t, odor_field, mask_release)
+        if timer is not None:
+            timer.lap('traps')
 
         # Update position based on mode and current velocities
+        self.update_position(t, dt, mask_release, (x_wind, y_wind))
+        if timer is not None:
+            timer.lap('move')
+        self.step_count += 1
+
+
+    def update_position(self, t, dt, mask_release, wind):
+        """
+         Update positions of released flies based on mode and current velocities.
+         * Trapped and out of domain flies aren't moved.
+         * With a domain, handle flies flying into obstacles or leaving the domain.
+        """
+        x_wind, y_wind = wind
+        # Constants are cast to dtype so that scalar (uniform) wind values give
+        # the same results as per-fly wind arrays.
+        dtype = self.dtype.type
         mask_trapped = self.mode == self.Mode_Trapped
         mask_move = mask_release & (~mask_trapped)
-        self.x_position[mask_move] += dt*self.x_velocity[mask_move] 
-        self.x_position[mask_move] += dt*self.param['wind_slippage']*x_wind[mask_move]
-        self.y_position[mask_move] += dt*self.y_velocity[mask_move] 
-        self.y_position[mask_move] += dt*self.param['wind_slippage']*y_wind[mask_move]
+        if self.domain is not None:
+            mask_move &= self.mode != self.Mode_OutOfDomain
+            if self.domain.has_obstacles:
+                x_last = self.x_position[mask_move]
+                y_last = self.y_position[mask_move]
+        if self.x_compensation is None:
+            self.x_position[mask_move] += dt*self.x_velocity[mask_move] 
+            self.x_position[mask_move] += dtype(dt*self.param['wind_slippage'])*take(x_wind, mask_move)
+            self.y_position[mask_move] += dt*self.y_velocity[mask_move] 
+            self.y_position[mask_move] += dtype(dt*self.param['wind_slippage'])*take(y_wind, mask_move)
+        else:
+            wind_slippage = dtype(self.param['wind_slippage'])
+            x_step = dt*(self.x_velocity[mask_move] + wind_slippage*take(x_wind, mask_move))
+            y_step = dt*(self.y_velocity[mask_move] + wind_slippage*take(y_wind, mask_move))
+            compensated_add(self.x_position, self.x_compensation, mask_move, x_step)
+            compensated_add(self.y_position, self.y_compensation, mask_move, y_step)
+
+        if self.domain is not None:
+            if self.domain.has_obstacles:
+                self.update_for_obstacles(mask_move, x_last, y_last)
+            self.update_for_out_of_domain(t, mask_move)
 
 
+    def get_odor_value(self, t, wind_field, odor_field, wind, masks):
+        """
+         Get odor values, skipping evaluation for flies which can't detect odor
+         * Only released flies which aren't trapped (or out of the domain) need odor values.
+         * Flies in FixHeading mode fly in a straight line, so for each of the
+           OdorSkipHorizons (longest first) the odor along their path is bounded
+           (see FakeDiffusionOdorField.max_value_bound). Flies whose bound stays
+           below the upper threshold skip evaluation for that horizon, the others
+           are evaluated and predicted again after OdorPredictInterval.
+         * Predictions are made in batches every OdorPredictBatchInterval, flies
+           due for prediction (e.g. newly released) are evaluated until then.
+           After a batch in which no fly could skip (e.g. all flies are in the
+           plumes) the next batch waits OdorPredictBackoff.
+         * Skipped flies get an odor value of 0.
+        Predictions need a straight flight path - with wind slippage the wind field must be uniform.
+        """
+        x_wind, y_wind = wind
+        mask_release = masks['release']
+        mask_fixhead = masks['fixhead']
+        wind_slippage = self.param['wind_slippage']
+        predictable = wind_slippage == 0 or getattr(wind_field, 'is_uniform', False)
+
+        if predictable and t >= self.t_odor_predict_batch:
+            self.t_odor_predict_batch = t + self.OdorPredictBatchInterval
+            index = scipy.flatnonzero(mask_fixhead & (t >= self.t_odor_predict))
+            self.t_odor_skip[index] = t
+            self.t_odor_predict[index] = t + self.OdorPredictInterval
+            num_predict = index.shape[0]
+            threshold = (1.0 - self.OdorSkipTolerance)*self.param['odor_thresholds']['upper']
+            x = self.x_position[index]
+            y = self.y_position[index]
+            vx = self.x_velocity[index] + wind_slippage*take(x_wind, index)
+            vy = self.y_velocity[index] + wind_slippage*take(y_wind, index)
+            for horizon in self.OdorSkipHorizons:
+                if index.shape[0] == 0:
+                    break
+                bound = odor_field.max_value_bound(x, y, x + horizon*vx, y + horizon*vy, self.OdorSkipMargin)
+                mask_skip = bound < threshold
+                self.t_odor_skip[index[mask_skip]] = t + horizon
+                self.t_odor_predict[index[mask_skip]] = t + horizon
+                mask_keep = ~mask_skip
+                index, x, y, vx, vy = index[mask_keep], x[mask_keep], y[mask_keep], vx[mask_keep], vy[mask_keep]
+            if num_predict > 0 and index.shape[0] == num_predict:
+                self.t_odor_predict_batch = t + self.OdorPredictBackoff
+
+        mask_eval = mask_release & (self.mode != self.Mode_Trapped) & (self.mode != self.Mode_OutOfDomain)
+        mask_eval &= ~(mask_fixhead & (t < self.t_odor_skip))
+        odor_eval = odor_field.value(t, self.x_position[mask_eval], self.y_position[mask_eval])
+        odor = scipy.zeros((self.size,), dtype=odor_eval.dtype)
+        odor[mask_eval] = odor_eval
+        return odor
+
     def update_for_odor_detection(self, dt, odor, wind_uvecs, masks):
         """
          Update simulation for odor detection 
@@ -133,7 +334,7 @@ class BasicSwarmOfFlies(object):
 
         mask_gt_upper = odor >= self.param['odor_thresholds']['upper'] 
         mask_candidates = mask_gt_upper & (mask_fixhead | mask_castfor)
-        dice_roll = scipy.full((self.size,),scipy.inf)
+        dice_roll = scipy.full((self.size,),scipy.inf,dtype=self.dtype)
         dice_roll[mask_candidates] = scipy.rand(mask_candidates.sum())
 
         # Convert probabilty/sec to probabilty for time step interval dt
@@ -147,19 +348,22 @@ class BasicSwarmOfFlies(object):
 
         # Set x and y velocities for the flies which just changed to FlyUpWind.
         x_unit_change, y_unit_change = rotate_vecs(
-                x_wind_unit[mask_change],
-                y_wind_unit[mask_change],
+                take(x_wind_unit, mask_change),
+                take(y_wind_unit, mask_change),
                 self.heading_error[mask_change]
                 )
         speed = self.param['flight_speed'][mask_change]
         self.x_velocity[mask_change] = -speed*x_unit_change
         self.y_velocity[mask_change] = -speed*y_unit_change
+        if self.event_log is not None:
+            self.log_events(mask_change, 0)
 
     def update_for_odor_loss(self, t, dt, odor, wind_uvecs, masks):
         """
          Update simulation for flies which lose odor or have lost odor and are
          casting. 
-         * Find flies in FlyUpWind mode where the odor value <= lower threshold.  
+         * Find flies in FlyUpWind mode where the odor value <= lower threshold
+           (and, with a sensor loss delay, which are allowed to lose the plume).
          * Test if they lose odor (roll dice and compare with probabilty).  
          * If they lose odor change mode to CastForOdor.
          * Update velocties for flies in CastForOdor mode.
@@ -172,7 +376,9 @@ class BasicSwarmOfFlies(object):
 
         mask_lt_lower = odor <= self.param['odor_thresholds']['lower']
         mask_candidates = mask_lt_lower & mask_flyupwd
-        dice_roll = scipy.full((self.size,),scipy.inf)
+        if masks.get('loss_allowed') is not None:
+            mask_candidates &= masks['loss_allowed']
+        dice_roll = scipy.full((self.size,),scipy.inf,dtype=self.dtype)
         dice_roll[mask_candidates] = scipy.rand(mask_candidates.sum())
 
         # Convert probabilty/sec to probabilty for time step interval dt
@@ -199,23 +405,29 @@ class BasicSwarmOfFlies(object):
 
         # Set x and y velocities for new CastForOdor flies
         x_unit_change, y_unit_change = rotate_vecs(
-                x_wind_unit[mask_change],
-               -y_wind_unit[mask_change],
+                take(x_wind_unit, mask_change),
+               -take(y_wind_unit, mask_change),
                 self.heading_error[mask_change]
                 )
         speed = self.param['flight_speed'][mask_change]
         self.x_velocity[mask_change] = self.cast_sign[mask_change]*speed*x_unit_change
         self.y_velocity[mask_change] = self.cast_sign[mask_change]*speed*y_unit_change
+        if self.event_log is not None:
+            self.log_events(mask_change, self.cast_sign[mask_change])
 
 
-    def update_for_in_trap(self, t, odor_field):
+    def update_for_in_trap(self, t, odor_field, mask_release):
         """
          Update simulation for flies in traps. 
-         * If flies are in traps. If so record trap info and time.  
+         * If released flies (which haven't left the domain) are in traps. If
+           so record trap info and time.  
         """
+        mask_candidates = mask_release & (self.mode != self.Mode_OutOfDomain)
+        dist_vals = scipy.empty((self.size,), dtype=self.dtype)
+        work = scipy.empty((self.size,), dtype=self.dtype)
         for trap_num, trap_loc in enumerate(odor_field.param['source_locations']):
-            dist_vals = distance((self.x_position, self.y_position),trap_loc)
-            mask_trapped = dist_vals < odor_field.param['trap_radius']
+            distance((self.x_position, self.y_position),trap_loc,out=(dist_vals, work))
+            mask_trapped = mask_candidates & (dist_vals < odor_field.param['trap_radius'])
             self.mode[mask_trapped] = self.Mode_Trapped
             self.trap_num[mask_trapped] = trap_num 
             self.x_trap_loc[mask_trapped] = trap_loc[0]
@@ -226,30 +438,289 @@ class BasicSwarmOfFlies(object):
             # Get time stamp for newly trapped flies
             mask_newly_trapped = mask_trapped & (self.t_in_trap == scipy.inf)
             self.t_in_trap[mask_newly_trapped] = t
+            if self.event_log is not None:
+                self.log_events(mask_newly_trapped, 0)
+
+
+    def update_for_obstacles(self, mask_move, x_last, y_last):
+        """
+         Update simulation for flies which flew into obstacles.
+         * Find moving flies whose new position is inside an obstacle.
+         * Move them back to their last position and reverse their velocity.
+        """
+        index_move = scipy.flatnonzero(mask_move)
+        mask_blocked = self.domain.in_obstacle(self.x_position[index_move], self.y_position[index_move])
+        index_blocked = index_move[mask_blocked]
+        self.x_position[index_blocked] = x_last[mask_blocked]
+        self.y_position[index_blocked] = y_last[mask_blocked]
+        self.x_velocity[index_blocked] *= -1.0
+        self.y_velocity[index_blocked] *= -1.0
+        self.t_odor_predict[index_blocked] = -scipy.inf
+        self.t_odor_skip[index_blocked] = -scipy.inf
+        if self.x_compensation is not None:
+            self.x_compensation[index_blocked] = 0.0
+            self.y_compensation[index_blocked] = 0.0
+
+    def update_for_out_of_domain(self, t, mask_move):
+        """
+         Update simulation for flies leaving the domain.
+         * Find moving flies whose new position is outside of the domain boundary. 
+         * Change their mode to OutOfDomain (they are no longer moved) and record the time.
+        """
+        index_move = scipy.flatnonzero(mask_move)
+        mask_out = ~self.domain.in_domain(self.x_position[index_move], self.y_position[index_move])
+        index_out = index_move[mask_out]
+        self.mode[index_out] = self.Mode_OutOfDomain
+        self.x_velocity[index_out] = 0.0
+        self.y_velocity[index_out] = 0.0
+        self.t_out_of_domain[index_out] = t
+        if self.event_log is not None:
+            self.log_events(index_out, 0)
+
+    def log_events(self, index, sign):
+        """
+        Record mode changes of flies index (mask or indices) in the event log.
+        sign is the cast direction for flies starting a new cast and 0 otherwise.
+        """
+        fly_id = self.fly_id[index]
+        if fly_id.shape[0] == 0:
+            return
+        self.event_log.record(self.step_count, fly_id, self.mode[index], sign, self.heading_error[index])
+
+    def get_fly_values(self, name):
+        """
+        Returns array of per-fly values of name (per-fly param, state or
+        time_in_plume) for all flies.
+        """
+        if name in self.PerFlyParam:
+            return self.param[name]
+        elif name == 'time_in_plume':
+            return self.odor_sensor.time_in_plume
+        else:
+            return getattr(self, name)
 
+    @property
+    def num_flies(self):
+        """
+        Number of flies of the swarm (see StagedSwarmOfFlies).
+        """
+        return self.size
+
+    def get_mode_count(self, t):
+        """
+        Returns array (length NumModes) of the number of flies released before
+        t in each mode.
+        """
+        mask_release = t > self.param['release_time']
+        return scipy.bincount(self.mode[mask_release], minlength=self.NumModes)
 
     def get_time_trapped(self,trap_num=None):
-        mask_trapped = self.mode == self.Mode_Trapped
+        mode = self.get_fly_values('mode')
+        t_in_trap = self.get_fly_values('t_in_trap')
+        mask_trapped = mode == self.Mode_Trapped
         if trap_num is None:
-            return self.t_in_trap[mask_trapped]
+            return t_in_trap[mask_trapped]
         else:
-            mask_trapped_in_num = mask_trapped & (self.trap_num == trap_num)
-            return self.t_in_trap[mask_trapped_in_num]
+            mask_trapped_in_num = mask_trapped & (self.get_fly_values('trap_num') == trap_num)
+            return t_in_trap[mask_trapped_in_num]
 
     def get_trap_nums(self):
-        mask_trap_num_set = self.trap_num != -1
-        trap_num_array = scipy.unique(self.trap_num[mask_trap_num_set])
+        trap_num = self.get_fly_values('trap_num')
+        mask_trap_num_set = trap_num != -1
+        trap_num_array = scipy.unique(trap_num[mask_trap_num_set])
         trap_num_array.sort()
         return list(trap_num_array)
 
 
+class StagedSwarmOfFlies(BasicSwarmOfFlies):
+    """
+
+    Swarm of flies for very large populations. Per-fly params come from a fly
+    source (see release_models) - e.g. memory mapped files or a generator -
+    and flies are only materialized in the swarm's state when their release
+    time is near, in batches of release_batch_interval (simulation time)
+    ordered by release time. Trapped and out of domain flies are compacted
+    into records (RecordFields) once they make up more than compact_fraction
+    of the swarm, so the per-fly state and the cost of a step follow the
+    number of flies in flight. The records still grow with the number of
+    retired flies (len(RecordFields) values per fly).
+
+    The per-fly arrays of the swarm (and size) only cover the flies in flight,
+    use get_fly_values for all flies materialized so far (ordered by fly_id).
+    Without a source the per-fly params are used as an ArrayFlySource.
+
+    """
+
+    DefaultParam = dict(BasicSwarmOfFlies.DefaultParam)
+    DefaultParam.update({
+            'release_batch_interval' : 60.0,
+            'compact_fraction'       : 0.25,
+            })
+
+    RecordFields = ['fly_id', 'mode', 'trap_num', 't_in_trap', 't_out_of_domain', 'release_time', 'x_position', 'y_position']
+
+    def __init__(self, param={}, source=None):
+        param = dict(param)
+        if source is None:
+            arrays = dict((item, scipy.asarray(param[item])) for item in self.PerFlyParam if param.get(item) is not None)
+            source = ArrayFlySource(arrays)
+        self.source = source
+        for item in self.PerFlyParam:
+            param[item] = scipy.zeros((0,))
+        super(StagedSwarmOfFlies, self).__init__(param)
+        self.fly_id = scipy.zeros((0,), dtype=int)
+        self.t_materialized = -scipy.inf
+        self.record_fields = list(self.RecordFields)
+        if self.odor_sensor is not None:
+            self.record_fields.append('time_in_plume')
+        self.records = dict((name, []) for name in self.record_fields)
+        self.records_mode_count = scipy.zeros((self.NumModes,), dtype=int)
+
+    @property
+    def num_records(self):
+        return sum(value.shape[0] for value in self.records['fly_id'])
+
+    @property
+    def num_flies(self):
+        """
+        Number of flies materialized so far (records and flies in flight).
+        """
+        return self.num_records + self.size
+
+    def get_mode_count(self, t):
+        """
+        Returns array (length NumModes) of the number of materialized flies
+        released before t in each mode, including compacted flies.
+        """
+        mode_count = super(StagedSwarmOfFlies, self).get_mode_count(t)
+        return mode_count + self.records_mode_count
+
+    def update(self, t, dt, wind_field, odor_field):
+        """
+        Update fly swarm one time step - materializes flies released before
+        the next step first.
+        """
+        if t > self.t_materialized:
+            self.compact()
+            self.t_materialized = t + max(dt, self.param['release_batch_interval'])
+            self.materialize(self.t_materialized)
+        super(StagedSwarmOfFlies, self).update(t, dt, wind_field, odor_field)
 
+    def materialize(self, t_until):
+        """
+        Add flies with release_time < t_until from the source to the swarm.
+        """
+        batch = self.source.take(t_until)
+        if batch is None:
+            return
+        fly_id = batch.pop('fly_id')
+        batch_param = dict(self.param)
+        for item in self.PerFlyParam:
+            batch_param[item] = batch.get(item)
+        batch_param['domain'] = None
+        batch_swarm = BasicSwarmOfFlies(batch_param)
+
+        for item in self.PerFlyParam:
+            self.param[item] = scipy.concatenate((self.param[item], batch_swarm.param[item]))
+        for name in self.PerFlyState:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, scipy.concatenate((value, getattr(batch_swarm, name))))
+        if self.odor_sensor is not None:
+            for name in self.odor_sensor.PerFlyState:
+                value = getattr(self.odor_sensor, name)
+                setattr(self.odor_sensor, name, scipy.concatenate((value, getattr(batch_swarm.odor_sensor, name))))
+        self.fly_id = scipy.concatenate((self.fly_id, fly_id))
+        self.param['x_start_position'] = self.x_position
+        self.param['y_start_position'] = self.y_position
+
+    def compact(self, force=False):
+        """
+        Move trapped and out of domain flies to records if they make up more
+        than compact_fraction of the swarm (or if force is True).
+        """
+        mask_retired = (self.mode == self.Mode_Trapped) | (self.mode == self.Mode_OutOfDomain)
+        num_retired = mask_retired.sum()
+        if num_retired == 0:
+            return
+        if not force and num_retired <= self.param['compact_fraction']*self.size:
+            return
+        for name in self.record_fields:
+            self.records[name].append(self.get_active_values(name)[mask_retired])
+        self.records_mode_count += scipy.bincount(self.mode[mask_retired], minlength=self.NumModes)
+        mask_keep = ~mask_retired
+        for item in self.PerFlyParam:
+            self.param[item] = self.param[item][mask_keep]
+        for name in self.PerFlyState:
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, value[mask_keep])
+        if self.odor_sensor is not None:
+            for name in self.odor_sensor.PerFlyState:
+                setattr(self.odor_sensor, name, getattr(self.odor_sensor, name)[mask_keep])
+        self.fly_id = self.fly_id[mask_keep]
+        self.param['x_start_position'] = self.x_position
+        self.param['y_start_position'] = self.y_position
+
+    def get_active_values(self, name):
+        if name == 'fly_id':
+            return self.fly_id
+        return super(StagedSwarmOfFlies, self).get_fly_values(name)
+
+    def get_fly_values(self, name):
+        """
+        Returns array of per-fly values of name for all materialized flies
+        (records and flies in flight) ordered by fly_id. Only RecordFields can
+        be returned once flies have been compacted.
+        """
+        if name not in self.record_fields and self.num_records > 0:
+            raise ValueError('{0} is not recorded for compacted flies'.format(name))
+        values = scipy.concatenate(self.records.get(name, []) + [self.get_active_values(name)])
+        fly_id = scipy.concatenate(self.records['fly_id'] + [self.fly_id])
+        return values[scipy.argsort(fly_id, kind='mergesort')]
 
-        
 
+def get_default_per_fly_param(name, size):
+    """
+    Returns default value of per-fly param name for size flies.
+    """
+    if name == 'initial_heading':
+        return scipy.radians(scipy.random.uniform(0.0,360.0,(size,)))
+    elif name == 'flight_speed':
+        return scipy.full((size,), 0.7)
+    else:
+        return scipy.zeros((size,))
 
-        
 
+def compensated_add(value, compensation, mask, step):
+    """
+    In place Kahan summation value[mask] += step, where compensation holds the
+    running low order bits lost by previous additions.
+    """
+    step_comp = step - compensation[mask]
+    value_old = value[mask]
+    value_new = value_old + step_comp
+    compensation[mask] = (value_new - value_old) - step_comp
+    value[mask] = value_new
 
 
+def run_swarm(swarm, wind_field, odor_field, t_stop, dt, t_start=0.0, callback=None, metrics=None):
+    """
+    Run swarm simulation from t_start to t_stop with time step dt. If given,
+    callback(t, swarm) is called after each step and metrics (see
+    metrics.MetricsRecorder) are recorded.
+    """
+    if metrics is not None:
+        metrics.attach(swarm)
+    t = t_start
+    while t < t_stop:
+        swarm.update(t,dt,wind_field,odor_field)
+        t += dt
+        if metrics is not None:
+            metrics.update(t,swarm)
+        if callback is not None:
+            callback(t,swarm)
+    if metrics is not None:
+        metrics.finish(t,swarm)
+    return swarm
 
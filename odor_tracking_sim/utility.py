@@ -1,28 +1,93 @@
 import scipy
+import numpy
 import math
 
 
-def rotate_vecs(x,y,angle):
-    xrot = x*scipy.cos(angle) - y*scipy.sin(angle)
-    yrot = x*scipy.sin(angle) + y*scipy.cos(angle)
-    return xrot, yrot
+CosSinCacheSize = 64
+cos_sin_cache = {}
 
 
-def shift_and_rotate(p, shift, angle):
-    p_vec = scipy.array(p)
-    shift_vec = scipy.array(shift)
-    rot_mat = rotation_matrix(angle)
-    if len(p_vec.shape) > 1:
-        shift_vec = scipy.reshape(shift_vec,(2,1))
-    return scipy.dot(rot_mat, p_vec - shift_vec)
+def cos_sin(angle, dtype=None):
+    """
+    Returns cos and sin of angle. Values for scalar angles (e.g. the wind
+    angle) are cached. If given, results are cast to dtype.
+    """
+    if scipy.ndim(angle) > 0:
+        cos_angle = scipy.cos(angle)
+        sin_angle = scipy.sin(angle)
+    else:
+        key = (float(angle), dtype)
+        try:
+            return cos_sin_cache[key]
+        except KeyError:
+            pass
+        cos_angle = scipy.cos(angle)
+        sin_angle = scipy.sin(angle)
+        if len(cos_sin_cache) >= CosSinCacheSize:
+            cos_sin_cache.clear()
+        if dtype is not None:
+            cos_angle = scipy.dtype(dtype).type(cos_angle)
+            sin_angle = scipy.dtype(dtype).type(sin_angle)
+        cos_sin_cache[key] = cos_angle, sin_angle
+        return cos_angle, sin_angle
+    if dtype is not None:
+        cos_angle = cos_angle.astype(dtype, copy=False)
+        sin_angle = sin_angle.astype(dtype, copy=False)
+    return cos_angle, sin_angle
+
+
+def rotate_vecs(x,y,angle,out=None):
+    """
+    Rotate vectors x,y by angle. If given, results are written to the arrays
+    out = (xrot, yrot) or out = (xrot, yrot, work), which must not be x or y.
+    With the work array no arrays are allocated (for scalar angles).
+    """
+    cos_angle, sin_angle = cos_sin(angle)
+    if out is None:
+        xrot = x*cos_angle - y*sin_angle
+        yrot = x*sin_angle + y*cos_angle
+        return xrot, yrot
+    xrot, yrot = out[:2]
+    if len(out) > 2:
+        work = out[2]
+    else:
+        work = scipy.empty(xrot.shape, dtype=xrot.dtype)
+    numpy.multiply(x, cos_angle, out=xrot)
+    numpy.multiply(y, sin_angle, out=work)
+    numpy.subtract(xrot, work, out=xrot)
+    numpy.multiply(x, sin_angle, out=yrot)
+    numpy.multiply(y, cos_angle, out=work)
+    numpy.add(yrot, work, out=yrot)
+    return xrot, yrot
 
 
-def rotation_matrix(angle):
-    A = scipy.array([
-        [scipy.cos(angle), -scipy.sin(angle)],
-        [scipy.sin(angle),  scipy.cos(angle)]
-        ])
-    return A
+def shift_and_rotate(p, shift, angle, out=None):
+    """
+    Shift points p = (x,y) by -shift and rotate by angle. Returns (x,y) tuple.
+
+    If given, results are written to arrays out = (xrot, yrot) or out = (xrot,
+    yrot, dx, dy), where dx, dy are work arrays - then no arrays are allocated.
+    """
+    if out is None:
+        x = p[0] - shift[0]
+        y = p[1] - shift[1]
+        return rotate_vecs(x, y, angle)
+    xrot, yrot = out[:2]
+    if len(out) > 2:
+        dx, dy = out[2:]
+        numpy.subtract(p[0], shift[0], out=dx)
+        numpy.subtract(p[1], shift[1], out=dy)
+    else:
+        dx = p[0] - shift[0]
+        dy = p[1] - shift[1]
+    cos_angle, sin_angle = cos_sin(angle, xrot.dtype)
+    numpy.multiply(dx, cos_angle, out=xrot)
+    numpy.multiply(dy, sin_angle, out=yrot)
+    numpy.subtract(xrot, yrot, out=xrot)
+    numpy.multiply(dx, sin_angle, out=dx)
+    numpy.multiply(dy, cos_angle, out=dy)
+    numpy.add(dx, dy, out=yrot)
+    return xrot, yrot
 
 
 def create_circle_of_sources(number,radius,strength):
@@ -44,18 +109,36 @@ def create_grid_of_sources(x_num, y_num, x_range, y_range,  strength):
     return location_list, strength_list
 
 
-def distance(p,q):
-    return scipy.sqrt((p[0]-q[0])**2 + (p[1]-q[1])**2)
+def distance(p,q,out=None):
+    """
+    Distance between points p and q. If given, result is written to the array
+    out, or out = (dist, work) where work is a work array - then no arrays are
+    allocated.
+    """
+    if out is None:
+        return scipy.sqrt((p[0]-q[0])**2 + (p[1]-q[1])**2)
+    if isinstance(out, tuple):
+        out, dy = out
+        numpy.subtract(p[1], q[1], out=dy)
+    else:
+        dy = p[1] - q[1]
+    numpy.subtract(p[0], q[0], out=out)
+    numpy.multiply(out, out, out=out)
+    numpy.multiply(dy, dy, out=dy)
+    numpy.add(out, dy, out=out)
+    numpy.sqrt(out, out=out)  # not scipy.sqrt, which is scimath.sqrt and has no out argument
+    return out
 
 
 def unit_vector(x,y): 
-    v_mag = scipy.sqrt(x**2 + y**2)
+    # Keeps the precision of float32 scalars (x**2 and scipy.sqrt upcast them)
+    v_mag = numpy.sqrt(x*x + y*y)
     if type(v_mag) == scipy.ndarray:
         mask = v_mag > 0
-        x_unit = scipy.zeros(x.shape)
-        y_unit = scipy.zeros(y.shape)
-        x_unit[mask] = x/v_mag
-        y_unit[mask] = y/v_mag
+        x_unit = scipy.zeros(x.shape,dtype=v_mag.dtype)
+        y_unit = scipy.zeros(y.shape,dtype=v_mag.dtype)
+        x_unit[mask] = x[mask]/v_mag[mask]
+        y_unit[mask] = y[mask]/v_mag[mask]
     else:
         if (v_mag > 0):
             x_unit = x/v_mag
@@ -66,6 +149,16 @@ def unit_vector(x,y):
     return x_unit, y_unit
 
 
+def take(value, mask):
+    """
+    Returns value[mask] for arrays - scalars (e.g. values of uniform fields)
+    are returned as is and broadcast by the caller.
+    """
+    if scipy.ndim(value) == 0:
+        return value
+    return value[mask]
+
+
 def logistic(x,x0,k):
     return 1.0/(1.0 + scipy.exp(-k*(x-x0)))
 
@@ -0,0 +1,181 @@
+from __future__ import print_function
+import time
+import scipy
+import scipy.stats
+
+from .swarm_models import BasicSwarmOfFlies
+from .swarm_models import run_swarm
+
+
+class SwarmBackend(object):
+    """
+    Runs a swarm simulation for a given seed.
+
+    swarm_param_func() is called (after seeding) to create a fresh set of swarm
+    parameters for each run and param is merged on top of them, e.g. to select
+    options of an alternative backend.
+
+    """
+
+    def __init__(self, swarm_param_func, wind_field, odor_field, t_stop, dt,
+            swarm_class=BasicSwarmOfFlies, param={}):
+        self.swarm_param_func = swarm_param_func
+        self.wind_field = wind_field
+        self.odor_field = odor_field
+        self.t_stop = t_stop
+        self.dt = dt
+        self.swarm_class = swarm_class
+        self.param = dict(param)
+
+    def __call__(self, seed):
+        scipy.random.seed(seed)
+        swarm_param = self.swarm_param_func()
+        swarm_param.update(self.param)
+        swarm = self.swarm_class(param=swarm_param)
+        return run_swarm(swarm, self.wind_field, self.odor_field, self.t_stop, self.dt)
+
+
+class EquivalenceTest(object):
+    """
+
+    Statistical equivalence test of an alternative swarm backend against the
+    reference implementation.
+
+    Optimized backends consume random numbers in a different order, so results
+    can't be compared run by run. Instead both backends are run over many seeds
+    and the distributions they produce are compared with two-sample tests:
+
+     * trap counts, per trap, across seeds (Mann-Whitney U)
+     * arrival times t_in_trap, per trap, pooled across seeds (Kolmogorov-Smirnov)
+     * overall split of trapped flies between traps (chi-squared)
+
+    The backends are callables backend(seed) returning a finished swarm, see
+    SwarmBackend. The test passes if no p-value falls below alpha after
+    Bonferroni correction for the number of tests.
+
+    """
+
+    DefaultParam = {
+            'seeds'       : range(20),
+            'alpha'       : 0.01,
+            'num_traps'   : None,
+            'min_samples' : 5,
+            }
+
+    def __init__(self, reference, candidate, param={}):
+        self.reference = reference
+        self.candidate = candidate
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.result = None
+
+    def run_backend(self, backend, seeds):
+        """
+        Run backend for each seed. Returns list of trap_num arrays, list of
+        t_in_trap arrays and total run time.
+        """
+        trap_num_list = []
+        t_in_trap_list = []
+        run_time = 0.0
+        for seed in seeds:
+            t0 = time.time()
+            swarm = backend(seed)
+            run_time += time.time() - t0
+            trap_num_list.append(scipy.array(swarm.get_fly_values('trap_num')))
+            t_in_trap_list.append(scipy.array(swarm.get_fly_values('t_in_trap')))
+        return trap_num_list, t_in_trap_list, run_time
+
+    def run(self):
+        """
+        Run both backends over all seeds and compare. Returns result dictionary.
+        """
+        seeds = list(self.param['seeds'])
+        ref_trap_num, ref_t_in_trap, ref_time = self.run_backend(self.reference, seeds)
+        can_trap_num, can_t_in_trap, can_time = self.run_backend(self.candidate, seeds)
+
+        num_traps = self.param['num_traps']
+        if num_traps is None:
+            num_traps = max([x.max() for x in ref_trap_num + can_trap_num]) + 1
+        ref_counts = get_trap_counts(ref_trap_num, num_traps)
+        can_counts = get_trap_counts(can_trap_num, num_traps)
+
+        test_list = []
+        for trap_num in range(num_traps):
+            p_value = mannwhitneyu_pvalue(ref_counts[:,trap_num], can_counts[:,trap_num])
+            test_list.append(('counts', trap_num, p_value))
+
+            ref_times = get_arrival_times(ref_trap_num, ref_t_in_trap, trap_num)
+            can_times = get_arrival_times(can_trap_num, can_t_in_trap, trap_num)
+            if min(ref_times.shape[0], can_times.shape[0]) >= self.param['min_samples']:
+                p_value = scipy.stats.ks_2samp(ref_times, can_times)[1]
+                test_list.append(('arrival_times', trap_num, p_value))
+
+        table = scipy.array([ref_counts.sum(axis=0), can_counts.sum(axis=0)])
+        table = table[:, table.sum(axis=0) > 0]
+        if table.shape[1] > 1:
+            p_value = scipy.stats.chi2_contingency(table)[1]
+            test_list.append(('trap_split', None, p_value))
+
+        alpha_corrected = self.param['alpha']/max(len(test_list), 1)
+        self.result = {
+                'passed'          : all(p >= alpha_corrected for _, _, p in test_list),
+                'alpha_corrected' : alpha_corrected,
+                'tests'           : test_list,
+                'num_seeds'       : len(seeds),
+                'reference_counts': ref_counts,
+                'candidate_counts': can_counts,
+                'reference_time'  : ref_time,
+                'candidate_time'  : can_time,
+                'speedup'         : ref_time/can_time if can_time > 0 else scipy.inf,
+                }
+        return self.result
+
+    def report(self):
+        """
+        Returns text report of the last run.
+        """
+        if self.result is None:
+            self.run()
+        result = self.result
+        line_list = []
+        line_list.append('equivalence: {0}, speedup: {1:1.2f}x ({2:1.2f}s vs {3:1.2f}s), seeds: {4}'.format(
+            'PASS' if result['passed'] else 'FAIL',
+            result['speedup'],
+            result['reference_time'],
+            result['candidate_time'],
+            result['num_seeds']
+            ))
+        line_list.append('alpha (corrected): {0:1.2e}'.format(result['alpha_corrected']))
+        for name, trap_num, p_value in result['tests']:
+            flag = '' if p_value >= result['alpha_corrected'] else ' *'
+            line_list.append('  {0:<14} trap: {1:<5} p: {2:1.3e}{3}'.format(name, trap_num, p_value, flag))
+        return '\n'.join(line_list)
+
+
+def get_trap_counts(trap_num_list, num_traps):
+    """
+    Returns array (num_runs x num_traps) of number of flies in each trap.
+    """
+    counts = scipy.zeros((len(trap_num_list), num_traps), dtype=int)
+    for i, trap_num in enumerate(trap_num_list):
+        trap_num = trap_num[trap_num >= 0]
+        counts[i] = scipy.bincount(trap_num, minlength=num_traps)[:num_traps]
+    return counts
+
+
+def get_arrival_times(trap_num_list, t_in_trap_list, trap_num):
+    """
+    Returns arrival times in trap trap_num pooled over all runs.
+    """
+    times = [t[n == trap_num] for n, t in zip(trap_num_list, t_in_trap_list)]
+    return scipy.concatenate(times)
+
+
+def mannwhitneyu_pvalue(x, y):
+    """
+    Two-sided Mann-Whitney U test p-value. Returns 1.0 when all values are identical.
+    """
+    if scipy.all(x == x[0]) and scipy.all(y == x[0]):
+        return 1.0
+    return scipy.stats.mannwhitneyu(x, y, alternative='two-sided')[1]
+
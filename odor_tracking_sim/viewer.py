@@ -0,0 +1,307 @@
+from __future__ import print_function
+import time
+import multiprocessing
+import scipy
+
+from swarm_models import BasicSwarmOfFlies
+
+
+class SnapshotBuffer(object):
+    """
+    Shared-memory ring buffer of decimated swarm snapshots.
+
+    The simulation (writer) never blocks: each snapshot goes into the next slot
+    of the ring, overwriting whatever was there. The viewer (reader) only ever
+    looks at the newest complete snapshot, so frames the viewer is too slow to
+    draw are simply dropped. Each slot carries a sequence number which is
+    invalidated while the slot is being written, which lets the reader detect
+    and discard a snapshot which was overwritten while it was being copied.
+
+    """
+
+    # Columns of the per slot info array
+    Info_Seq = 0
+    Info_Time = 1
+    Info_Num = 2
+    Info_Released = 3
+    Info_ModeCount = 4
+    NumModes = BasicSwarmOfFlies.NumModes
+    InfoSize = Info_ModeCount + NumModes
+
+    def __init__(self, max_points, num_slots=4):
+        self.max_points = max_points
+        self.num_slots = num_slots
+        self._x_raw = multiprocessing.RawArray('d', num_slots*max_points)
+        self._y_raw = multiprocessing.RawArray('d', num_slots*max_points)
+        self._mode_raw = multiprocessing.RawArray('b', num_slots*max_points)
+        self._info_raw = multiprocessing.RawArray('d', num_slots*self.InfoSize)
+        self._head_raw = multiprocessing.RawArray('l', 1)
+        self._attach()
+
+    def _attach(self):
+        shape = (self.num_slots, self.max_points)
+        self.x = scipy.frombuffer(self._x_raw, dtype=scipy.float64).reshape(shape)
+        self.y = scipy.frombuffer(self._y_raw, dtype=scipy.float64).reshape(shape)
+        self.mode = scipy.frombuffer(self._mode_raw, dtype=scipy.int8).reshape(shape)
+        self.info = scipy.frombuffer(self._info_raw, dtype=scipy.float64)
+        self.info = self.info.reshape((self.num_slots, self.InfoSize))
+        self.head = scipy.frombuffer(self._head_raw, dtype=scipy.int_)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('x', 'y', 'mode', 'info', 'head'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def write(self, t, x, y, mode, num_released, mode_count):
+        """
+        Write snapshot to the next slot in the ring. Never waits on the reader.
+        """
+        num = min(x.shape[0], self.max_points)
+        seq = int(self.head[0]) + 1
+        slot = seq % self.num_slots
+        info = self.info[slot]
+        info[self.Info_Seq] = -1
+        self.x[slot,:num] = x[:num]
+        self.y[slot,:num] = y[:num]
+        self.mode[slot,:num] = mode[:num]
+        info[self.Info_Time] = t
+        info[self.Info_Num] = num
+        info[self.Info_Released] = num_released
+        info[self.Info_ModeCount:] = mode_count[:self.NumModes]
+        info[self.Info_Seq] = seq
+        self.head[0] = seq
+
+    def read_latest(self, last_seq=0):
+        """
+        Returns the newest snapshot as a dictionary or None if there is no
+        snapshot newer than last_seq or it was overwritten while being read.
+        """
+        seq = int(self.head[0])
+        if seq <= last_seq:
+            return None
+        slot = seq % self.num_slots
+        info = self.info[slot]
+        if info[self.Info_Seq] != seq:
+            return None
+        num = int(info[self.Info_Num])
+        snapshot = {
+                'seq'        : seq,
+                't'          : info[self.Info_Time],
+                'x'          : self.x[slot,:num].copy(),
+                'y'          : self.y[slot,:num].copy(),
+                'mode'       : self.mode[slot,:num].copy(),
+                'released'   : int(info[self.Info_Released]),
+                'mode_count' : info[self.Info_ModeCount:].astype(int),
+                }
+        if info[self.Info_Seq] != seq:
+            return None
+        return snapshot
+
+
+class LiveViewer(object):
+    """
+    Live display of a swarm rendered in a separate process.
+
+    The simulation calls publish(t, swarm) each step. Every dt_publish seconds
+    (simulation time) a decimated snapshot of fly positions and modes is copied
+    into a shared-memory ring buffer and publish returns immediately. The
+    render process draws the newest snapshot using blitting, or as a 2D density
+    histogram when the snapshot holds more than density_threshold points.
+
+    """
+
+    DefaultParam = {
+            'xlim'              : (-2000.0, 2000.0),
+            'ylim'              : (-2000.0, 2000.0),
+            'max_points'        : 20000,
+            'num_slots'         : 4,
+            'dt_publish'        : 10.0,
+            'frame_interval'    : 0.05,
+            'density_threshold' : 5000,
+            'density_bins'      : 200,
+            'cmap'              : 'binary',
+            'source_locations'  : [],
+            'trap_radius'       : None,
+            'fignum'            : 1,
+            }
+
+    Unreleased = -1
+    ModeColors = ('r', 'b', 'g', 'k', 'm')
+
+    def __init__(self,param={}):
+        self.param = dict(self.DefaultParam)
+        self.param.update(param)
+        self.buffer = SnapshotBuffer(self.param['max_points'], self.param['num_slots'])
+        self.stop_flag = multiprocessing.RawValue('b', 0)
+        self.process = None
+        self.t_last_publish = None
+        self.decimate_index = None
+        self.decimate_size = None
+        self.publish_count = 0
+
+    def start(self):
+        """
+        Start render process.
+        """
+        self.stop_flag.value = 0
+        self.process = multiprocessing.Process(
+                target=render_loop,
+                args=(self.buffer, self.param, self.stop_flag)
+                )
+        self.process.daemon = True
+        self.process.start()
+
+    def stop(self, timeout=1.0):
+        """
+        Stop render process.
+        """
+        self.stop_flag.value = 1
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+    @property
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def publish(self, t, swarm, force=False):
+        """
+        Publish decimated snapshot of swarm if dt_publish has elapsed since the
+        last one. Returns True if a snapshot was written.
+        """
+        if not force and self.t_last_publish is not None:
+            if t < self.t_last_publish + self.param['dt_publish']:
+                return False
+
+        # The size of a staged swarm changes as flies are materialized and compacted
+        if self.decimate_index is None or self.decimate_size != swarm.size:
+            self.decimate_index = self.get_decimate_index(swarm.size)
+            self.decimate_size = swarm.size
+        index = self.decimate_index
+
+        mask_release = t > swarm.param['release_time']
+        mode = swarm.mode[index].astype(scipy.int8)
+        mode[~mask_release[index]] = self.Unreleased
+        mode_count = swarm.get_mode_count(t)
+
+        self.buffer.write(
+                t,
+                swarm.x_position[index],
+                swarm.y_position[index],
+                mode,
+                mode_count.sum(),
+                mode_count
+                )
+        self.t_last_publish = t
+        self.publish_count += 1
+        return True
+
+    def get_decimate_index(self, size):
+        """
+        Fixed evenly spaced subset of flies so the same flies are shown in every frame.
+        """
+        max_points = self.param['max_points']
+        if size <= max_points:
+            return scipy.arange(size)
+        return scipy.linspace(0, size-1, max_points).astype(int)
+
+
+def render_loop(buffer, param, stop_flag):
+    """
+    Render loop run in the viewer process. Always draws the newest snapshot in
+    the buffer, any snapshots written in between are dropped.
+    """
+    import matplotlib.pyplot as plt
+
+    xlim = param['xlim']
+    ylim = param['ylim']
+    extent = (xlim[0], xlim[1], ylim[0], ylim[1])
+
+    fig = plt.figure(param['fignum'])
+    ax = plt.subplot(111)
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_aspect('equal')
+    ax.grid(True)
+    ax.set_xlabel('x (m)')
+    ax.set_ylabel('y (m)')
+    s = scipy.linspace(0, 2.0*scipy.pi, 100)
+    for x, y in param['source_locations']:
+        if param['trap_radius'] is not None:
+            ax.plot(x + param['trap_radius']*scipy.cos(s), y + param['trap_radius']*scipy.sin(s), 'k')
+        else:
+            ax.plot([x], [y], '.k')
+
+    # Animated artists - one line per mode and a density image for large swarms.
+    mode_lines = []
+    for color in LiveViewer.ModeColors:
+        line, = ax.plot([], [], '.' + color, markersize=2, animated=True)
+        mode_lines.append(line)
+    bins = param['density_bins']
+    density_image = ax.imshow(
+            scipy.zeros((bins, bins)),
+            extent=extent,
+            origin='lower',
+            cmap=param['cmap'],
+            interpolation='nearest',
+            animated=True
+            )
+    info_text = ax.text(0.02, 0.97, '', transform=ax.transAxes, va='top', animated=True)
+
+    plt.show(block=False)
+    fig.canvas.draw()
+    background = {'bbox': fig.canvas.copy_from_bbox(ax.bbox)}
+
+    def on_draw(event):
+        background['bbox'] = fig.canvas.copy_from_bbox(ax.bbox)
+    fig.canvas.mpl_connect('draw_event', on_draw)
+
+    last_seq = 0
+    while not stop_flag.value and plt.fignum_exists(param['fignum']):
+        snapshot = buffer.read_latest(last_seq)
+        if snapshot is None:
+            fig.canvas.flush_events()
+            time.sleep(param['frame_interval'])
+            continue
+        last_seq = snapshot['seq']
+
+        fig.canvas.restore_region(background['bbox'])
+        mode = snapshot['mode']
+        if mode.shape[0] > param['density_threshold']:
+            mask = mode != LiveViewer.Unreleased
+            hist, xedges, yedges = scipy.histogram2d(
+                    snapshot['y'][mask],
+                    snapshot['x'][mask],
+                    bins=bins,
+                    range=(ylim, xlim)
+                    )
+            density_image.set_data(hist)
+            density_image.set_clim(0, max(hist.max(), 1))
+            ax.draw_artist(density_image)
+        else:
+            for mode_value, line in enumerate(mode_lines):
+                mask = mode == mode_value
+                line.set_data(snapshot['x'][mask], snapshot['y'][mask])
+                ax.draw_artist(line)
+
+        mode_count = snapshot['mode_count']
+        info_text.set_text('t: {0:1.1f}, released: {1}, trapped: {2}, out of domain: {3}'.format(
+            snapshot['t'],
+            snapshot['released'],
+            mode_count[BasicSwarmOfFlies.Mode_Trapped],
+            mode_count[BasicSwarmOfFlies.Mode_OutOfDomain]
+            ))
+        ax.draw_artist(info_text)
+        fig.canvas.blit(ax.bbox)
+        fig.canvas.flush_events()
+        time.sleep(param['frame_interval'])
+
+    plt.close(fig)
+
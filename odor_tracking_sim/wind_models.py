@@ -1,12 +1,21 @@
 import scipy
+from utility import unit_vector
 
 
 class ConstantWindField(object):
     """
     Super simple constant wind model specified by wind angle and speed.
+    Array values are returned with the floating point type given by dtype.
+
+    The field is uniform (same value everywhere) and time invariant, so
+    callers can use uniform_value and uniform_unit_vector (scalars) instead of
+    per-position arrays.
     """
 
-    DefaultParam = { 'angle': 0.0, 'speed': 1.0 }
+    DefaultParam = { 'angle': 0.0, 'speed': 1.0, 'dtype': scipy.float64 }
+
+    is_uniform = True
+    is_time_invariant = True
 
     def __init__(self,param={}):
 
@@ -15,6 +24,30 @@ class ConstantWindField(object):
 
         self.angle = param['angle']
         self.speed = param['speed']
+        self.dtype = scipy.dtype(self.param['dtype'])
+        self.uniform_cache = None
+
+    def get_uniform_cache(self):
+        # Cached scalar values and unit vector, recomputed if angle or speed change 
+        key = (self.angle, self.speed)
+        if self.uniform_cache is None or self.uniform_cache[0] != key:
+            dtype = self.dtype.type
+            vx = dtype(self.speed*scipy.cos(self.angle))
+            vy = dtype(self.speed*scipy.sin(self.angle))
+            self.uniform_cache = (key, (vx, vy), unit_vector(vx, vy))
+        return self.uniform_cache
+
+    def uniform_value(self,t):
+        """
+        Returns wind velocity (vx, vy) as scalars of type dtype.
+        """
+        return self.get_uniform_cache()[1]
+
+    def uniform_unit_vector(self,t):
+        """
+        Returns wind direction unit vector as scalars of type dtype.
+        """
+        return self.get_uniform_cache()[2]
 
     def value(self,t,x,y):
         vx = self.speed*scipy.cos(self.angle)
@@ -22,8 +55,8 @@ class ConstantWindField(object):
         if type(x) == scipy.ndarray:
             if x.shape != y.shape:
                 raise(ValueError,'x.shape must equal y.shape')
-            vx_array = scipy.full(x.shape,vx)
-            vy_array = scipy.full(y.shape,vy)
+            vx_array = scipy.full(x.shape,vx,dtype=self.dtype)
+            vy_array = scipy.full(y.shape,vy,dtype=self.dtype)
             return vx_array, vy_array
         else:
             return vx, vy
@@ -0,0 +1,119 @@
+from __future__ import print_function
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import scipy
+
+from odor_tracking_sim import analytics
+from odor_tracking_sim import scenario
+
+
+def create_result(seed, group, num_flies=500, num_traps=3, t_stop=1000.0):
+    random = scipy.random.RandomState(seed)
+    trap_num = random.randint(-1, num_traps, num_flies)
+    release_time = random.uniform(0.0, 200.0, num_flies)
+    t_in_trap = release_time + random.uniform(10.0, 800.0, num_flies)
+    t_in_trap[trap_num < 0] = scipy.inf
+    return {
+            'trap_num'         : trap_num,
+            't_in_trap'        : t_in_trap,
+            'release_time'     : release_time,
+            'time_in_plume'    : random.uniform(0.0, 10.0, num_flies),
+            'source_locations' : scipy.zeros((num_traps, 2)),
+            't_stop'           : t_stop,
+            'seed'             : seed,
+            'spec'             : json.dumps({'group': group}),
+            }
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def test_relative_accuracy(self):
+        values = scipy.random.RandomState(0).lognormal(3.0, 1.0, 20000)
+        sketch = analytics.QuantileSketch(0.01)
+        sketch.add(values)
+        self.assertEqual(sketch.count, values.shape[0])
+        for q in (0.1, 0.5, 0.9, 0.99):
+            exact = scipy.percentile(values, 100.0*q, interpolation='lower')
+            self.assertLess(abs(sketch.quantile(q) - exact)/exact, 0.011)
+
+    def test_merge(self):
+        values = scipy.random.RandomState(1).exponential(100.0, 5000)
+        sketch = analytics.QuantileSketch()
+        sketch.add(values)
+        sketch_a = analytics.QuantileSketch()
+        sketch_b = analytics.QuantileSketch()
+        sketch_a.add(values[:1000])
+        sketch_b.add(values[1000:])
+        sketch_a.merge(sketch_b)
+        self.assertEqual(sketch_a.zero_count, sketch.zero_count)
+        self.assertEqual(sketch_a.offset, sketch.offset)
+        self.assertTrue((sketch_a.counts == sketch.counts).all())
+        self.assertTrue(scipy.isnan(analytics.QuantileSketch().quantile(0.5)))
+
+
+class TestGrowingHistogram(unittest.TestCase):
+
+    def test_matches_histogram(self):
+        values = scipy.random.RandomState(2).uniform(0.0, 95.0, 1000)
+        hist = analytics.GrowingHistogram(10.0)
+        hist.add(values[:10])
+        other = analytics.GrowingHistogram(10.0)
+        other.add(values[10:])
+        hist.merge(other)
+        counts, edges = scipy.histogram(values, bins=hist.bin_edges)
+        self.assertTrue((hist.counts == counts).all())
+
+
+class TestTrajectoryAnalytics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename_list = []
+        for seed in range(6):
+            filename = os.path.join(self.directory, 'result_{0}.npz'.format(seed))
+            scenario.save_result(filename, create_result(seed, 'ab'[seed % 2]))
+            self.filename_list.append(filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_process(self):
+        summary_list = []
+        for num_processes in (1, 2):
+            trajectory_analytics = analytics.TrajectoryAnalytics({'num_processes': num_processes})
+            trajectory_analytics.process(iter(self.filename_list))
+            self.assertEqual(trajectory_analytics.num_files, 6)
+            summary_list.append(trajectory_analytics.summary())
+        # Merge order only changes the rounding of the plume time sums
+        for group in summary_list[0]:
+            plume_fraction = [summary[group].pop('plume_fraction') for summary in summary_list]
+            self.assertAlmostEqual(plume_fraction[0], plume_fraction[1], places=12)
+        self.assertEqual(summary_list[0], summary_list[1])
+
+        summary = summary_list[0]
+        self.assertEqual(sorted(summary.keys()), ['a', 'b'])
+        result_list = [create_result(seed, 'a') for seed in (0, 2, 4)]
+        trap_num = scipy.concatenate([result['trap_num'] for result in result_list])
+        trap_counts = scipy.bincount(trap_num[trap_num >= 0], minlength=3)
+        self.assertEqual(summary['a']['num_runs'], 3)
+        self.assertEqual(summary['a']['num_flies'], trap_num.shape[0])
+        self.assertEqual(summary['a']['trap_counts'], trap_counts.tolist())
+        self.assertAlmostEqual(summary['a']['capture_rate'], float(trap_counts.sum())/trap_num.shape[0])
+
+    def test_single_process_streams(self):
+        # Each file is merged before the next one is read from the iterable
+        trajectory_analytics = analytics.TrajectoryAnalytics({'num_processes': 1})
+        num_files_list = []
+        def filename_iter():
+            for filename in self.filename_list:
+                num_files_list.append(trajectory_analytics.num_files)
+                yield filename
+        trajectory_analytics.process(filename_iter())
+        self.assertEqual(num_files_list, list(range(6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import scipy
+
+from odor_tracking_sim import domain_models
+from odor_tracking_sim import event_log
+from odor_tracking_sim import swarm_models
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import odor_models
+from odor_tracking_sim import viewer
+from odor_tracking_sim import metrics
+
+
+Boundary = [(-500.0, -500.0), (500.0, -500.0), (500.0, 500.0), (-500.0, 500.0)]
+Obstacle = [(100.0, -50.0), (150.0, -50.0), (150.0, 50.0), (100.0, 50.0)]
+
+
+class TestPolygonRaster(unittest.TestCase):
+
+    def test_contains_matches_exact(self):
+        # Non-convex polygon with edges not aligned with the grid
+        polygon = [(0.0, 0.0), (90.0, 13.0), (40.0, 37.0), (95.0, 88.0), (7.0, 61.0)]
+        raster = domain_models.PolygonRaster([polygon], 5.0)
+        random = scipy.random.RandomState(0)
+        x = random.uniform(-20.0, 120.0, (20000,))
+        y = random.uniform(-20.0, 120.0, (20000,))
+        self.assertTrue((raster.contains(x, y) == raster.contains_exact(x, y)).all())
+
+
+class TestDomainSwarm(unittest.TestCase):
+
+    def create_swarm(self, heading):
+        size = 10
+        param = {
+                'initial_heading'  : scipy.full((size,), heading),
+                'x_start_position' : scipy.linspace(-20.0, 20.0, size),
+                'y_start_position' : scipy.zeros((size,)),
+                'flight_speed'     : scipy.full((size,), 1.0),
+                'release_time'     : scipy.zeros((size,)),
+                'domain'           : {'boundary': Boundary, 'obstacles': [Obstacle]},
+                }
+        wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.0})
+        odor_field = odor_models.FakeDiffusionOdorField({
+            'wind_field'       : wind_field,
+            'source_locations' : [(5000.0, 5000.0)],
+            'source_strengths' : [1.0],
+            })
+        return swarm_models.BasicSwarmOfFlies(param), wind_field, odor_field
+
+    def test_obstacle_not_entered(self):
+        swarm, wind_field, odor_field = self.create_swarm(0.0)
+        domain = swarm.domain
+        for i in range(400):
+            swarm.update(i*0.5, 0.5, wind_field, odor_field)
+            self.assertFalse(domain.in_obstacle(swarm.x_position, swarm.y_position).any())
+
+    def test_out_of_domain_counted(self):
+        swarm, wind_field, odor_field = self.create_swarm(scipy.pi)
+        swarm_models.run_swarm(swarm, wind_field, odor_field, 1000.0, 0.5)
+        self.assertTrue((swarm.mode == swarm.Mode_OutOfDomain).all())
+        self.assertTrue(scipy.isfinite(swarm.t_out_of_domain).all())
+
+        live_viewer = viewer.LiveViewer({'max_points': 100})
+        live_viewer.publish(1000.0, swarm)
+        snapshot = live_viewer.buffer.read_latest()
+        self.assertEqual(snapshot['mode_count'][swarm.Mode_OutOfDomain], swarm.size)
+        self.assertEqual(len(viewer.LiveViewer.ModeColors), swarm.NumModes)
+
+        sample = metrics.MetricsRecorder({'format': 'prometheus', 'filename': '/dev/null'}).get_sample(1000.0, swarm)
+        self.assertEqual(sample['num_out_of_domain'], swarm.size)
+        self.assertEqual(sample['num_active'], 0)
+
+    def test_out_of_domain_near_trap(self):
+        # Flies leave the domain inside the radius of a trap on the boundary,
+        # they must stay out of domain (also when replayed from the event log).
+        size = 5
+        def create_param():
+            # The swarm moves the start position arrays, so the replay gets new ones
+            return {
+                    'initial_heading'  : scipy.zeros((size,)),
+                    'x_start_position' : scipy.full((size,), 485.0),
+                    'y_start_position' : scipy.linspace(-4.0, 4.0, size),
+                    'flight_speed'     : scipy.full((size,), 20.0),
+                    'release_time'     : scipy.zeros((size,)),
+                    'domain'           : {'boundary': Boundary},
+                    }
+        wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.0})
+        odor_field = odor_models.FakeDiffusionOdorField({
+            'wind_field'       : wind_field,
+            'source_locations' : [(505.0, 0.0)],
+            'source_strengths' : [0.0],
+            'trap_radius'      : 10.0,
+            })
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'events.log')
+            swarm = swarm_models.BasicSwarmOfFlies(create_param())
+            with event_log.EventLog(filename) as log:
+                log.attach(swarm)
+                swarm_models.run_swarm(swarm, wind_field, odor_field, 5.0, 1.0)
+            self.assertTrue((swarm.mode == swarm.Mode_OutOfDomain).all())
+            self.assertTrue((swarm.t_out_of_domain == 1.0).all())
+            self.assertTrue((swarm.t_in_trap == scipy.inf).all())
+            self.assertTrue((swarm.trap_num == -1).all())
+
+            metadata, events = event_log.read_event_log(filename)
+            replay = event_log.replay_fly(events, 0, create_param(), wind_field, odor_field, 5.0, 1.0)
+            self.assertEqual(replay['mode'].tolist(), [0, 4, 4, 4, 4])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
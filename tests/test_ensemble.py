@@ -0,0 +1,65 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+from odor_tracking_sim import ensemble
+
+
+SmallSpec = {'swarm': {'size': 20}, 't_stop': 20.0, 'dt': 1.0}
+
+
+class TestTaskQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ownership(self):
+        queue = ensemble.TaskQueue(self.directory)
+        task_id = queue.add_task(SmallSpec, 1)
+        self.assertEqual(queue.claim('a')[0], task_id)
+        self.assertIsNone(queue.claim('b'))
+        self.assertFalse(queue.heartbeat(task_id, 'b'))
+        self.assertFalse(queue.complete(task_id, 'b', 'result.npz'))
+        self.assertTrue(queue.heartbeat(task_id, 'a'))
+        self.assertTrue(queue.complete(task_id, 'a', 'result.npz'))
+        self.assertTrue(queue.is_finished())
+
+    def test_retry(self):
+        queue = ensemble.TaskQueue(self.directory, {'max_attempts': 2})
+        task_id = queue.add_task(SmallSpec, 1)
+        queue.claim('a')
+        queue.fail(task_id, 'a', 'error')
+        self.assertEqual(queue.counts()['pending'], 1)
+        queue.claim('b')
+        queue.fail(task_id, 'b', 'error')
+        task, = queue.tasks()
+        self.assertEqual(task['status'], queue.Status_Failed)
+        self.assertEqual(task['attempts'], 2)
+
+    def test_requeue_stalled(self):
+        queue = ensemble.TaskQueue(self.directory, {'heartbeat_timeout': -1.0})
+        task_id = queue.add_task(SmallSpec, 1)
+        queue.claim('a')
+        self.assertEqual(queue.claim('b')[0], task_id)
+        self.assertFalse(queue.complete(task_id, 'a', 'result.npz'))
+        self.assertTrue(queue.complete(task_id, 'b', 'result.npz'))
+
+    def test_local_workers(self):
+        queue = ensemble.TaskQueue(self.directory)
+        queue.add_tasks([SmallSpec], [1, 2, 3])
+        exitcodes = ensemble.run_local_workers(self.directory, 2)
+        self.assertEqual(exitcodes, [0, 0])
+        task_list = queue.tasks()
+        self.assertTrue(all(task['status'] == queue.Status_Done for task in task_list))
+        for task in task_list:
+            self.assertIn('-{0}-local-'.format(os.getpid()), task['worker'])
+        self.assertEqual(sorted(os.listdir(queue.results_directory)), sorted(t['result'] for t in task_list))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import scipy
+
+from odor_tracking_sim import event_log
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+Spec = {
+        'sources' : {'radius': 150.0},
+        'swarm'   : {'size': 200, 'release_time_mean': 50.0},
+        't_stop'  : 500.0,
+        'dt'      : 0.5,
+        }
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'events.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay_matches_run(self):
+        trajectory = {'x': [], 'y': [], 'mode': []}
+        def callback(t, swarm):
+            trajectory['x'].append(swarm.x_position.copy())
+            trajectory['y'].append(swarm.y_position.copy())
+            trajectory['mode'].append(swarm.mode.copy())
+        swarm, odor_field = scenario.run_scenario(Spec, 5, callback=callback, event_log=self.filename)
+        x = scipy.array(trajectory['x'])
+        y = scipy.array(trajectory['y'])
+        mode = scipy.array(trajectory['mode'])
+
+        metadata, events = event_log.read_event_log(self.filename)
+        self.assertEqual(metadata['seed'], 5)
+        self.assertEqual(metadata['spec'], scenario.get_scenario(Spec))
+        self.assertTrue((scipy.diff(events['step'].astype(int)) >= 0).all())
+        self.assertGreater((events['mode'] == swarm.Mode_Trapped).sum(), 0)
+
+        # Replay trapped, casting and undisturbed flies
+        fly_id_list = [
+                scipy.flatnonzero(swarm.mode == swarm.Mode_Trapped)[0],
+                scipy.flatnonzero(swarm.mode == swarm.Mode_CastForOdor)[0],
+                scipy.flatnonzero(swarm.mode == swarm.Mode_FixHeading)[0],
+                ]
+        for fly_id in fly_id_list:
+            replay = scenario.replay_fly(self.filename, fly_id)
+            self.assertTrue((replay['x_position'] == x[:,fly_id]).all())
+            self.assertTrue((replay['y_position'] == y[:,fly_id]).all())
+            self.assertTrue((replay['mode'] == mode[:,fly_id]).all())
+
+    def test_buffered_writes(self):
+        with event_log.EventLog(self.filename, {'name': 'test'}, {'buffer_size': 4}) as log:
+            for step in range(10):
+                log.record(step, scipy.array([step, step + 1]), 2, 1, 0.5)
+            self.assertEqual(log.num_buffered, 0)
+            self.assertEqual(log.num_events, 20)
+        metadata, events = event_log.read_event_log(self.filename)
+        self.assertEqual(metadata, {'name': 'test'})
+        self.assertEqual(events.shape, (20,))
+        self.assertEqual(event_log.get_fly_events(events, 3)['step'].tolist(), [2, 3])
+
+    def test_staged_swarm_fly_id(self):
+        # Events of a staged swarm use the flies' ids, not their position in the swarm
+        wind_field, odor_field, swarm = scenario.create_scenario(Spec, 5)
+        param = dict(swarm.param)
+        staged_swarm = swarm_models.StagedSwarmOfFlies(param)
+        with event_log.EventLog(self.filename) as log:
+            log.attach(staged_swarm)
+            swarm_models.run_swarm(staged_swarm, wind_field, odor_field, Spec['t_stop'], Spec['dt'])
+        metadata, events = event_log.read_event_log(self.filename)
+        mode = staged_swarm.get_fly_values('mode')
+        trap_num = staged_swarm.get_fly_values('trap_num')
+        mask_trapped = events['mode'] == swarm.Mode_Trapped
+        self.assertGreater(mask_trapped.sum(), 0)
+        self.assertEqual(sorted(events['fly_id'][mask_trapped].tolist()), scipy.flatnonzero(trap_num >= 0).tolist())
+        self.assertTrue((mode[events['fly_id'][mask_trapped]] == swarm.Mode_Trapped).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import fly_models
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import odor_models
+
+
+def create_flies(size, seed):
+    # Detection always succeeds and the plume is never lost, with no heading
+    # error, so the flies don't depend on the random number generator.
+    random = scipy.random.RandomState(seed)
+    fly_list = []
+    for i in range(size):
+        fly_list.append(fly_models.VerySimpleFly({
+            'initial_heading'    : random.uniform(0.0, 2.0*scipy.pi),
+            'release_time'       : random.uniform(0.0, 50.0),
+            'flight_speed'       : 1.0,
+            'heading_error_std'  : 0.0,
+            'odor_probabilities' : {'lower': 0.0, 'upper': 1.0},
+            }))
+    return fly_list
+
+
+class TestVerySimpleFlyBatch(unittest.TestCase):
+
+    def test_batch_matches_flies(self):
+        wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.0})
+        odor_field = odor_models.FakeDiffusionOdorField({
+            'wind_field'       : wind_field,
+            'source_locations' : [(200.0, 0.0), (-100.0, 100.0)],
+            'source_strengths' : [10.0, 10.0],
+            })
+        fly_list = create_flies(50, 1)
+        batch = fly_models.VerySimpleFlyBatch(create_flies(50, 1))
+        t = 0.0
+        dt = 1.0
+        while t < 800.0:
+            for fly in fly_list:
+                fly.update(t, dt, wind_field, odor_field)
+            batch.update(t, dt, wind_field, odor_field)
+            t += dt
+
+        # Fly objects are only updated by write_state
+        self.assertTrue(all(fly.position == (0.0, 0.0) for fly in batch.fly_list))
+        batch.write_state()
+
+        mode_list = [fly.mode for fly in fly_list]
+        self.assertGreater(mode_list.count(fly_models.VerySimpleFly.Mode_Trapped), 0)
+        for fly, batch_fly in zip(fly_list, batch.fly_list):
+            self.assertEqual(fly.mode, batch_fly.mode)
+            self.assertEqual(fly.trap_num, batch_fly.trap_num)
+            self.assertTrue(scipy.allclose(fly.position, batch_fly.position, rtol=0.0, atol=1.0e-6))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+from __future__ import print_function
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from odor_tracking_sim import metrics
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+SmallSpec = {'swarm': {'size': 50}, 't_stop': 50.0, 'dt': 1.0}
+
+
+class TestMetricsRecorder(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_jsonl(self):
+        filename = os.path.join(self.directory, 'metrics.jsonl')
+        recorder = metrics.MetricsRecorder({'filename': filename, 'interval': 0.0})
+        scenario.run_scenario(SmallSpec, 1, metrics=recorder)
+        recorder.close()
+        with open(filename) as f:
+            sample_list = [json.loads(line) for line in f]
+        self.assertEqual(len(sample_list), 50)
+        self.assertEqual(sample_list[-1]['steps'], 50)
+        self.assertTrue(all(sample['steps_per_sec'] > 0 for sample in sample_list))
+        self.assertEqual(set(sample_list[-1]['phase_seconds']), set(['fields', 'modes', 'traps', 'move']))
+
+    def test_prometheus_final_sample(self):
+        # Final sample right after an interval sample mustn't report zero throughput
+        filename = os.path.join(self.directory, 'metrics.prom')
+        recorder = metrics.MetricsRecorder({'format': 'prometheus', 'filename': filename, 'interval': 0.0})
+        wind_field, odor_field, swarm = scenario.create_scenario(SmallSpec, 1)
+        swarm_models.run_swarm(swarm, wind_field, odor_field, 10.0, 1.0, metrics=recorder)
+        values = {}
+        with open(filename) as f:
+            for line in f:
+                name, value = line.split()
+                values[name] = float(value)
+        self.assertEqual(values['odor_tracking_sim_steps_total'], 10)
+        self.assertGreater(values['odor_tracking_sim_steps_per_second'], 0)
+        self.assertEqual(values['odor_tracking_sim_flies'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import odor_models
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+def create_odor_field(dtype):
+    random = scipy.random.RandomState(0)
+    wind_field = wind_models.ConstantWindField(param={'speed': 0.4, 'angle': 0.7})
+    return odor_models.FakeDiffusionOdorField({
+        'wind_field'       : wind_field,
+        'source_locations' : [tuple(loc) for loc in random.uniform(-300.0, 300.0, (7,2))],
+        'source_strengths' : list(random.uniform(1.0, 10.0, 7)),
+        'diffusion_coeff'  : 0.25,
+        'dtype'            : dtype,
+        })
+
+
+def run_skip_scenario(odor_skip, dtype):
+    spec = {
+            'wind'   : {'dtype': dtype},
+            'odor'   : {'dtype': dtype},
+            'swarm'  : {'size': 300, 'wind_slippage': 0.5, 'odor_skip': odor_skip, 'dtype': dtype},
+            't_stop' : 600.0,
+            'dt'     : 0.5,
+            }
+    wind_field, odor_field, swarm = scenario.create_scenario(spec, 1)
+    swarm_models.run_swarm(swarm, wind_field, odor_field, spec['t_stop'], spec['dt'])
+    return swarm
+
+
+class TestValue(unittest.TestCase):
+
+    def test_float32_value(self):
+        random = scipy.random.RandomState(1)
+        x = random.uniform(-500.0, 500.0, 5000)
+        y = random.uniform(-500.0, 500.0, 5000)
+        value_64 = create_odor_field(scipy.float64).value(0.0, x, y)
+        value_32 = create_odor_field(scipy.float32).value(0.0, x, y)
+        self.assertEqual(value_32.dtype, scipy.float32)
+        self.assertEqual(create_odor_field(scipy.float32).value(0.0, x.astype(scipy.float32), y).dtype, scipy.float32)
+        self.assertTrue(scipy.allclose(value_32, value_64, rtol=1.0e-4, atol=1.0e-30))
+
+    def test_array_matches_scalar(self):
+        odor_field = create_odor_field(scipy.float64)
+        x = scipy.array([-50.0, 0.0, 120.0, 400.0])
+        y = scipy.array([30.0, -10.0, 80.0, 250.0])
+        value = odor_field.value(0.0, x, y)
+        for i in range(x.shape[0]):
+            self.assertAlmostEqual(value[i], odor_field.value(0.0, x[i], y[i]), places=12)
+
+
+class TestFarField(unittest.TestCase):
+
+    def test_matches_direct_sum(self):
+        random = scipy.random.RandomState(2)
+        wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.2})
+        param = {
+                'wind_field'       : wind_field,
+                'source_locations' : [tuple(loc) for loc in random.uniform(-200.0, 200.0, (300,2))],
+                'source_strengths' : list(random.uniform(1.0, 10.0, 300)),
+                'diffusion_coeff'  : 0.25,
+                }
+        odor_field = odor_models.FakeDiffusionOdorField(param)
+        param['far_field'] = {'opening_ratio': 0.25, 'atol': 1.0e-6}
+        odor_field_far = odor_models.FakeDiffusionOdorField(param)
+        x = random.uniform(-500.0, 20000.0, 10000)
+        y = random.uniform(-1500.0, 1500.0, 10000)
+        value = odor_field.value(0.0, x, y)
+        value_far = odor_field_far.value(0.0, x, y)
+        self.assertEqual(value_far.dtype, scipy.float64)
+        self.assertGreater((value_far != value).sum(), 0)
+        mask = value > 1.0e-3
+        self.assertGreater(mask.sum(), 500)
+        self.assertLess((abs(value_far - value)[mask]/value[mask]).max(), 1.0e-2)
+        self.assertLess(abs(value_far - value).max(), 1.0e-3)
+
+        # The tree follows changes of the wind
+        wind_field.angle = 1.0
+        tree = odor_field_far.get_source_tree()
+        self.assertEqual(tree.key, (1.0, 0.5))
+        self.assertTrue(scipy.allclose(odor_field_far.value(0.0, x, y), odor_field.value(0.0, x, y), rtol=1.0e-2, atol=1.0e-3))
+
+    def test_error_decreases_with_opening_ratio(self):
+        random = scipy.random.RandomState(3)
+        param = {
+                'wind_field'       : wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.2}),
+                'source_locations' : [tuple(loc) for loc in random.uniform(-200.0, 200.0, (300,2))],
+                'source_strengths' : list(random.uniform(1.0, 10.0, 300)),
+                'diffusion_coeff'  : 0.25,
+                }
+        x = random.uniform(-500.0, 20000.0, 5000)
+        y = random.uniform(-1500.0, 1500.0, 5000)
+        value = odor_models.FakeDiffusionOdorField(param).value(0.0, x, y)
+        error_list = []
+        for opening_ratio in (1.0, 0.5, 0.25, 0.1):
+            param['far_field'] = {'opening_ratio': opening_ratio, 'atol': 1.0e-9}
+            value_far = odor_models.FakeDiffusionOdorField(param).value(0.0, x, y)
+            error_list.append(abs(value_far - value).max())
+        self.assertEqual(error_list, sorted(error_list, reverse=True))
+        self.assertGreater(error_list[0], 10.0*error_list[-1])
+
+
+class TestMaxValueBound(unittest.TestCase):
+
+    def test_bound_on_segments(self):
+        random = scipy.random.RandomState(1)
+        num = 1000
+        x0 = random.uniform(-500.0, 500.0, num)
+        y0 = random.uniform(-500.0, 500.0, num)
+        x1 = x0 + random.uniform(-200.0, 200.0, num)
+        y1 = y0 + random.uniform(-200.0, 200.0, num)
+        s = scipy.linspace(0.0, 1.0, 200)
+        x = (x0[:,None] + s*(x1 - x0)[:,None]).ravel()
+        y = (y0[:,None] + s*(y1 - y0)[:,None]).ravel()
+        for dtype, rtol in ((scipy.float64, 1.0e-12), (scipy.float32, 1.0e-4)):
+            odor_field = create_odor_field(dtype)
+            bound = odor_field.max_value_bound(x0, y0, x1, y1)
+            self.assertEqual(bound.dtype, dtype)
+            value = odor_field.value(0.0, x, y).reshape(num, -1).max(axis=1)
+            self.assertTrue((value <= bound*(1.0 + rtol)).all())
+            self.assertTrue((bound == 0.0).any())
+
+
+class TestOdorSkip(unittest.TestCase):
+
+    def test_skip_matches_full_evaluation(self):
+        for dtype in ('float64', 'float32'):
+            swarm_full = run_skip_scenario(False, dtype)
+            swarm_skip = run_skip_scenario(True, dtype)
+            self.assertEqual(swarm_skip.t_odor_skip.dtype, scipy.dtype(dtype))
+            self.assertEqual(swarm_skip.t_odor_predict.dtype, scipy.dtype(dtype))
+            self.assertGreater((swarm_full.mode != swarm_full.Mode_FixHeading).sum(), 0)
+            self.assertTrue((swarm_skip.t_odor_skip > 600.0).any())
+            for name in ('x_position', 'y_position', 'mode', 'trap_num'):
+                self.assertTrue((getattr(swarm_full, name) == getattr(swarm_skip, name)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import parallel
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+Spec = {'sources': {'radius': 150.0}, 'swarm': {'size': 500}, 't_stop': 400.0, 'dt': 0.5}
+
+
+class FailingOdorField(object):
+
+    def value(self, t, x, y):
+        raise ValueError('odor field failed')
+
+
+class TestSharedFieldEvaluator(unittest.TestCase):
+
+    def test_matches_serial(self):
+        for dtype in ('float64', 'float32'):
+            spec = dict(Spec)
+            spec['swarm'] = dict(Spec['swarm'], dtype=dtype)
+            wind_field, odor_field, swarm_serial = scenario.create_scenario(spec, 3)
+            swarm_models.run_swarm(swarm_serial, wind_field, odor_field, spec['t_stop'], spec['dt'])
+
+            wind_field, odor_field, swarm = scenario.create_scenario(spec, 3)
+            with parallel.SharedFieldEvaluator(swarm, wind_field, odor_field, {'num_workers': 2}) as evaluator:
+                self.assertTrue(evaluator.is_shared(swarm.x_position, swarm.y_position))
+                swarm_models.run_swarm(swarm, evaluator.wind_field, evaluator.odor_field, spec['t_stop'], spec['dt'])
+                self.assertTrue(evaluator.is_shared(swarm.x_position, swarm.y_position))
+                self.assertEqual(evaluator.odor.dtype, scipy.dtype(dtype))
+
+            self.assertGreater((swarm_serial.mode != swarm_serial.Mode_FixHeading).sum(), 0)
+            for name in ('x_position', 'y_position', 'mode', 'trap_num'):
+                self.assertTrue((getattr(swarm_serial, name) == getattr(swarm, name)).all())
+
+    def test_pass_through(self):
+        wind_field, odor_field, swarm = scenario.create_scenario(Spec, 3)
+        with parallel.SharedFieldEvaluator(swarm, wind_field, odor_field, {'num_workers': 2}) as evaluator:
+            x = scipy.array([0.0, 100.0])
+            y = scipy.array([0.0, -50.0])
+            self.assertTrue((evaluator.odor_field.value(0.0, x, y) == odor_field.value(0.0, x, y)).all())
+            self.assertEqual(evaluator.odor_field.param, odor_field.param)
+            self.assertEqual(evaluator.wind_field.uniform_value(0.0), wind_field.uniform_value(0.0))
+
+    def test_worker_error(self):
+        wind_field, odor_field, swarm = scenario.create_scenario(Spec, 3)
+        with parallel.SharedFieldEvaluator(swarm, wind_field, FailingOdorField(), {'num_workers': 2}) as evaluator:
+            with self.assertRaises(RuntimeError):
+                evaluator.odor_field.value(0.0, swarm.x_position, swarm.y_position)
+            # Workers keep running after an error
+            x_wind, y_wind = evaluator.wind_field.value(0.0, swarm.x_position, swarm.y_position)
+            self.assertTrue((x_wind == wind_field.value(0.0, swarm.x_position, swarm.y_position)[0]).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import raster
+from odor_tracking_sim import odor_models
+from odor_tracking_sim import wind_models
+
+
+def create_odor_field():
+    wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.3})
+    return odor_models.FakeDiffusionOdorField({
+        'wind_field'       : wind_field,
+        'source_locations' : [(0.0, 0.0), (40.0, -30.0)],
+        'source_strengths' : [10.0, 5.0],
+        'diffusion_coeff'  : 0.25,
+        })
+
+
+class TestTiledOdorRaster(unittest.TestCase):
+
+    def setUp(self):
+        self.odor_field = create_odor_field()
+        self.raster = raster.TiledOdorRaster(self.odor_field, {
+            'tile_size'        : 16,
+            'base_tile_extent' : 512.0,
+            'cache_size'       : 64,
+            'num_workers'      : 2,
+            })
+
+    def tearDown(self):
+        self.raster.close()
+
+    def test_render_matches_value(self):
+        image, extent = self.raster.render((-100.0, 300.0), (-150.0, 150.0), 100, 75)
+        ynum, xnum = image.shape
+        x_pixel = (extent[1] - extent[0])/xnum
+        y_pixel = (extent[3] - extent[2])/ynum
+        self.assertAlmostEqual(x_pixel, y_pixel)
+        self.assertLessEqual(x_pixel, 4.0)
+        self.assertTrue(extent[0] <= -100.0 and extent[1] >= 300.0)
+        self.assertTrue(extent[2] <= -150.0 and extent[3] >= 150.0)
+        x_values = extent[0] + x_pixel*(scipy.arange(xnum) + 0.5)
+        y_values = extent[2] + y_pixel*(scipy.arange(ynum) + 0.5)
+        x_mesh, y_mesh = scipy.meshgrid(x_values, y_values, indexing='xy')
+        value = self.odor_field.value(0.0, x_mesh.ravel(), y_mesh.ravel()).reshape(x_mesh.shape)
+        self.assertTrue(scipy.allclose(image, value, rtol=1.0e-12, atol=0.0))
+
+    def test_tiles_are_cached(self):
+        level = self.raster.choose_level((-100.0, 300.0), (-150.0, 150.0), 100, 75)
+        self.raster.render((-100.0, 300.0), (-150.0, 150.0), level=level)
+        num_computed = self.raster.num_computed
+        self.raster.render((0.0, 200.0), (-100.0, 100.0), level=level)
+        self.assertEqual(self.raster.num_computed, num_computed)
+
+    def test_parent_derived_from_children(self):
+        level = 4
+        self.raster.render((0.0, 64.0), (0.0, 64.0), level=level+1)
+        num_computed = self.raster.num_computed
+        image, extent = self.raster.render((0.0, 32.0), (0.0, 32.0), level=level)
+        self.assertEqual(self.raster.num_computed, num_computed)
+        self.assertEqual(self.raster.num_derived, 1)
+        fine, fine_extent = self.raster.render((0.0, 32.0), (0.0, 32.0), level=level+1)
+        n = image.shape[0]
+        self.assertTrue(scipy.allclose(image, fine.reshape(n, 2, n, 2).mean(axis=(1,3))))
+
+    def test_cache_size(self):
+        self.raster.render((-1000.0, 1000.0), (-1000.0, 1000.0), level=3)
+        self.assertLessEqual(len(self.raster.cache), self.raster.param['cache_size'])
+
+
+if __name__ == '__main__':
+    unittest.main()
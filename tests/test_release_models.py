@@ -0,0 +1,138 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+import scipy
+
+from odor_tracking_sim import release_models
+from odor_tracking_sim import swarm_models
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import odor_models
+from odor_tracking_sim import viewer
+from odor_tracking_sim import metrics
+
+
+def create_fields():
+    wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.0})
+    odor_field = odor_models.FakeDiffusionOdorField({
+        'wind_field'       : wind_field,
+        'source_locations' : [(300.0, 0.0), (-200.0, 200.0)],
+        'source_strengths' : [10.0, 10.0],
+        })
+    return wind_field, odor_field
+
+
+def create_swarm_param(size, seed):
+    # Detection always succeeds and the plume is never lost, with no heading
+    # error, so the run doesn't depend on the random number generator.
+    random = scipy.random.RandomState(seed)
+    return {
+            'initial_heading'    : random.uniform(0.0, 2.0*scipy.pi, (size,)),
+            'x_start_position'   : scipy.zeros((size,)),
+            'y_start_position'   : scipy.zeros((size,)),
+            'flight_speed'       : scipy.full((size,), 1.0),
+            'release_time'       : random.uniform(0.0, 200.0, (size,)),
+            'heading_error_std'  : 0.0,
+            'odor_probabilities' : {'lower': 0.0, 'upper': 1.0},
+            }
+
+
+class TestFlySources(unittest.TestCase):
+
+    def test_array_source_unsorted(self):
+        release_time = scipy.array([5.0, 1.0, 3.0, 2.0, 4.0])
+        source = release_models.ArrayFlySource({'release_time': release_time}, {'chunk_size': 2})
+        batch = source.take(3.5)
+        self.assertEqual(sorted(batch['fly_id']), [1, 2, 3])
+        self.assertTrue((batch['release_time'] == release_time[batch['fly_id']]).all())
+        self.assertIsNone(source.take(3.5))
+        self.assertEqual(source.num_remaining, 2)
+
+    def test_generator_source(self):
+        batches = ({'release_time': scipy.arange(i, i + 3.0)} for i in range(0, 9, 3))
+        source = release_models.GeneratorFlySource(batches)
+        self.assertEqual(list(source.take(4.5)['fly_id']), [0, 1, 2, 3, 4])
+        self.assertEqual(list(source.take(100.0)['fly_id']), [5, 6, 7, 8])
+        self.assertIsNone(source.take(200.0))
+
+    def test_load_fly_source(self):
+        directory = tempfile.mkdtemp()
+        try:
+            scipy.save(os.path.join(directory, 'release_time.npy'), scipy.arange(4.0))
+            scipy.save(os.path.join(directory, 'flight_speed.npy'), scipy.full((4,), 2.0))
+            source = release_models.load_fly_source(directory)
+            batch = source.take(10.0)
+            self.assertTrue((batch['flight_speed'] == 2.0).all())
+            self.assertEqual(list(batch['fly_id']), [0, 1, 2, 3])
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestStagedSwarm(unittest.TestCase):
+
+    def run_swarm(self, swarm, callback=None):
+        wind_field, odor_field = create_fields()
+        swarm_models.run_swarm(swarm, wind_field, odor_field, 1500.0, 0.5, callback=callback)
+        return swarm
+
+    def test_staged_matches_eager(self):
+        # The swarm updates the start position arrays in place, so each swarm gets new params
+        eager = self.run_swarm(swarm_models.BasicSwarmOfFlies(create_swarm_param(200, 1)))
+        staged_param = create_swarm_param(200, 1)
+        staged_param.update({'release_batch_interval': 20.0, 'compact_fraction': 0.01})
+        staged = self.run_swarm(swarm_models.StagedSwarmOfFlies(staged_param))
+        self.assertGreater(staged.num_records, 0)
+        self.assertGreater((eager.mode == eager.Mode_Trapped).sum(), 0)
+        for name in ('mode', 'trap_num', 't_in_trap', 'x_position', 'y_position'):
+            self.assertTrue((staged.get_fly_values(name) == eager.get_fly_values(name)).all(), name)
+
+    def test_viewer_follows_staged_size(self):
+        param = create_swarm_param(200, 2)
+        param.update({'release_batch_interval': 20.0, 'compact_fraction': 0.01})
+        live_viewer = viewer.LiveViewer({'max_points': 20, 'dt_publish': 0.0})
+        sizes = set()
+        def callback(t, swarm):
+            live_viewer.publish(t, swarm)
+            snapshot = live_viewer.buffer.read_latest()
+            self.assertEqual(snapshot['x'].shape[0], min(swarm.size, 20))
+            self.assertEqual(live_viewer.decimate_index.max(initial=-1), swarm.size - 1)
+            sizes.add(swarm.size)
+        self.run_swarm(swarm_models.StagedSwarmOfFlies(param), callback)
+        self.assertGreater(len(sizes), 2)
+
+    def test_counts_include_compacted(self):
+        # Metrics and viewer counts of a staged swarm match those of an eager swarm
+        mode_count_list = []
+        def callback_eager(t, swarm):
+            mode_count_list.append(swarm.get_mode_count(t))
+        self.run_swarm(swarm_models.BasicSwarmOfFlies(create_swarm_param(200, 1)), callback_eager)
+
+        param = create_swarm_param(200, 1)
+        param.update({'release_batch_interval': 20.0, 'compact_fraction': 0.01})
+        live_viewer = viewer.LiveViewer({'max_points': 20, 'dt_publish': 0.0})
+        recorder = metrics.MetricsRecorder({'format': 'prometheus', 'filename': os.devnull})
+        step = [0]
+        def callback(t, swarm):
+            mode_count = mode_count_list[step[0]]
+            step[0] += 1
+            live_viewer.publish(t, swarm)
+            snapshot = live_viewer.buffer.read_latest()
+            # Flies released since the last batch are materialized by the next step
+            self.assertEqual(snapshot['mode_count'][1:].tolist(), mode_count[1:].tolist())
+            self.assertEqual(snapshot['released'], snapshot['mode_count'].sum())
+            self.assertLessEqual(snapshot['released'], mode_count.sum())
+            sample = recorder.get_sample(t, swarm)
+            self.assertEqual(sample['num_released'], snapshot['released'])
+            self.assertEqual(sample['num_trapped'], mode_count[swarm.Mode_Trapped])
+            self.assertEqual(sample['num_flies'], swarm.num_records + swarm.size)
+        staged = self.run_swarm(swarm_models.StagedSwarmOfFlies(param), callback)
+        self.assertEqual(step[0], len(mode_count_list))
+        self.assertGreater(staged.num_records, 0)
+        self.assertGreater(mode_count_list[-1][staged.Mode_Trapped], 0)
+        self.assertEqual(staged.get_mode_count(1500.0).tolist(), mode_count_list[-1].tolist())
+        self.assertEqual(recorder.get_sample(1500.0, staged)['num_flies'], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
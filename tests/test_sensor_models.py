@@ -0,0 +1,69 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import sensor_models
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+class TestOdorSensor(unittest.TestCase):
+
+    def test_matches_reference(self):
+        # Step by step reference computed per fly from the full odor history
+        dt = 0.5
+        param = {'ema_time_constant': 4.0, 'hit_threshold': 1.0, 'whiff_time_constant': 20.0}
+        random = scipy.random.RandomState(0)
+        odor = random.uniform(0.0, 2.0, (200, 3))
+        mask = scipy.array([True, True, False])
+        sensor = sensor_models.OdorSensor(3, param)
+        for step in range(odor.shape[0]):
+            sensor.update(dt, odor[step], mask)
+
+        alpha = 1.0 - scipy.exp(-dt/param['ema_time_constant'])
+        decay = scipy.exp(-dt/param['whiff_time_constant'])
+        for i in range(2):
+            ema = 0.0
+            whiff_rate = 0.0
+            time_since_hit = scipy.inf
+            is_hit = False
+            for value in odor[:,i]:
+                hit = value >= param['hit_threshold']
+                ema += alpha*(value - ema)
+                whiff_rate = whiff_rate*decay + (hit and not is_hit)/param['whiff_time_constant']
+                time_since_hit = 0.0 if hit else time_since_hit + dt
+                is_hit = hit
+            self.assertAlmostEqual(sensor.ema[i], ema, places=12)
+            self.assertAlmostEqual(sensor.whiff_rate[i], whiff_rate, places=12)
+            self.assertEqual(sensor.time_since_hit[i], time_since_hit)
+            self.assertEqual(sensor.time_in_plume[i], dt*(odor[:,i] >= param['hit_threshold']).sum())
+
+        # Masked flies are left as is
+        self.assertEqual(sensor.ema[2], 0.0)
+        self.assertEqual(sensor.time_since_hit[2], scipy.inf)
+        self.assertEqual(sensor.time_in_plume[2], 0.0)
+
+    def test_signals(self):
+        sensor = sensor_models.OdorSensor(2, {'detection_input': 'ema', 'loss_input': 'whiff_rate', 'loss_delay': 1.0})
+        odor = scipy.array([0.01, 0.0])
+        sensor.update(0.5, odor, scipy.array([True, True]))
+        self.assertTrue(sensor.detection_value(odor) is sensor.ema)
+        self.assertTrue(sensor.loss_value(odor) is sensor.whiff_rate)
+        self.assertEqual(sensor.loss_allowed().tolist(), [False, True])
+        with self.assertRaises(ValueError):
+            sensor_models.OdorSensor(2, {'detection_input': 'unknown'})
+
+    def test_odor_input_matches_no_sensor(self):
+        swarm_list = []
+        for odor_sensor in (None, {}):
+            spec = {'swarm': {'size': 300, 'odor_sensor': odor_sensor}, 't_stop': 600.0, 'dt': 0.5}
+            wind_field, odor_field, swarm = scenario.create_scenario(spec, 1)
+            swarm_models.run_swarm(swarm, wind_field, odor_field, spec['t_stop'], spec['dt'])
+            swarm_list.append(swarm)
+        self.assertGreater(swarm_list[1].odor_sensor.time_in_plume.sum(), 0.0)
+        for name in ('x_position', 'y_position', 'mode'):
+            self.assertTrue((getattr(swarm_list[0], name) == getattr(swarm_list[1], name)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
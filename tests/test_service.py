@@ -0,0 +1,85 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import unittest
+
+from odor_tracking_sim import service
+
+
+SmallSpec = {'swarm': {'size': 20}, 't_stop': 20.0, 'dt': 1.0}
+FailingSpec = {'sources': {'type': 'unknown'}}
+
+
+class TestSimulationService(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.service = service.SimulationService({
+            'port'              : 0,
+            'num_processes'     : 1,
+            'cache_directory'   : self.directory,
+            'max_finished_jobs' : 2,
+            })
+        self.service.start()
+        host, port = self.service.address
+        self.client = service.SimulationClient(host, port, timeout=60.0)
+
+    def tearDown(self):
+        self.service.shutdown()
+        shutil.rmtree(self.directory)
+
+    def wait(self, job_id):
+        events = list(self.client.events(job_id))
+        return events[-1]['event']
+
+    def test_run_and_cache(self):
+        job = self.client.submit(SmallSpec, 1)
+        self.assertEqual(self.wait(job['id']), 'done')
+        status = self.client.status(job['id'])
+        self.assertEqual(status['summary']['size'], 20)
+        self.assertFalse(status['summary']['cached'])
+        self.assertEqual(self.client.submit(SmallSpec, 1)['status'], 'done')
+
+    def test_failed_job_is_rerun(self):
+        job = self.client.submit(FailingSpec, 1)
+        self.assertEqual(self.wait(job['id']), 'failed')
+        failed_job = self.service.get_job(job['id'])
+        self.client.submit(FailingSpec, 1)
+        self.assertIsNot(self.service.get_job(job['id']), failed_job)
+        self.assertEqual(self.wait(job['id']), 'failed')
+
+    def test_finished_jobs_evicted(self):
+        job_ids = []
+        for seed in range(3):
+            job = self.client.submit(FailingSpec, seed)
+            self.wait(job['id'])
+            job_ids.append(job['id'])
+        self.assertIsNone(self.service.get_job(job_ids[0]))
+        self.assertIsNotNone(self.service.get_job(job_ids[2]))
+        self.assertEqual(len(self.service.jobs), 2)
+
+    def test_corrupt_cache_is_rerun(self):
+        job_id = service.scenario_key(SmallSpec, 1)
+        with open(self.service.result_filename(job_id), 'wb') as f:
+            f.write(b'PK\x03\x04 truncated')
+        job = self.client.submit(SmallSpec, 1)
+        self.assertEqual(job['id'], job_id)
+        self.assertEqual(self.wait(job_id), 'done')
+        self.assertFalse(self.client.status(job_id)['summary']['cached'])
+        self.assertEqual(self.client.submit(SmallSpec, 1)['status'], 'done')
+
+
+class TestJob(unittest.TestCase):
+
+    def test_no_events_after_finish(self):
+        job = service.Job('id', {}, 0)
+        job.add_event({'event': 'progress'})
+        job.finish({})
+        job.add_event({'event': 'progress'})
+        self.assertEqual([event['event'] for event in job.events], ['progress', 'done'])
+        self.assertEqual([event['event'] for event in job.iter_events()], ['progress', 'done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import swarm_models
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import odor_models
+
+
+def create_fields(dtype):
+    wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.4, 'dtype': dtype})
+    odor_field = odor_models.FakeDiffusionOdorField({
+        'wind_field'       : wind_field,
+        'source_locations' : [(300.0, 0.0), (-200.0, 250.0)],
+        'source_strengths' : [10.0, 10.0],
+        'diffusion_coeff'  : 0.25,
+        'trap_radius'      : 30.0,
+        'dtype'            : dtype,
+        })
+    return wind_field, odor_field
+
+
+def create_swarm(dtype, size=200, **param):
+    random = scipy.random.RandomState(2)
+    swarm_param = {
+            'initial_heading'   : random.uniform(0.0, 2.0*scipy.pi, (size,)),
+            'x_start_position'  : scipy.zeros((size,)),
+            'y_start_position'  : scipy.zeros((size,)),
+            'flight_speed'      : scipy.full((size,), 0.7),
+            'release_time'      : random.uniform(0.0, 100.0, (size,)),
+            'heading_error_std' : 0.0,
+            'wind_slippage'     : 0.1,
+            'dtype'             : dtype,
+            }
+    swarm_param.update(param)
+    return swarm_models.BasicSwarmOfFlies(swarm_param)
+
+
+class TestSwarmDtype(unittest.TestCase):
+
+    def test_float32_state(self):
+        wind_field, odor_field = create_fields(scipy.float32)
+        scipy.random.seed(0)
+        swarm = create_swarm(scipy.float32)
+        swarm_models.run_swarm(swarm, wind_field, odor_field, 500.0, 1.0)
+        for name in swarm.PerFlyState:
+            value = getattr(swarm, name)
+            if value is not None and value.dtype.kind == 'f':
+                self.assertEqual(value.dtype, scipy.float32, name)
+        self.assertEqual(odor_field.value(0.0, swarm.x_position, swarm.y_position).dtype, scipy.float32)
+        self.assertEqual(wind_field.value(0.0, swarm.x_position, swarm.y_position)[0].dtype, scipy.float32)
+
+    def test_float32_close_to_float64(self):
+        # Without odor detection or traps flies fly straight, so positions
+        # only differ by rounding - which compensated summation keeps small.
+        position = {}
+        for dtype, compensation in ((scipy.float64, False), (scipy.float32, False), (scipy.float32, True)):
+            wind_field, odor_field = create_fields(dtype)
+            odor_field.param['source_locations'] = [(1.0e6, 1.0e6)]
+            odor_field.param['source_strengths'] = [0.0]
+            scipy.random.seed(0)
+            swarm = create_swarm(dtype, position_compensation=compensation)
+            swarm_models.run_swarm(swarm, wind_field, odor_field, 2000.0, 0.25)
+            position[(dtype, compensation)] = scipy.array([swarm.x_position, swarm.y_position])
+        position_64 = position[(scipy.float64, False)]
+        error = abs(position[(scipy.float32, True)] - position_64).max()
+        error_uncompensated = abs(position[(scipy.float32, False)] - position_64).max()
+        self.assertGreater(abs(position_64).max(), 1000.0)
+        self.assertLess(error, 1.0e-3)
+        self.assertLess(error, error_uncompensated)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import utility
+
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        random = scipy.random.RandomState(0)
+        self.x = random.uniform(-1000.0, 1000.0, (1000,))
+        self.y = random.uniform(-1000.0, 1000.0, (1000,))
+        self.points = [(10.0, -20.0), (300.0, 400.0), (-50.0, 0.0)]
+        self.angle = scipy.radians(25.0)
+
+    def test_rotate_vecs_out(self):
+        for dtype in (scipy.float64, scipy.float32):
+            x = self.x.astype(dtype)
+            y = self.y.astype(dtype)
+            xrot, yrot = utility.rotate_vecs(x, y, self.angle)
+            for num_buffers in (2, 3):
+                buffers = tuple(scipy.empty(x.shape, dtype=dtype) for i in range(num_buffers))
+                xrot_out, yrot_out = utility.rotate_vecs(x, y, self.angle, out=buffers)
+                self.assertIs(xrot_out, buffers[0])
+                self.assertEqual(xrot_out.dtype, dtype)
+                self.assertTrue((xrot_out == xrot).all() and (yrot_out == yrot).all())
+
+    def test_shift_and_rotate_out(self):
+        for dtype in (scipy.float64, scipy.float32):
+            x = self.x.astype(dtype)
+            y = self.y.astype(dtype)
+            shift = self.points[1]
+            xx, yy = utility.shift_and_rotate((x,y), shift, self.angle)
+            for num_buffers in (2, 4):
+                buffers = tuple(scipy.empty(x.shape, dtype=dtype) for i in range(num_buffers))
+                xx_out, yy_out = utility.shift_and_rotate((x,y), shift, self.angle, out=buffers)
+                self.assertEqual(xx_out.dtype, dtype)
+                self.assertTrue((xx_out == xx).all() and (yy_out == yy).all())
+
+    def test_distance_out(self):
+        for dtype in (scipy.float64, scipy.float32):
+            x = self.x.astype(dtype)
+            y = self.y.astype(dtype)
+            point = self.points[1]
+            dist = utility.distance((x,y), point)
+            self.assertEqual(dist.dtype, dtype)
+            out = scipy.empty(x.shape, dtype=dtype)
+            self.assertTrue((utility.distance((x,y), point, out=out) == dist).all())
+            work = scipy.empty(x.shape, dtype=dtype)
+            self.assertTrue((utility.distance((x,y), point, out=(out, work)) == dist).all())
+
+    def test_cos_sin_cache(self):
+        cos_angle, sin_angle = utility.cos_sin(self.angle, scipy.float32)
+        self.assertEqual(type(cos_angle), scipy.float32)
+        self.assertEqual(cos_angle, scipy.float32(scipy.cos(self.angle)))
+        self.assertEqual(utility.cos_sin(self.angle), (scipy.cos(self.angle), scipy.sin(self.angle)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import validation
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+
+
+Spec = {
+        'sources' : {'radius': 150.0},
+        'swarm'   : {'size': 200, 'release_time_mean': 0.0},
+        }
+
+SwarmSize = 200
+
+
+def create_swarm_param():
+    return {
+            'initial_heading'  : scipy.random.uniform(0.0, 2.0*scipy.pi, (SwarmSize,)),
+            'x_start_position' : scipy.zeros((SwarmSize,)),
+            'y_start_position' : scipy.zeros((SwarmSize,)),
+            'flight_speed'     : scipy.full((SwarmSize,), 0.7),
+            'release_time'     : scipy.zeros((SwarmSize,)),
+            'heading_error_std': scipy.radians(10.0),
+            }
+
+
+def create_backend(swarm_class=swarm_models.BasicSwarmOfFlies, param={}):
+    wind_field, odor_field, swarm = scenario.create_scenario(Spec, 0)
+    return validation.SwarmBackend(create_swarm_param, wind_field, odor_field, 600.0, 1.0, swarm_class, param)
+
+
+class TestEquivalenceTest(unittest.TestCase):
+
+    def test_identical_backends_pass(self):
+        test = validation.EquivalenceTest(create_backend(), create_backend(), {'seeds': range(5), 'num_traps': 6})
+        result = test.run()
+        self.assertTrue(result['passed'])
+        self.assertTrue((result['reference_counts'] == result['candidate_counts']).all())
+        self.assertGreater(result['reference_counts'].sum(), 0)
+        self.assertIn('PASS', test.report())
+
+    def test_staged_backend_passes(self):
+        candidate = create_backend(swarm_models.StagedSwarmOfFlies)
+        test = validation.EquivalenceTest(create_backend(), candidate, {'seeds': range(5), 'num_traps': 6})
+        self.assertTrue(test.run()['passed'])
+
+    def test_different_backend_fails(self):
+        candidate = create_backend(param={'flight_speed': scipy.full((SwarmSize,), 0.35)})
+        test = validation.EquivalenceTest(create_backend(), candidate, {'seeds': range(5), 'num_traps': 6})
+        result = test.run()
+        self.assertFalse(result['passed'])
+        self.assertIn('FAIL', test.report())
+
+    def test_trap_counts(self):
+        trap_num_list = [scipy.array([-1, 0, 2, 2]), scipy.array([1, -1, -1, 1])]
+        counts = validation.get_trap_counts(trap_num_list, 3)
+        self.assertEqual(counts.tolist(), [[1, 0, 2], [0, 2, 0]])
+        t_in_trap_list = [scipy.array([scipy.inf, 1.0, 2.0, 3.0]), scipy.array([4.0, scipy.inf, scipy.inf, 5.0])]
+        times = validation.get_arrival_times(trap_num_list, t_in_trap_list, 2)
+        self.assertEqual(times.tolist(), [2.0, 3.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import viewer
+from odor_tracking_sim import swarm_models
+
+
+def write_snapshot(buffer, t, num):
+    x = scipy.arange(num, dtype=float)
+    y = -x
+    mode = scipy.zeros((num,), dtype=int)
+    mode_count = scipy.array([num, 0, 0, 0, 0])
+    buffer.write(t, x, y, mode, num, mode_count)
+
+
+class TestSnapshotBuffer(unittest.TestCase):
+
+    def test_read_latest(self):
+        buffer = viewer.SnapshotBuffer(10, num_slots=3)
+        self.assertIsNone(buffer.read_latest())
+        for i in range(5):
+            write_snapshot(buffer, float(i), i + 1)
+        snapshot = buffer.read_latest()
+        self.assertEqual(snapshot['seq'], 5)
+        self.assertEqual(snapshot['t'], 4.0)
+        self.assertTrue((snapshot['x'] == scipy.arange(5)).all())
+        self.assertTrue((snapshot['y'] == -scipy.arange(5)).all())
+        self.assertEqual(snapshot['mode_count'].tolist(), [5, 0, 0, 0, 0])
+        self.assertIsNone(buffer.read_latest(snapshot['seq']))
+
+    def test_truncate_to_max_points(self):
+        buffer = viewer.SnapshotBuffer(10)
+        write_snapshot(buffer, 0.0, 25)
+        snapshot = buffer.read_latest()
+        self.assertEqual(snapshot['x'].shape, (10,))
+        self.assertEqual(snapshot['released'], 25)
+
+    def test_drop_slot_being_written(self):
+        buffer = viewer.SnapshotBuffer(10)
+        write_snapshot(buffer, 0.0, 5)
+        # The writer invalidates the slot's sequence number while writing it
+        slot = int(buffer.head[0]) % buffer.num_slots
+        buffer.info[slot, buffer.Info_Seq] = -1
+        self.assertIsNone(buffer.read_latest())
+
+
+class TestLiveViewer(unittest.TestCase):
+
+    def test_publish_interval(self):
+        swarm = swarm_models.BasicSwarmOfFlies({'release_time': scipy.linspace(0.0, 100.0, 50)})
+        live_viewer = viewer.LiveViewer({'max_points': 20, 'dt_publish': 10.0})
+        published = [live_viewer.publish(t, swarm) for t in scipy.arange(0.0, 30.0, 1.0)]
+        self.assertEqual(sum(published), 3)
+        snapshot = live_viewer.buffer.read_latest()
+        self.assertEqual(snapshot['x'].shape, (20,))
+        self.assertEqual(snapshot['t'], 20.0)
+        self.assertEqual(snapshot['released'], (20.0 > swarm.param['release_time']).sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
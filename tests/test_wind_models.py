@@ -0,0 +1,69 @@
+from __future__ import print_function
+import unittest
+import scipy
+
+from odor_tracking_sim import wind_models
+from odor_tracking_sim import scenario
+from odor_tracking_sim import swarm_models
+from odor_tracking_sim import utility
+
+
+class ArrayWindField(object):
+    """
+    Non-uniform view of a wind field - forces the swarm's per-fly wind path.
+    """
+
+    is_uniform = False
+
+    def __init__(self, wind_field):
+        self.wind_field = wind_field
+
+    def value(self, t, x, y):
+        return self.wind_field.value(t, x, y)
+
+
+class TestConstantWindField(unittest.TestCase):
+
+    def test_uniform_matches_value(self):
+        x = scipy.linspace(-100.0, 100.0, 7)
+        for dtype in (scipy.float64, scipy.float32):
+            wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.3, 'dtype': dtype})
+            x_wind, y_wind = wind_field.value(0.0, x.astype(dtype), x.astype(dtype))
+            vx, vy = wind_field.uniform_value(0.0)
+            self.assertEqual(x_wind.dtype, dtype)
+            self.assertEqual(type(vx), dtype)
+            self.assertTrue((x_wind == vx).all() and (y_wind == vy).all())
+            x_unit, y_unit = utility.unit_vector(x_wind, y_wind)
+            ux, uy = wind_field.uniform_unit_vector(0.0)
+            self.assertTrue((x_unit == ux).all() and (y_unit == uy).all())
+
+    def test_uniform_cache(self):
+        wind_field = wind_models.ConstantWindField(param={'speed': 0.5, 'angle': 0.0})
+        self.assertEqual(wind_field.uniform_value(0.0), (0.5, 0.0))
+        wind_field.angle = 0.5*scipy.pi
+        vx, vy = wind_field.uniform_value(0.0)
+        self.assertAlmostEqual(vx, 0.0)
+        self.assertAlmostEqual(vy, 0.5)
+
+    def test_swarm_uniform_matches_array_path(self):
+        for dtype, compensation in (('float64', False), ('float32', False), ('float32', True)):
+            spec = {
+                    'sources' : {'radius': 150.0},
+                    'wind'    : {'dtype': dtype},
+                    'odor'    : {'dtype': dtype},
+                    'swarm'   : {'size': 300, 'wind_slippage': 0.3, 'dtype': dtype, 'position_compensation': compensation},
+                    }
+            swarm_list = []
+            for uniform in (True, False):
+                wind_field, odor_field, swarm = scenario.create_scenario(spec, 4)
+                if not uniform:
+                    wind_field = ArrayWindField(wind_field)
+                swarm_models.run_swarm(swarm, wind_field, odor_field, 400.0, 0.5)
+                swarm_list.append(swarm)
+            self.assertGreater((swarm_list[0].mode != swarm_list[0].Mode_FixHeading).sum(), 0)
+            for name in ('x_position', 'y_position', 'mode', 'trap_num'):
+                self.assertTrue((getattr(swarm_list[0], name) == getattr(swarm_list[1], name)).all())
+
+
+if __name__ == '__main__':
+    unittest.main()